@@ -4,6 +4,8 @@ import psutil
 import time
 import requests
 import base64
+import json
+import threading
 from io import BytesIO
 from PIL import ImageGrab
 import os
@@ -12,6 +14,9 @@ from win10toast import ToastNotifier
 
 API_URL = "http://localhost:5000"
 SCREENSHOT_INTERVAL = 15  # seconds (configurable via API)
+# Push channel: a stream silent for this long (server heartbeats every 15s) is treated as dead
+EVENTS_READ_TIMEOUT = 45
+EVENTS_MAX_BACKOFF = 30  # seconds between reconnect attempts, at most
 
 # Default whitelisted apps (commonly safe applications)
 DEFAULT_WHITELIST = [
@@ -39,6 +44,13 @@ class DesktopMonitor:
         self.whitelist_cache = set(DEFAULT_WHITELIST)
         self.blacklist_cache = set()
         self.last_cache_update = 0
+        self.lists_version = None  # Server's change-log version of the lists we hold
+        self.lists_lock = threading.Lock()
+        self.config = {
+            'desktop_monitoring_enabled': True,
+            'screenshot_interval': SCREENSHOT_INTERVAL
+        }
+        self.channel_connected = False  # While connected, config and lists are pushed, not polled
         
     def get_active_window(self):
         try:
@@ -84,31 +96,110 @@ class DesktopMonitor:
         return process_name.lower() in self.browser_processes
 
     def update_whitelist_blacklist_cache(self):
-        """Update local cache of whitelisted and blacklisted apps from API"""
+        """Poll config and list changes every 30 seconds (only while the push channel is down)"""
+        current_time = time.time()
+        if current_time - self.last_cache_update < 30:
+            return
+        self.config = self.get_config_from_api()
+        self.fetch_list_changes()
+        self.last_cache_update = current_time
+
+    def fetch_list_changes(self):
+        """Bring the local whitelist/blacklist cache up to date with the changes made on the server"""
         try:
-            # Update cache every 30 seconds
-            current_time = time.time()
-            if current_time - self.last_cache_update < 30:
-                return
-
-            # Fetch whitelist
-            response = requests.get(f"{API_URL}/desktop/whitelist", timeout=5)
-            if response.status_code == 200:
-                whitelist_data = response.json()
-                self.whitelist_cache = set(DEFAULT_WHITELIST)  # Start with defaults
-                for item in whitelist_data:
-                    self.whitelist_cache.add(item['app'].lower())
-
-            # Fetch blacklist
-            response = requests.get(f"{API_URL}/desktop/blacklist", timeout=5)
+            params = {'since': self.lists_version} if self.lists_version else {}
+            response = requests.get(f"{API_URL}/desktop/lists", params=params, timeout=5)
             if response.status_code == 200:
-                blacklist_data = response.json()
-                self.blacklist_cache = set(item['app'].lower() for item in blacklist_data)
-
-            self.last_cache_update = current_time
+                self.apply_list_changes(response.json())
         except Exception as e:
             print(f"Error updating whitelist/blacklist cache: {e}")
 
+    def apply_list_changes(self, changes):
+        """
+        Apply a /desktop/lists response: a full snapshot replaces the sets, a delta edits them.
+        Returns the apps newly blacklisted by it.
+        """
+        whitelist = changes['whitelist']
+        blacklist = changes['blacklist']
+        with self.lists_lock:
+            previous_blacklist = self.blacklist_cache
+            if changes.get('full'):
+                self.whitelist_cache = set(DEFAULT_WHITELIST)  # Start with defaults
+                self.blacklist_cache = set()
+            else:
+                self.blacklist_cache = set(previous_blacklist)
+            for app in whitelist['removed']:
+                if app not in DEFAULT_WHITELIST:
+                    self.whitelist_cache.discard(app)
+            for app in blacklist['removed']:
+                self.blacklist_cache.discard(app)
+            self.whitelist_cache.update(app.lower() for app in whitelist['added'])
+            self.blacklist_cache.update(app.lower() for app in blacklist['added'])
+            self.lists_version = changes['version']
+            return self.blacklist_cache - previous_blacklist
+
+    # ==================== PUSH CHANNEL ====================
+
+    def listen_for_updates(self):
+        """Hold the server's /desktop/events stream open, reconnecting with backoff when it drops"""
+        backoff = 1
+        while self.running:
+            try:
+                params = {'since': self.lists_version} if self.lists_version else {}
+                with requests.get(f"{API_URL}/desktop/events", params=params, stream=True,
+                                  timeout=(5, EVENTS_READ_TIMEOUT)) as response:
+                    response.raise_for_status()
+                    self.channel_connected = True
+                    backoff = 1
+                    print(" Connected to server push channel")
+                    self.read_events(response)
+            except Exception as e:
+                if self.channel_connected:
+                    print(f" Push channel lost ({e}), falling back to polling")
+            self.channel_connected = False
+            self.last_cache_update = 0  # Poll once right away, in case something was missed
+            time.sleep(backoff)
+            backoff = min(backoff * 2, EVENTS_MAX_BACKOFF)
+
+    def read_events(self, response):
+        """Dispatch Server-Sent Events until the stream ends"""
+        event, data = None, []
+        for line in response.iter_lines(decode_unicode=True):
+            if not self.running:
+                return
+            if not line:
+                if event and data:
+                    self.handle_event(event, json.loads("\n".join(data)))
+                event, data = None, []
+            elif line.startswith('event:'):
+                event = line[6:].strip()
+            elif line.startswith('data:'):
+                data.append(line[5:].strip())
+            # Lines starting with ':' are heartbeats; they only keep the read timeout from firing
+
+    def handle_event(self, event, data):
+        if event == 'config':
+            self.config = data
+        elif event == 'lists':
+            if data['version'] == self.lists_version:
+                return
+            # The first snapshot only tells us the lists; it is not a block of apps already running
+            initial = self.lists_version is None
+            if data.get('full') or data.get('since') == self.lists_version:
+                newly_blocked = self.apply_list_changes(data)
+            else:
+                # Computed against a version we never held: ask for our own delta instead
+                with self.lists_lock:
+                    previous_blacklist = set(self.blacklist_cache)
+                self.fetch_list_changes()
+                newly_blocked = self.blacklist_cache - previous_blacklist
+            if initial:
+                return
+            for app in newly_blocked:
+                self.terminate_app_by_name(app)
+        elif event == 'command' and data.get('action') == 'terminate':
+            self.terminate_app_by_name(data['app'])
+
     def is_whitelisted(self, process_name):
         """Check if app is in whitelist"""
         return process_name.lower() in self.whitelist_cache
@@ -170,6 +261,26 @@ class DesktopMonitor:
             print(f" Error terminating process: {e}")
             return False
     
+    def terminate_app_by_name(self, app_name):
+        """Terminate every running process of an app (a block or command pushed by the server)"""
+        if not self.config.get('desktop_monitoring_enabled', True):
+            return  # Paused by the parent: nothing is enforced, as in the monitoring loop
+        if self.is_browser(app_name):
+            return  # Browsers are left to the extension, as in the monitoring loop
+        if self.is_whitelisted(app_name):
+            print(f" {app_name} is whitelisted - not terminating")
+            return  # Includes the protected system apps the server whitelists
+        terminated = False
+        for process in psutil.process_iter(['pid', 'name']):
+            if (process.info['name'] or '').lower() == app_name.lower():
+                print(f" {app_name} was blocked by the server - terminating")
+                terminated = self.terminate_app(process.info['pid']) or terminated
+        if terminated:
+            self.show_notification(
+                "Parental Control Alert",
+                "You might have violated the parental guidelines. Please wait for parental approval."
+            )
+
     def get_config_from_api(self):
         """Fetch monitoring configuration from API"""
         try:
@@ -190,11 +301,10 @@ class DesktopMonitor:
 
         while self.running:
             try:
-                # Update whitelist/blacklist cache periodically
-                self.update_whitelist_blacklist_cache()
-
-                # Get config periodically
-                config = self.get_config_from_api()
+                # Config and lists are pushed by the server; poll only while the channel is down
+                if not self.channel_connected:
+                    self.update_whitelist_blacklist_cache()
+                config = self.config
 
                 if not config.get('desktop_monitoring_enabled', True):
                     print("Desktop monitoring disabled, waiting...")
@@ -290,7 +400,8 @@ class DesktopMonitor:
         except:
             print("  Warning: Cannot connect to monitoring service")
             print("   Make sure the Flask server is running on port 5000\n")
-        
+
+        threading.Thread(target=self.listen_for_updates, daemon=True).start()
         self.monitor()
 
 
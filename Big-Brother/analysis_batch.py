@@ -0,0 +1,117 @@
+"""
+Analysis Batch - Low-priority prefetch of verdicts for many links at once
+Responsibilities:
+1. Admit prefetch work only while interactive /analyze traffic leaves room for it
+2. Bound how many prefetch analyses run at once, across all batches
+3. Stream per-link results as NDJSON, from the LLM runtime loop to a Flask or ASGI response
+"""
+
+import asyncio
+import contextlib
+import json
+import queue
+from typing import Awaitable, Callable, Dict
+
+import llm_runtime
+
+_DONE = object()
+
+
+class PrefetchGate:
+    """
+    Priority gate between interactive analyses and prefetching. Prefetch slots are
+    bounded, and a prefetch item waits while interactive analyses are at or above
+    yield_threshold, so prefetching never competes with a child waiting on a page.
+    """
+
+    def __init__(self, concurrency: int = 2, yield_threshold: int = 4, poll_interval: float = 0.25):
+        self.concurrency = concurrency
+        self.yield_threshold = yield_threshold
+        self.poll_interval = poll_interval
+        self._semaphore = None
+        self._interactive = 0
+        self._stats = {"admitted": 0, "yield_waits": 0}
+
+    @contextlib.contextmanager
+    def interactive(self):
+        """Mark an interactive analysis as running"""
+        self._interactive += 1
+        try:
+            yield
+        finally:
+            self._interactive -= 1
+
+    @contextlib.asynccontextmanager
+    async def prefetch_slot(self):
+        """Wait for a prefetch slot and for interactive load to drop (runtime loop only)"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            waited = False
+            while self._interactive >= self.yield_threshold:
+                waited = True
+                await asyncio.sleep(self.poll_interval)
+            self._stats["yield_waits"] += waited
+            self._stats["admitted"] += 1
+            yield
+
+    def snapshot(self) -> Dict:
+        stats = dict(self._stats)
+        stats["interactive_running"] = self._interactive
+        stats["concurrency"] = self.concurrency
+        return stats
+
+
+def _ndjson(line: Dict) -> str:
+    return json.dumps(line, default=str) + "\n"
+
+
+def ndjson_stream(run: Callable[[Callable[[Dict], None]], Awaitable]):
+    """
+    Blocking NDJSON generator (Flask). run(emit) is a coroutine that calls emit(line)
+    for every result; it runs on the LLM runtime loop and is cancelled if the client leaves.
+    """
+    lines = queue.Queue()
+
+    async def produce():
+        try:
+            await run(lines.put)
+        finally:
+            lines.put(_DONE)
+
+    future = asyncio.run_coroutine_threadsafe(produce(), llm_runtime.get_loop())
+    try:
+        while True:
+            line = lines.get()
+            if line is _DONE:
+                break
+            yield _ndjson(line)
+        future.result()
+    finally:
+        future.cancel()
+
+
+async def ndjson_stream_async(run: Callable[[Callable[[Dict], None]], Awaitable]):
+    """Async NDJSON generator (ASGI), same contract as ndjson_stream"""
+    loop = asyncio.get_running_loop()
+    lines = asyncio.Queue()
+
+    def emit(line):
+        loop.call_soon_threadsafe(lines.put_nowait, line)
+
+    async def produce():
+        try:
+            await run(emit)
+        finally:
+            emit(_DONE)
+
+    future = asyncio.run_coroutine_threadsafe(produce(), llm_runtime.get_loop())
+    try:
+        while True:
+            line = await lines.get()
+            if line is _DONE:
+                break
+            yield _ndjson(line)
+        await asyncio.wrap_future(future)
+    finally:
+        future.cancel()
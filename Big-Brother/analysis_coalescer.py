@@ -0,0 +1,154 @@
+"""
+Analysis Coalescer - Single-flight deduplication of concurrent analyses
+Responsibilities:
+1. Let exactly one caller (the leader) run the analysis for a given key
+2. Make concurrent callers for the same key (followers) wait on the leader's future
+3. Bound how long followers wait, and allow in-flight work to be cancelled
+4. Count how many calls were coalesced so the savings can be monitored
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future, CancelledError, TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class AnalysisWaitTimeout(Exception):
+    """Raised when a follower gives up waiting on the leader's result"""
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single execution"""
+
+    def __init__(self, name: str = "analysis"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._stats = {
+            "leaders": 0,      # Calls that actually ran the work
+            "coalesced": 0,    # Calls that joined an in-flight run instead
+            "timeouts": 0,     # Followers that stopped waiting
+            "cancelled": 0,    # In-flight runs cancelled before completion
+            "errors": 0,       # Leader runs that raised
+        }
+
+    def do(self, key: str, fn: Callable, timeout: Optional[float] = None):
+        """
+        Run fn() once for all concurrent callers that pass the same key
+
+        Args:
+            key: Identity of the work (e.g. the link being analyzed)
+            fn: Zero-argument callable executed by the leader
+            timeout: Seconds a follower waits for the leader (None = forever)
+
+        Returns:
+            The leader's result. Followers receive the same object, so callers
+            that mutate it should copy it first.
+        """
+        future, is_leader = self._join(key)
+
+        if not is_leader:
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeoutError:
+                raise self._timed_out(key, timeout)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key: str, coro_fn: Callable[[], Awaitable], timeout: Optional[float] = None):
+        """
+        Async variant of do(): the leader awaits coro_fn() and followers await its
+        future without blocking the event loop. Sync and async callers of the same
+        key share one run.
+        """
+        future, is_leader = self._join(key)
+
+        if not is_leader:
+            try:
+                # shield: a follower giving up must not cancel the leader's run
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+            except asyncio.TimeoutError:
+                raise self._timed_out(key, timeout)
+
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def _join(self, key):
+        """Return (future, is_leader) for a key, registering a new run if none is in flight"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return future, False
+            future = Future()
+            future.set_running_or_notify_cancel()
+            self._inflight[key] = future
+            self._stats["leaders"] += 1
+            return future, True
+
+    def _timed_out(self, key, timeout):
+        with self._lock:
+            self._stats["timeouts"] += 1
+        return AnalysisWaitTimeout(f"Timed out after {timeout}s waiting for {self.name} of {key}")
+
+    def _fail(self, key, future, exception):
+        with self._lock:
+            self._stats["errors"] += 1
+        self._finish(key, future, exception=exception)
+
+    def cancel(self, key: str) -> bool:
+        """
+        Cancel the in-flight run for a key. Waiting followers receive a
+        CancelledError and the next caller becomes a fresh leader.
+        """
+        with self._lock:
+            future = self._inflight.pop(key, None)
+            if future is None:
+                return False
+            self._stats["cancelled"] += 1
+        if not future.done():
+            future.set_exception(CancelledError(f"{self.name} of {key} was cancelled"))
+        return True
+
+    def cancel_all(self) -> int:
+        """Cancel every in-flight run (e.g. when the policy they run under changed)"""
+        with self._lock:
+            keys = list(self._inflight)
+        return sum(1 for key in keys if self.cancel(key))
+
+    def _finish(self, key, future, result=None, exception=None):
+        """Publish the leader's outcome and free the key for the next run"""
+        with self._lock:
+            # Only detach the future if it was not cancelled and replaced meanwhile
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def snapshot(self) -> Dict:
+        """Counters for the metrics endpoint"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._inflight)
+        total = stats["leaders"] + stats["coalesced"]
+        stats["coalesced_ratio"] = round(stats["coalesced"] / total, 4) if total else 0.0
+        return stats
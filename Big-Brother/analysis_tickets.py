@@ -0,0 +1,181 @@
+"""
+Analysis Tickets - Asynchronous /analyze requests with a result-push channel
+Responsibilities:
+1. Hand out a ticket for an analysis instead of holding the HTTP request open
+2. Run ticketed analyses on a bounded pool of workers on the LLM runtime loop,
+   queueing (never dropping) work beyond the pool size
+3. Deliver results over Server-Sent Events or long-poll
+4. Expire finished tickets so the store stays bounded
+"""
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, Dict, Optional
+
+import llm_runtime
+
+
+class AnalysisTicket:
+    """One queued or running analysis"""
+
+    def __init__(self, key: str, coro_fn: Callable[[], Awaitable]):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.coro_fn = coro_fn
+        self.created_at = time.time()
+        self.finished_at = None
+        self.status = "queued"  # queued -> running -> done | error
+        self.future = Future()
+
+    def to_dict(self) -> Dict:
+        body = {"ticket": self.id, "status": self.status}
+        if self.status == "done":
+            body["result"] = self.future.result()
+        elif self.status == "error":
+            body["error"] = "Analysis failed, please try again later."
+        return body
+
+
+class TicketQueue:
+    """Bounded worker pool that drains a FIFO of analysis tickets"""
+
+    def __init__(self, workers: int = 8, ttl: float = 600):
+        self.workers = workers
+        self.ttl = ttl
+        self._tickets: Dict[str, AnalysisTicket] = {}
+        self._pending_by_key: Dict[str, AnalysisTicket] = {}
+        self._lock = threading.Lock()
+        self._queue = None
+        self._started = False
+        self._stats = {"submitted": 0, "reused": 0, "completed": 0, "failed": 0, "running": 0}
+
+    def start(self):
+        """Spawn the worker coroutines on the LLM runtime loop"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        loop = llm_runtime.get_loop()
+
+        def spawn():
+            self._queue = asyncio.Queue()
+            for _ in range(self.workers):
+                loop.create_task(self._worker())
+
+        ready = threading.Event()
+        loop.call_soon_threadsafe(lambda: (spawn(), ready.set()))
+        ready.wait()
+
+    def submit(self, key: str, coro_fn: Callable[[], Awaitable]) -> AnalysisTicket:
+        """
+        Queue an analysis and return its ticket. A request for a key that is still
+        queued or running gets the existing ticket instead of a second job.
+        """
+        self.start()
+        with self._lock:
+            self._expire()
+            ticket = self._pending_by_key.get(key)
+            if ticket is not None:
+                self._stats["reused"] += 1
+                return ticket
+            ticket = AnalysisTicket(key, coro_fn)
+            self._tickets[ticket.id] = ticket
+            self._pending_by_key[key] = ticket
+            self._stats["submitted"] += 1
+        llm_runtime.get_loop().call_soon_threadsafe(self._queue.put_nowait, ticket)
+        return ticket
+
+    def get(self, ticket_id: str) -> Optional[AnalysisTicket]:
+        return self._tickets.get(ticket_id)
+
+    async def _worker(self):
+        while True:
+            ticket = await self._queue.get()
+            ticket.status = "running"
+            self._stats["running"] += 1
+            try:
+                result = await ticket.coro_fn()
+                ticket.status = "done"
+                ticket.future.set_result(result)
+                self._stats["completed"] += 1
+            except Exception as e:
+                print(f"ERROR in ticketed analysis for {ticket.key}: {e}", flush=True)
+                ticket.status = "error"
+                ticket.future.set_exception(e)
+                self._stats["failed"] += 1
+            finally:
+                self._stats["running"] -= 1
+                ticket.finished_at = time.time()
+                with self._lock:
+                    if self._pending_by_key.get(ticket.key) is ticket:
+                        del self._pending_by_key[ticket.key]
+                self._queue.task_done()
+
+    def _expire(self):
+        """Drop finished tickets older than the TTL. Caller must hold the lock."""
+        cutoff = time.time() - self.ttl
+        expired = [ticket_id for ticket_id, ticket in self._tickets.items()
+                   if ticket.finished_at is not None and ticket.finished_at < cutoff]
+        for ticket_id in expired:
+            del self._tickets[ticket_id]
+
+    def snapshot(self) -> Dict:
+        stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize() if self._queue is not None else 0
+        stats["tickets"] = len(self._tickets)
+        stats["workers"] = self.workers
+        return stats
+
+
+# ==================== DELIVERY ====================
+
+def sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _final_event(ticket: AnalysisTicket) -> str:
+    if ticket.status == "done":
+        return sse_event("result", ticket.to_dict())
+    return sse_event("error", ticket.to_dict())
+
+
+def sse_stream(ticket: AnalysisTicket, heartbeat: float = 15):
+    """Blocking SSE generator (Flask): a status event, heartbeats, then the result"""
+    yield sse_event("status", {"ticket": ticket.id, "status": ticket.status})
+    while True:
+        try:
+            ticket.future.exception(timeout=heartbeat)
+        except FutureTimeoutError:
+            yield ": heartbeat\n\n"
+            continue
+        yield _final_event(ticket)
+        return
+
+
+async def sse_stream_async(ticket: AnalysisTicket, heartbeat: float = 15):
+    """Async SSE generator (ASGI), same events as sse_stream"""
+    yield sse_event("status", {"ticket": ticket.id, "status": ticket.status})
+    waiter = asyncio.wrap_future(ticket.future)
+    while True:
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), heartbeat)
+        except asyncio.TimeoutError:
+            yield ": heartbeat\n\n"
+            continue
+        except Exception:
+            pass
+        yield _final_event(ticket)
+        return
+
+
+def wait_for_ticket(ticket: AnalysisTicket, timeout: float) -> bool:
+    """Long-poll helper: block up to timeout seconds, return True once the ticket finished"""
+    try:
+        ticket.future.exception(timeout=timeout)
+        return True
+    except FutureTimeoutError:
+        return False
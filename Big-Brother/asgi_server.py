@@ -0,0 +1,127 @@
+"""
+ASGI Server - Async serving mode for the Northlight API
+Responsibilities:
+1. Serve /analyze, /appeal and /desktop/screenshot as native async handlers, so a
+   pending LLM call holds no thread while it waits
+2. Stream ticket results (/analyze/<ticket>/events), batch results (/analyze/batch) and
+   the desktop monitors' push channel (/desktop/events) without holding a thread per client
+3. Serve every other route through the existing Flask app, mounted as WSGI
+4. Run under uvicorn instead of Flask's development server
+
+All agent calls run on the single long-lived loop owned by llm_runtime, which shares
+one keep-alive HTTP client. List lookups are answered from the in-memory replicas;
+the few Mongo writes per analysis run on llm_runtime's bounded thread pool.
+
+Usage:
+    pip install starlette uvicorn a2wsgi
+    python asgi_server.py [--host 127.0.0.1] [--port 5000]
+"""
+
+import contextlib
+
+import uvicorn
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import llm_runtime
+import new_server
+from analysis_batch import ndjson_stream_async
+from analysis_tickets import sse_stream_async
+
+
+async def analyze(request):
+    data = await request.json()
+    if new_server.wants_analysis_ticket(data, request.headers):
+        body, status = await run_in_threadpool(new_server.start_analysis_ticket, data)
+        return JSONResponse(body, status_code=status)
+    return JSONResponse(await llm_runtime.run_async(new_server.analyze_page(data)))
+
+
+async def analyze_batch(request):
+    items, max_analyses, error = new_server.parse_batch_request(await request.json())
+    if error:
+        return JSONResponse({"ok": False, "error": error}, status_code=400)
+    return StreamingResponse(
+        ndjson_stream_async(lambda emit: new_server.run_analysis_batch(items, max_analyses, emit)),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def analysis_ticket_events(request):
+    ticket = new_server.analysis_queue.get(request.path_params["ticket_id"])
+    if ticket is None:
+        return JSONResponse({"error": "Unknown or expired ticket"}, status_code=404)
+    return StreamingResponse(
+        sse_stream_async(ticket, heartbeat=new_server.ANALYSIS_EVENTS_HEARTBEAT),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def desktop_monitor_events(request):
+    since = request.query_params.get("since")
+    return StreamingResponse(
+        new_server.monitor_channel.stream_async(
+            request.query_params.get("device"), new_server.monitor_opening_events(since)
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def appeal(request):
+    data = await request.json()
+    body, status = await llm_runtime.run_async(new_server.process_appeal(data))
+    return JSONResponse(body, status_code=status)
+
+
+async def desktop_screenshot(request):
+    data = await request.json()
+    body, status = await llm_runtime.run_async(new_server.process_desktop_screenshot(data))
+    return JSONResponse(body, status_code=status)
+
+
+routes = [
+    Route("/analyze", analyze, methods=["POST"]),
+    Route("/analyze/batch", analyze_batch, methods=["POST"]),
+    Route("/analyze/{ticket_id}/events", analysis_ticket_events, methods=["GET"]),
+    Route("/appeal", appeal, methods=["POST"]),
+    Route("/desktop/screenshot", desktop_screenshot, methods=["POST"]),
+    Route("/desktop/events", desktop_monitor_events, methods=["GET"]),
+    # Everything else keeps its Flask implementation
+    Mount("/", app=WSGIMiddleware(new_server.app)),
+]
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    llm_runtime.shutdown()
+
+
+asgi_app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main():
+    """Entry point for the async serving mode"""
+    args = new_server.parse_args()
+    new_server.initialize_services()
+
+    print(f"Starting ASGI server on {args.host}:{args.port}...")
+    uvicorn.run(asgi_app, host=args.host, port=args.port, log_level="debug" if args.debug else "info")
+
+
+if __name__ == "__main__":
+    main()
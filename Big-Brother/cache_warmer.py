@@ -0,0 +1,229 @@
+"""
+Cache Warmer - Visit-frequency counters and off-peak pre-analysis of the hottest pages
+Responsibilities:
+1. Count /analyze requests per link and per domain, decayed over time (recent visits weigh more)
+2. Keep the last-seen page of the hottest links, so they can be analyzed before the next visit
+3. Persist the counters compactly, so a restart does not forget what the child browses
+4. Off-peak, under a per-hour budget of agent runs, re-analyze hot links that have no
+   current verdict (stale after a prompt change, or never stored)
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import llm_runtime
+
+# Rebase the counters before their growth factor gets anywhere near float overflow
+_MAX_EXPONENT = 500
+
+
+class DecayedCounter:
+    """
+    Exponentially decayed hit counts with a shared time base. Each key holds one float,
+    its count scaled by 2^((t - origin) / half_life), so a hit is a single addition and
+    keys compare without recomputing any decay.
+    """
+
+    def __init__(self, half_life: float = 7 * 24 * 3600, max_keys: int = 20_000):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self.origin = time.time()
+        self._values: Dict[str, float] = {}
+
+    def _weight(self, now: float) -> float:
+        exponent = (now - self.origin) / self.half_life
+        if exponent > _MAX_EXPONENT:
+            self._rebase(now)
+            exponent = 0.0
+        return 2.0 ** exponent
+
+    def _rebase(self, now: float):
+        factor = 2.0 ** (-(now - self.origin) / self.half_life)
+        self._values = {key: value * factor for key, value in self._values.items() if value * factor > 1e-9}
+        self.origin = now
+
+    def hit(self, key: str, now: Optional[float] = None):
+        self._values[key] = self._values.get(key, 0.0) + self._weight(now or time.time())
+        if len(self._values) > self.max_keys * 1.2:
+            self.prune()
+
+    def score(self, key: str, now: Optional[float] = None) -> float:
+        """Decayed count: each visit counts 1 now, 0.5 one half-life ago"""
+        return self._values.get(key, 0.0) / self._weight(now or time.time())
+
+    def top(self, n: int, now: Optional[float] = None) -> List[Tuple[str, float]]:
+        weight = self._weight(now or time.time())
+        hottest = sorted(self._values.items(), key=lambda item: -item[1])[:n]
+        return [(key, value / weight) for key, value in hottest]
+
+    def prune(self):
+        """Forget the coldest keys beyond max_keys"""
+        if len(self._values) > self.max_keys:
+            self._values = dict(sorted(self._values.items(), key=lambda item: -item[1])[:self.max_keys])
+
+    def __len__(self):
+        return len(self._values)
+
+    def to_doc(self) -> Dict:
+        return {"origin": self.origin, "half_life": self.half_life, "values": [[k, v] for k, v in self._values.items()]}
+
+    def load_doc(self, doc: Dict, now: Optional[float] = None):
+        """Restore saved counts, decayed to now under the half-life they were saved with"""
+        now = now or time.time()
+        factor = 2.0 ** (-(now - doc["origin"]) / doc["half_life"])
+        self.origin = now
+        self._values = {key: value * factor for key, value in doc["values"] if value * factor > 1e-9}
+        self.prune()
+
+
+class AccessTracker:
+    """Decayed visit counts per link and per domain, plus the last-seen page of hot links"""
+
+    def __init__(self, half_life: float = 7 * 24 * 3600, max_keys: int = 20_000,
+                 max_pages: int = 500, max_page_chars: int = 20_000):
+        self.links = DecayedCounter(half_life, max_keys)
+        self.domains = DecayedCounter(half_life, max_keys)
+        self.max_pages = max_pages
+        self.max_page_chars = max_page_chars
+        self._pages: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def record(self, link: str, domain: str, url: str, title: str, content: str):
+        now = time.time()
+        with self._lock:
+            self.links.hit(link, now)
+            if domain:
+                self.domains.hit(domain, now)
+            self._pages[link] = (url, title, (content or "")[:self.max_page_chars])
+            if len(self._pages) > self.max_pages * 2:
+                keep = {key for key, _ in self.links.top(self.max_pages, now)}
+                self._pages = {key: page for key, page in self._pages.items() if key in keep}
+
+    def hottest(self, n: int) -> List[Tuple[str, float, Optional[tuple]]]:
+        """(link, score, page) for the n most visited links; page is (url, title, content) or None"""
+        with self._lock:
+            return [(link, score, self._pages.get(link)) for link, score in self.links.top(n)]
+
+    # ==================== PERSISTENCE ====================
+
+    def save(self, collection):
+        with self._lock:
+            docs = {"links": self.links.to_doc(), "domains": self.domains.to_doc()}
+        for name, doc in docs.items():
+            collection.replace_one({"_id": name}, dict(doc, _id=name, saved_at=datetime.now()), upsert=True)
+
+    def load(self, collection):
+        for name, counter in (("links", self.links), ("domains", self.domains)):
+            doc = collection.find_one({"_id": name})
+            if doc is not None:
+                with self._lock:
+                    counter.load_doc(doc)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "links": len(self.links),
+                "domains": len(self.domains),
+                "pages": len(self._pages),
+                "top_domains": [[domain, round(score, 2)] for domain, score in self.domains.top(10)],
+            }
+
+
+def parse_hours(spec: str) -> Optional[Tuple[int, int]]:
+    """'22-6' -> (22, 6): local hours, end exclusive, may wrap past midnight. '' -> None (any time)"""
+    if not spec:
+        return None
+    start, end = (int(part) for part in spec.split("-"))
+    return start % 24, end % 24
+
+
+def in_hours(hours: Optional[Tuple[int, int]], hour: int) -> bool:
+    if hours is None:
+        return True
+    start, end = hours
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+class CacheWarmer:
+    """Periodic off-peak job that pre-analyzes the hottest links lacking a current verdict"""
+
+    def __init__(self, tracker: AccessTracker, runs_per_hour: int = 30, hours: str = "",
+                 interval: float = 300, candidates: int = 100):
+        self.tracker = tracker
+        self.runs_per_hour = runs_per_hour
+        self.hours = parse_hours(hours)
+        self.interval = interval
+        self.candidates = candidates
+        self._budget_hour = None
+        self._budget_left = runs_per_hour
+        self._started = False
+        self._stats = {"ticks": 0, "busy_ticks": 0, "warmed": 0, "errors": 0, "budget_exhausted": 0}
+
+    def start(self, needs_warming: Callable[..., bool], warm: Callable, busy: Callable[[], bool],
+              on_tick: Optional[Callable[[], None]] = None):
+        """
+        Run on the LLM runtime loop. needs_warming(link, url, title) is blocking and says
+        whether a link lacks a current verdict; warm(link, url, title, content) is a
+        coroutine that analyzes and stores it, and raises when the analysis failed (nothing
+        is stored, and the link counts as an error rather than warmed); busy() defers warming
+        while interactive analyses are running; on_tick (blocking) runs every interval, e.g.
+        to persist counters.
+        """
+        if self._started:
+            return
+        self._started = True
+        asyncio.run_coroutine_threadsafe(self._run(needs_warming, warm, busy, on_tick), llm_runtime.get_loop())
+
+    def _take_budget(self) -> bool:
+        hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+        if hour != self._budget_hour:
+            self._budget_hour = hour
+            self._budget_left = self.runs_per_hour
+        if self._budget_left <= 0:
+            return False
+        self._budget_left -= 1
+        return True
+
+    async def _run(self, needs_warming, warm, busy, on_tick):
+        while True:
+            await asyncio.sleep(self.interval)
+            self._stats["ticks"] += 1
+            if on_tick is not None:
+                try:
+                    await asyncio.to_thread(on_tick)
+                except Exception as e:
+                    print(f"Cache warmer tick failed: {e}", flush=True)
+            if not in_hours(self.hours, datetime.now().hour):
+                continue
+            await self._warm_hottest(needs_warming, warm, busy)
+
+    async def _warm_hottest(self, needs_warming, warm, busy):
+        for link, score, page in self.tracker.hottest(self.candidates):
+            if page is None:
+                continue
+            if busy():
+                self._stats["busy_ticks"] += 1
+                return
+            url, title, content = page
+            if not await asyncio.to_thread(needs_warming, link, url, title):
+                continue
+            if not self._take_budget():
+                self._stats["budget_exhausted"] += 1
+                return
+            try:
+                await warm(link, url, title, content)
+                self._stats["warmed"] += 1
+            except Exception as e:
+                print(f"Warming {link} failed: {e}", flush=True)
+                self._stats["errors"] += 1
+
+    def snapshot(self) -> Dict:
+        stats = dict(self._stats)
+        stats["budget_left_this_hour"] = self._budget_left
+        stats["runs_per_hour"] = self.runs_per_hour
+        stats["hours"] = "-".join(map(str, self.hours)) if self.hours else "any"
+        stats["tracker"] = self.tracker.snapshot()
+        return stats
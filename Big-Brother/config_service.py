@@ -0,0 +1,147 @@
+"""
+Config Service - Process-local cached copy of the monitoring configuration
+Responsibilities:
+1. Serve the configuration document from memory, so readers never wait on Mongo
+2. Stamp every write with a monotonically increasing 'version' ($inc, atomically with the write)
+3. Stay current through a MongoDB change stream when the deployment supports it,
+   otherwise by polling only the version field in the background
+4. Share one cache between the server and the email agent in the same process
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+CONFIG_REFRESH_INTERVAL = float(os.getenv("CONFIG_REFRESH_INTERVAL", "5"))
+
+# Services by (collection, query), so every module in the process shares one cache
+_shared: Dict[tuple, "ConfigService"] = {}
+_shared_lock = threading.Lock()
+
+
+class ConfigService:
+    """Cached view of one configuration document"""
+
+    def __init__(self, collection, query: Dict, refresh_interval: float = CONFIG_REFRESH_INTERVAL):
+        self.collection = collection
+        self.query = query
+        self.refresh_interval = refresh_interval
+
+        self._doc: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._thread = None
+        self._stats = {"reads": 0, "reloads": 0, "writes": 0, "change_events": 0, "change_stream": False}
+
+    @classmethod
+    def shared(cls, collection, query: Dict) -> "ConfigService":
+        key = (collection.full_name, tuple(sorted(query.items())))
+        with _shared_lock:
+            if key not in _shared:
+                _shared[key] = cls(collection, query)
+            return _shared[key]
+
+    # ==================== READS ====================
+
+    def get(self) -> Optional[dict]:
+        """A copy of the configuration document, or None if there is none yet"""
+        if not self._loaded:
+            self.reload()
+            self.start()
+        self._stats["reads"] += 1
+        doc = self._doc
+        return dict(doc) if doc is not None else None
+
+    @property
+    def version(self) -> int:
+        return (self._doc or {}).get("version", 0)
+
+    # ==================== WRITES ====================
+
+    def update(self, fields: Dict) -> dict:
+        """Set fields and bump the version; the new document is cached before this returns"""
+        doc = self.collection.find_one_and_update(
+            self.query,
+            {"$set": fields, "$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._stats["writes"] += 1
+        self._install(doc)
+        return dict(doc)
+
+    def create(self, defaults: Dict) -> dict:
+        """Insert defaults unless a document already exists, and return the stored document"""
+        self.collection.update_one(
+            self.query,
+            {"$setOnInsert": dict(defaults, version=1)},
+            upsert=True,
+        )
+        self.reload()
+        return dict(self._doc)
+
+    def _install(self, doc: Optional[dict]):
+        """Cache doc unless a newer version is already cached (reads can race with writes)"""
+        with self._lock:
+            if doc is None or self._doc is None or doc.get("version", 0) >= self.version:
+                self._doc = doc
+            self._loaded = True
+
+    def reload(self):
+        try:
+            doc = self.collection.find_one(self.query)
+        except PyMongoError as e:
+            print(f"Warning: could not reload {self.collection.name}: {e}")
+            return
+        self._stats["reloads"] += 1
+        self._install(doc)
+
+    # ==================== BACKGROUND REFRESH ====================
+
+    def start(self):
+        """Start the change-stream tailer / version poller"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            if not self._tail_change_stream():
+                # No change streams (standalone mongod): compare versions only
+                time.sleep(self.refresh_interval)
+                self._poll_version()
+
+    def _poll_version(self):
+        try:
+            current = self.collection.find_one(self.query, {"version": 1})
+        except PyMongoError:
+            return
+        if (current is None) != (self._doc is None) or (current is not None and current.get("version", 0) != self.version):
+            self.reload()
+
+    def _tail_change_stream(self) -> bool:
+        """Apply change events until the stream fails. Returns False if unsupported."""
+        pipeline = [{"$match": {f"fullDocument.{field}": value for field, value in self.query.items()}}]
+        try:
+            with self.collection.watch(pipeline, full_document="updateLookup") as stream:
+                self._stats["change_stream"] = True
+                # Writes between the initial load and opening the stream would otherwise be missed
+                self.reload()
+                for change in stream:
+                    self._stats["change_events"] += 1
+                    self._install(change.get("fullDocument"))
+            return True
+        except PyMongoError:
+            self._stats["change_stream"] = False
+            return False
+
+    def snapshot(self) -> Dict:
+        stats = dict(self._stats)
+        stats["version"] = self.version
+        return stats
@@ -0,0 +1,281 @@
+"""
+Content Fingerprint - SimHash near-duplicate detection for page verdicts
+Responsibilities:
+1. Reduce a page's normalized text to a 64-bit SimHash
+2. Index stored AI verdicts by SimHash, banded so near neighbours are found without a scan
+3. Find an existing verdict within a Hamming distance, under the same monitoring prompt
+4. Benchmark precision/recall and latency on a recorded corpus
+
+Mirror sites, AMP pages and re-hosted articles differ in a few words of boilerplate;
+their SimHashes differ in a few bits, so the earlier verdict can be reused without an
+agent run.
+"""
+
+import hashlib
+import re
+import threading
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from url_matcher import AI_REASONS
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+# Pages shorter than this (login walls, error pages) collide too easily to be trusted
+MIN_FINGERPRINT_WORDS = 50
+# Only the head of very long pages is fingerprinted, which bounds the cost per request
+MAX_FINGERPRINT_CHARS = 20_000
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_words(title: str, content: str):
+    """Lower-cased word tokens of the title and content"""
+    text = f"{title or ''} {(content or '')[:MAX_FINGERPRINT_CHARS]}".lower()
+    return _WORD_RE.findall(text)
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(words) -> int:
+    """64-bit SimHash over word shingles, weighted by how often each shingle occurs"""
+    if len(words) < SHINGLE_SIZE:
+        shingles = Counter([" ".join(words)])
+    else:
+        shingles = Counter(
+            " ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)
+        )
+
+    # Bit-sliced vertical counters: planes[i] holds bit i of every column's count of
+    # set bits, so adding a 64-bit hash to all 64 columns is a short carry chain of
+    # integer ops instead of a loop over bits
+    total = sum(shingles.values())
+    planes = [0] * total.bit_length()
+    for shingle, count in shingles.items():
+        h = _feature_hash(shingle)
+        for _ in range(count):
+            carry, i = h, 0
+            while carry:
+                plane = planes[i]
+                planes[i] = plane ^ carry
+                carry &= plane
+                i += 1
+
+    fingerprint = 0
+    for bit in range(SIMHASH_BITS):
+        ones = sum(((plane >> bit) & 1) << i for i, plane in enumerate(planes))
+        if 2 * ones > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def page_fingerprint(title: str, content: str) -> Optional[str]:
+    """SimHash of a page as 16 hex digits, or None when the page is too short to compare"""
+    words = normalize_words(title, content)
+    if len(words) < MIN_FINGERPRINT_WORDS:
+        return None
+    return format(simhash(words), "016x")
+
+
+def prompt_fingerprint(monitoring_prompt: str) -> str:
+    """Short stable hash of the parent's monitoring prompt"""
+    return hashlib.sha256((monitoring_prompt or "").encode("utf-8")).hexdigest()[:16]
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex:
+    """
+    Banded index over stored verdicts. With max_distance + 1 bands, two fingerprints
+    within max_distance bits agree exactly on at least one band (pigeonhole), so only
+    entries sharing a band are compared.
+    """
+
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self._band_width = SIMHASH_BITS // self.bands
+        self._entries: Dict[Tuple[str, str], Tuple[int, str, dict]] = {}
+        self._buckets: Dict[Tuple[str, int, int], set] = {}
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "reused": 0, "candidates": 0}
+
+    def _band_values(self, fingerprint: int):
+        mask = (1 << self._band_width) - 1
+        for band in range(self.bands):
+            # The last band absorbs the bits left over by integer division
+            if band == self.bands - 1:
+                yield band, fingerprint >> (band * self._band_width)
+            else:
+                yield band, (fingerprint >> (band * self._band_width)) & mask
+
+    def add(self, list_name: str, key: str, entry: dict):
+        """Index an entry if it is an AI verdict carrying a content fingerprint"""
+        if entry.get("reason") not in AI_REASONS:
+            self.remove(list_name, key)
+            return
+        fingerprint = entry.get("content_simhash")
+        prompt_hash = entry.get("prompt_hash")
+        if not fingerprint or not prompt_hash:
+            self.remove(list_name, key)
+            return
+
+        value = int(fingerprint, 16)
+        with self._lock:
+            self._remove_locked((list_name, key))
+            self._entries[(list_name, key)] = (value, prompt_hash, entry)
+            for band, band_value in self._band_values(value):
+                self._buckets.setdefault((prompt_hash, band, band_value), set()).add((list_name, key))
+
+    def remove(self, list_name: str, key: str):
+        with self._lock:
+            self._remove_locked((list_name, key))
+
+    def _remove_locked(self, entry_id):
+        current = self._entries.pop(entry_id, None)
+        if current is None:
+            return
+        value, prompt_hash, _ = current
+        for band, band_value in self._band_values(value):
+            bucket = self._buckets.get((prompt_hash, band, band_value))
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[(prompt_hash, band, band_value)]
+
+    def reset(self, list_name: str, entries: Dict[str, dict]):
+        with self._lock:
+            for entry_id in [entry_id for entry_id in self._entries if entry_id[0] == list_name]:
+                self._remove_locked(entry_id)
+        for key, entry in entries.items():
+            self.add(list_name, key, entry)
+
+    def attach(self, list_name: str, replica):
+        """Keep this list's verdicts indexed as a ListReplica changes"""
+        replica.add_listener(
+            on_put=lambda key, entry: self.add(list_name, key, entry),
+            on_discard=lambda key: self.remove(list_name, key),
+            on_reset=lambda entries: self.reset(list_name, entries),
+        )
+
+    def nearest(self, fingerprint: str, prompt_hash: str):
+        """
+        Closest indexed verdict for a page.
+
+        Returns:
+            (list_name, key, entry, distance) within max_distance bits, or None
+        """
+        value = int(fingerprint, 16)
+        best = None
+        with self._lock:
+            self._stats["lookups"] += 1
+            seen = set()
+            for band, band_value in self._band_values(value):
+                for entry_id in self._buckets.get((prompt_hash, band, band_value), ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    other, _, entry = self._entries[entry_id]
+                    distance = hamming_distance(value, other)
+                    if distance <= self.max_distance and (best is None or distance < best[3]):
+                        best = (entry_id[0], entry_id[1], entry, distance)
+            self._stats["candidates"] += len(seen)
+            if best is not None:
+                self._stats["reused"] += 1
+        return best
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["indexed"] = len(self._entries)
+        stats["max_distance"] = self.max_distance
+        stats["reuse_ratio"] = round(stats["reused"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+        return stats
+
+
+# ==================== BENCHMARK ====================
+
+def _load_corpus(path):
+    """
+    Recorded corpus: JSON lines of {"url", "title", "content", "group"}. Pages sharing a
+    group are the same content (mirror, AMP copy, re-host); all others are distinct.
+    """
+    import json
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _synthetic_corpus(groups=400, copies=3, sites=20, seed=7):
+    """
+    Stand-in corpus: distinct articles that share their site's navigation template
+    (the hard case for precision), plus mirrors with small edits and boilerplate.
+    """
+    import random
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(5000)]
+    templates = [[rng.choice(vocabulary) for _ in range(120)] for _ in range(sites)]
+    boilerplate = "share this article subscribe to our newsletter cookie settings accept all".split()
+    corpus = []
+    for group in range(groups):
+        template = templates[group % sites]
+        body = [rng.choice(vocabulary) for _ in range(rng.randint(150, 800))]
+        page = template[:60] + body + template[60:]
+        corpus.append({"url": f"https://site{group % sites}.com/{group}", "title": f"t{group}",
+                       "content": " ".join(page), "group": group})
+        for copy in range(copies):
+            mirror = list(body)
+            for _ in range(rng.randint(0, max(1, len(body) // 200))):
+                mirror[rng.randrange(len(mirror))] = rng.choice(vocabulary)
+            mirror = template[:60] + rng.sample(boilerplate, 3) + mirror + template[60:]
+            corpus.append({"url": f"https://mirror{copy}.site{group % sites}.net/{group}", "title": f"t{group}",
+                           "content": " ".join(mirror), "group": group})
+    return corpus
+
+
+def _benchmark(corpus, distances=(2, 3, 4, 6)):
+    """Precision/recall of 'reuse the nearest earlier verdict' and per-page latency"""
+    import time
+
+    start = time.perf_counter()
+    fingerprints = [page_fingerprint(page.get("title", ""), page.get("content", "")) for page in corpus]
+    hash_us = (time.perf_counter() - start) / len(corpus) * 1e6
+    skipped = sum(1 for fp in fingerprints if fp is None)
+    print(f"{len(corpus)} pages, {skipped} too short to fingerprint, simhash {hash_us:.1f} us/page")
+
+    # A page has a true duplicate if an earlier page shares its group
+    print(f"{'distance':>8} {'precision':>10} {'recall':>8} {'lookup us':>10}")
+    for max_distance in distances:
+        index = SimHashIndex(max_distance=max_distance)
+        seen_groups = set()
+        tp = fp = fn = 0
+        lookup_time = 0.0
+        for i, (page, fingerprint) in enumerate(zip(corpus, fingerprints)):
+            has_duplicate = page["group"] in seen_groups
+            seen_groups.add(page["group"])
+            if fingerprint is None:
+                fn += has_duplicate
+                continue
+            start = time.perf_counter()
+            found = index.nearest(fingerprint, "p")
+            lookup_time += time.perf_counter() - start
+            if found is not None:
+                if found[2]["group"] == page["group"]:
+                    tp += 1
+                else:
+                    fp += 1
+            elif has_duplicate:
+                fn += 1
+            index.add("list", str(i), {"reason": "AI Analysis", "content_simhash": fingerprint,
+                                        "prompt_hash": "p", "group": page["group"]})
+        precision = tp / (tp + fp) if tp + fp else 1.0
+        recall = tp / (tp + fn) if tp + fn else 1.0
+        print(f"{max_distance:>8} {precision:>10.3f} {recall:>8.3f} {lookup_time / len(corpus) * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(_load_corpus(sys.argv[1]) if len(sys.argv) > 1 else _synthetic_corpus())
@@ -0,0 +1,253 @@
+"""
+Content Reducer - Fit a page into the agent's token budget without losing its substance
+Responsibilities:
+1. Strip navigation, cookie banners and other boilerplate lines from the page text
+2. Score sentences by how central they are to the page and to its title
+3. Sample the best sentences from every part of the document, in reading order, up to
+   a token budget
+4. Benchmark prompt tokens, agent latency and verdict agreement against the old
+   content[:5000] truncation on a recorded corpus
+
+The extension sends the page's full innerText; truncating it to the first 5000
+characters mostly kept the menus that come before the real text.
+"""
+
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+# Pages longer than this are cut before any processing, which bounds the per-request work
+MAX_INPUT_CHARS = 300_000
+# Legacy behaviour, kept for comparison in metrics and the benchmark
+LEGACY_CONTENT_CHARS = 5000
+
+_BOILERPLATE_RE = re.compile(
+    r"\b(cookies?|subscribe|sign (in|up)|log ?in|newsletter|privacy policy|terms of (use|service)|"
+    r"all rights reserved|skip to (main )?content|advertisement|share (this|on)|follow us|accept all|"
+    r"copyright|©)\b",
+    re.IGNORECASE,
+)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'“(\[]?[A-Z0-9])")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = set(
+    "a an and are as at be but by for from has have he her his i in is it its of on or our she "
+    "that the their them they this to was we were what when which who will with you your".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text)"""
+    return math.ceil(len(text) / 4)
+
+
+def strip_boilerplate(content: str) -> List[str]:
+    """Paragraph lines of a page with menus, repeated links and banner text removed"""
+    lines = [line.strip() for line in content[:MAX_INPUT_CHARS].splitlines()]
+    lines = [line for line in lines if line]
+    repeats = Counter(lines)
+
+    kept = []
+    for line in lines:
+        words = line.split()
+        # Menu entries and buttons: short, and not a sentence
+        if len(words) < 4 and not line.endswith((".", "?", "!")):
+            continue
+        # Navigation repeated in header and footer
+        if repeats[line] > 1 and len(words) < 12:
+            continue
+        if len(words) < 25 and _BOILERPLATE_RE.search(line):
+            continue
+        kept.append(line)
+
+    # Pages that are mostly short lines (video pages, feeds) would be emptied; keep them whole
+    if sum(len(line) for line in kept) < 0.2 * sum(len(line) for line in lines):
+        return lines
+    return kept
+
+
+def _split_sentences(paragraphs: List[str]) -> List[str]:
+    sentences = []
+    for paragraph in paragraphs:
+        sentences.extend(part.strip() for part in _SENTENCE_RE.split(paragraph) if part.strip())
+    return sentences
+
+
+def _score_sentences(sentences: List[str], title: str) -> List[float]:
+    """Centrality (frequency of the sentence's content words in the page) plus title overlap"""
+    tokenized = [[word for word in _WORD_RE.findall(sentence.lower()) if word not in _STOPWORDS]
+                 for sentence in sentences]
+    frequencies = Counter(word for words in tokenized for word in set(words))
+    title_words = {word for word in _WORD_RE.findall((title or "").lower()) if word not in _STOPWORDS}
+
+    scores = []
+    for words in tokenized:
+        if not words:
+            scores.append(0.0)
+            continue
+        centrality = sum(math.log(1 + frequencies[word]) for word in set(words)) / math.sqrt(len(words))
+        overlap = len(title_words.intersection(words)) / (len(title_words) or 1)
+        scores.append(centrality + 2.0 * overlap)
+    return scores
+
+
+def _truncate(text: str, token_budget: int) -> str:
+    """The head of text within token_budget tokens, cut at a word boundary and marked with '…'"""
+    limit = max(0, token_budget * 4 - 1)
+    if len(text) <= limit + 1:
+        return text
+    head = text[:limit]
+    if " " in head:
+        head = head[:head.rindex(" ")]
+    return head.rstrip() + "…"
+
+
+def reduce_content(content: str, title: str = "", token_budget: int = 1200) -> str:
+    """
+    Page text for the agent prompt, at most token_budget tokens (estimated).
+
+    Boilerplate is stripped first. If the rest still does not fit, the document is cut
+    into equal segments that each get an equal share of the budget and keep their best
+    sentences, so the sample covers the whole page; skipped stretches are marked with '…'.
+    A sentence longer than a segment's share (e.g. text without punctuation) is cut to it.
+    """
+    paragraphs = strip_boilerplate(content or "")
+    text = "\n".join(paragraphs)
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    sentences = _split_sentences(paragraphs)
+    scores = _score_sentences(sentences, title)
+    segments = max(1, min(8, len(sentences) // 6))
+    segment_size = math.ceil(len(sentences) / segments)
+    share = token_budget / segments
+    # Otherwise a sentence that alone exceeds the share is never chosen
+    sentences = [_truncate(sentence, int(share) - 1) for sentence in sentences]
+
+    chosen = set()
+    spent = 0
+    leftovers = []
+    for start in range(0, len(sentences), segment_size):
+        ranked = sorted(range(start, min(start + segment_size, len(sentences))), key=lambda i: -scores[i])
+        segment_spent = 0
+        for i in ranked:
+            cost = estimate_tokens(sentences[i]) + 1
+            if segment_spent + cost <= share:
+                chosen.add(i)
+                segment_spent += cost
+            else:
+                leftovers.append(i)
+        spent += segment_spent
+
+    # Budget a segment could not use goes to the best sentences left anywhere
+    for i in sorted(leftovers, key=lambda i: -scores[i]):
+        cost = estimate_tokens(sentences[i]) + 1
+        if spent + cost <= token_budget:
+            chosen.add(i)
+            spent += cost
+
+    if not chosen:
+        return _truncate(text, token_budget)
+
+    parts = []
+    previous = -1
+    for i in sorted(chosen):
+        if i != previous + 1:
+            parts.append("…")
+        parts.append(sentences[i])
+        previous = i
+    if previous != len(sentences) - 1:
+        parts.append("…")
+    return "\n".join(parts)
+
+
+class ReductionStats:
+    """Prompt tokens sent with reduction versus the old 5000-character truncation"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"pages": 0, "input_tokens": 0, "legacy_tokens": 0, "reduced_tokens": 0, "seconds": 0.0}
+
+    def record(self, content: str, reduced: str, seconds: float):
+        with self._lock:
+            self._stats["pages"] += 1
+            self._stats["input_tokens"] += estimate_tokens(content)
+            self._stats["legacy_tokens"] += estimate_tokens(content[:LEGACY_CONTENT_CHARS])
+            self._stats["reduced_tokens"] += estimate_tokens(reduced)
+            self._stats["seconds"] += seconds
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        pages = stats.pop("pages")
+        seconds = stats.pop("seconds")
+        stats["pages"] = pages
+        stats["avg_reduce_ms"] = round(seconds / pages * 1000, 3) if pages else 0.0
+        return stats
+
+
+# ==================== BENCHMARK ====================
+
+def _benchmark(corpus_path: str, token_budget: int, with_agent: bool):
+    """
+    Corpus: JSON lines of {"url", "title", "content"} as sent by the extension. With
+    --agent, every page is analyzed twice (legacy truncation and reduced content) through
+    the real agent, which needs the backend's environment (OpenAI key, MongoDB).
+    """
+    import json
+    with open(corpus_path, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    legacy_tokens = reduced_tokens = 0
+    reduce_seconds = 0.0
+    reduced_pages = []
+    for page in corpus:
+        content = page.get("content", "")
+        start = time.perf_counter()
+        reduced = reduce_content(content, page.get("title", ""), token_budget)
+        reduce_seconds += time.perf_counter() - start
+        legacy_tokens += estimate_tokens(content[:LEGACY_CONTENT_CHARS])
+        reduced_tokens += estimate_tokens(reduced)
+        reduced_pages.append(reduced)
+
+    print(f"{len(corpus)} pages, budget {token_budget} tokens")
+    print(f"prompt content tokens: legacy {legacy_tokens / len(corpus):.0f}/page, "
+          f"reduced {reduced_tokens / len(corpus):.0f}/page")
+    print(f"reduction time: {reduce_seconds / len(corpus) * 1000:.2f} ms/page")
+    if not with_agent:
+        return
+
+    import asyncio
+    import new_server
+
+    async def verdict(page, content):
+        start = time.perf_counter()
+        result = await new_server.web_content_analysis(page["url"], page.get("title", ""), content, reduce=False)
+        return result["action"], time.perf_counter() - start
+
+    async def run():
+        agreed = 0
+        latency = {"legacy": 0.0, "reduced": 0.0}
+        for page, reduced in zip(corpus, reduced_pages):
+            legacy_action, legacy_seconds = await verdict(page, page.get("content", "")[:LEGACY_CONTENT_CHARS])
+            reduced_action, reduced_seconds = await verdict(page, reduced)
+            agreed += legacy_action == reduced_action
+            latency["legacy"] += legacy_seconds
+            latency["reduced"] += reduced_seconds
+        print(f"agent latency: legacy {latency['legacy'] / len(corpus):.2f} s/page, "
+              f"reduced {latency['reduced'] / len(corpus):.2f} s/page")
+        print(f"verdict agreement: {agreed}/{len(corpus)} ({agreed / len(corpus):.1%})")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark content reduction on a recorded corpus")
+    parser.add_argument("corpus", help="JSON lines of {url, title, content}")
+    parser.add_argument("--budget", type=int, default=1200, help="Token budget (default: 1200)")
+    parser.add_argument("--agent", action="store_true", help="Also compare agent latency and verdicts")
+    args = parser.parse_args()
+    _benchmark(args.corpus, args.budget, args.agent)
@@ -0,0 +1,188 @@
+"""
+DB Indexes - Declared indexes for the data layer, and a query-plan self-check
+Responsibilities:
+1. Declare, in one place, every index the server's hot list / appeal / approval / config queries need
+2. Bring a database in line with the declarations at startup: create missing indexes and
+   rebuild any whose keys or options changed since they were created
+3. Register those hot queries and run explain() on each; a COLLSCAN fails the check
+
+Usage:
+    python db_indexes.py --apply    # create / migrate the declared indexes
+    python db_indexes.py --check    # explain every hot query, exit 1 on a collection scan
+
+The verdict and transcript caches create their own indexes (their TTL comes from
+their configuration), but their lookups are registered here so the check covers them.
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING
+
+from url_matcher import AI_REASONS
+
+
+class IndexSpec:
+    """One declared index; named like Mongo's default ('status_1_timestamp_-1')"""
+
+    def __init__(self, collection: str, keys: List[tuple], unique: bool = False):
+        self.collection = collection
+        self.keys = keys
+        self.unique = unique
+        self.name = "_".join(f"{field}_{direction}" for field, direction in keys)
+
+    def matches(self, info: Dict) -> bool:
+        """Whether an index_information() entry already is this index"""
+        keys = [(field, int(direction)) for field, direction in info.get("key", [])]
+        return keys == self.keys and bool(info.get("unique", False)) == self.unique
+
+    def __repr__(self):
+        return f"{self.collection}.{self.name}{' (unique)' if self.unique else ''}"
+
+
+class HotQuery:
+    """A query shape the server runs on its request path, which must be served by an index"""
+
+    def __init__(self, name: str, collection: str, query: Dict, sort: Optional[List[tuple]] = None):
+        self.name = name
+        self.collection = collection
+        self.query = query
+        self.sort = sort
+
+
+# Stale-verdict queries filter automatic verdicts by reason and prompt version
+_VERDICT_INDEX = [("reason", ASCENDING), ("prompt_hash", ASCENDING)]
+
+INDEXES = [
+    IndexSpec("whitelist", [("link", ASCENDING)], unique=True),
+    IndexSpec("whitelist", _VERDICT_INDEX),
+    IndexSpec("blacklist", [("link", ASCENDING)], unique=True),
+    IndexSpec("blacklist", _VERDICT_INDEX),
+    IndexSpec("whitelist_desktop", [("app", ASCENDING)], unique=True),
+    IndexSpec("blacklist_desktop", [("app", ASCENDING)], unique=True),
+    IndexSpec("blacklist_desktop", _VERDICT_INDEX),
+    IndexSpec("appeals", [("link", ASCENDING)]),
+    # Not unique: appeal ids are second-resolution timestamps and older data may repeat them
+    IndexSpec("appeals", [("appeal_id", ASCENDING)]),
+    IndexSpec("pending_approvals", [("approval_id", ASCENDING)], unique=True),
+    # The dashboard lists one status newest first: equality then sort, so no in-memory sort
+    IndexSpec("pending_approvals", [("status", ASCENDING), ("timestamp", DESCENDING), ("approval_id", DESCENDING)]),
+    IndexSpec("config", [("type", ASCENDING)]),
+]
+
+_UNVERSIONED = {"reason": {"$in": list(AI_REASONS)}, "prompt_hash": {"$exists": False}}
+
+HOT_QUERIES = [
+    HotQuery("list lookup", "whitelist", {"link": "example.com"}),
+    HotQuery("list lookup", "blacklist", {"link": "example.com"}),
+    HotQuery("drop automatic verdict", "blacklist", {"link": "example.com", "reason": {"$in": list(AI_REASONS)}}),
+    HotQuery("stamp unversioned verdicts", "whitelist", _UNVERSIONED),
+    HotQuery("stamp unversioned verdicts", "blacklist", _UNVERSIONED),
+    HotQuery("desktop list lookup", "whitelist_desktop", {"app": "steam.exe"}),
+    HotQuery("desktop list lookup", "blacklist_desktop", {"app": "steam.exe"}),
+    HotQuery("drop automatic desktop block", "blacklist_desktop", {"app": "steam.exe", "reason": "AI Analysis"}),
+    HotQuery("stamp unversioned desktop blocks", "blacklist_desktop",
+             {"reason": {"$in": ["AI Analysis"]}, "prompt_hash": {"$exists": False}}),
+    HotQuery("appeal by id", "appeals", {"appeal_id": "appeal_0"}),
+    HotQuery("appeals of a page", "appeals", {"link": "example.com/page"}),
+    HotQuery("approval by id", "pending_approvals", {"approval_id": "approval_0"}),
+    HotQuery("approvals by status", "pending_approvals", {"status": "awaiting_parent"},
+             sort=[("timestamp", DESCENDING), ("approval_id", DESCENDING)]),
+    HotQuery("monitoring config", "config", {"type": "monitoring_rules"}),
+    HotQuery("verdict cache lookup", "verdict_cache", {"key": "0:0", "created_at": {"$gt": datetime(2000, 1, 1)}}),
+    HotQuery("transcript cache lookup", "transcript_cache",
+             {"video_id": "0", "created_at": {"$gt": datetime(2000, 1, 1)}}),
+]
+
+
+# ==================== MIGRATION ====================
+
+def ensure_indexes(database) -> Dict[str, List[str]]:
+    """Create missing declared indexes and rebuild changed ones. Returns what was done."""
+    report = {"created": [], "rebuilt": []}
+    for spec in INDEXES:
+        col = database[spec.collection]
+        existing = col.index_information().get(spec.name)
+        if existing is not None:
+            if spec.matches(existing):
+                continue
+            print(f"Rebuilding index {spec}: was {existing}")
+            col.drop_index(spec.name)
+            report["rebuilt"].append(repr(spec))
+        else:
+            report["created"].append(repr(spec))
+        col.create_index(spec.keys, name=spec.name, unique=spec.unique)
+    return report
+
+
+# ==================== SELF-CHECK ====================
+
+def _plan_stages(plan) -> List[str]:
+    """Every 'stage' in an explain() plan, whatever the nesting (classic or slot-based engine)"""
+    stages = []
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_plan_stages(value))
+    return stages
+
+
+def explain_hot_queries(database) -> List[Dict]:
+    """explain() every registered hot query: [{query, stages, collscan, in_memory_sort}]"""
+    results = []
+    for hot in HOT_QUERIES:
+        cursor = database[hot.collection].find(hot.query)
+        if hot.sort:
+            cursor = cursor.sort(hot.sort)
+        stages = _plan_stages(cursor.explain().get("queryPlanner", {}).get("winningPlan", {}))
+        results.append({
+            "query": f"{hot.collection}: {hot.name}",
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages,
+        })
+    return results
+
+
+def self_check(database) -> bool:
+    """Print the plan of every hot query; False if any of them scans a whole collection"""
+    ok = True
+    for result in explain_hot_queries(database):
+        if result["collscan"]:
+            ok = False
+            status = "FAIL COLLSCAN"
+        elif result["in_memory_sort"]:
+            status = "WARN in-memory sort"
+        else:
+            status = "ok"
+        print(f"{status:<20} {result['query']:<52} {' > '.join(result['stages'])}")
+    if not ok:
+        print("\nIndex self-check FAILED: hot queries are scanning whole collections. "
+              "Run `python db_indexes.py --apply` (and start the server once for the cache indexes).",
+              file=sys.stderr)
+    return ok
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Create and verify the data layer's indexes")
+    parser.add_argument("--apply", action="store_true", help="Create / migrate the declared indexes")
+    parser.add_argument("--check", action="store_true", help="explain() the hot queries; exit 1 on a COLLSCAN")
+    args = parser.parse_args(argv)
+
+    from smart_db_manager import db
+
+    if args.apply or not args.check:
+        report = ensure_indexes(db)
+        print(f"Indexes created: {report['created'] or 'none'}; rebuilt: {report['rebuilt'] or 'none'}")
+    if args.check and not self_check(db):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
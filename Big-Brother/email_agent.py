@@ -7,30 +7,20 @@ Responsibilities:
 4. Process parent responses and update whitelist/blacklist accordingly
 """
 
-import os
 import threading
 import time
 from typing import Dict, Optional
 from datetime import datetime
-from pymongo import MongoClient
-from agents import Agent, Runner
+from agents import Agent
 from pydantic import BaseModel
-import asyncio
 import re
 
 # Import Gmail Agent
 from Agent_Tools.Email.gmail_agent import GmailAgent
-
-# MongoDB connection
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-client = MongoClient(MONGO_URI)
-db = client["NorthlightDB"]
-
-pending_approvals_col = db["pending_approvals"]
-whitelist_col = db["whitelist"]
-blacklist_col = db["blacklist"]
-config_col = db["config"]
-appeals_col = db["appeals"]
+from list_replica import refresh_key
+import llm_runtime
+import llm_scheduler
+import smart_db_manager
 
 # Gmail Agent instance (will be initialized when needed)
 _gmail_agent = None
@@ -47,8 +37,8 @@ def get_gmail_agent():
 
 
 def get_parent_email():
-    """Get parent email from config"""
-    config = config_col.find_one({"type": "monitoring_rules"})
+    """Get parent email from config (the cached copy shared with the server)"""
+    config = smart_db_manager.get_config()
     if config and config.get("parent_email"):
         return config["parent_email"]
     return None
@@ -95,7 +85,7 @@ async def parse_parent_response(email_subject: str, email_body: str) -> Optional
         Extract the approval_id from the email.
         """
 
-        result = await Runner.run(email_response_agent, prompt)
+        result = await llm_scheduler.run(email_response_agent, prompt, priority="background")
         structured = result.final_output_as(EmailResponseJSON)
         return structured
     except Exception as e:
@@ -185,11 +175,11 @@ def send_approval_request_email(approval_id: str, link: str, appeal_reason: str)
             return
 
         # Get the original blocking reason
-        blacklist_entry = blacklist_col.find_one({"link": link})
+        blacklist_entry = smart_db_manager.find_list_entry("blacklist", link)
         blocking_reason = blacklist_entry.get("reason", "Not specified") if blacklist_entry else "Not specified"
 
         # Check if this was escalated from AI
-        pending_approval = pending_approvals_col.find_one({"approval_id": approval_id})
+        pending_approval = smart_db_manager.get_approval(approval_id)
         escalated_from_ai = pending_approval.get("escalated_from_ai", False) if pending_approval else False
         ai_decision = pending_approval.get("ai_decision", "") if pending_approval else ""
 
@@ -283,7 +273,7 @@ def process_parent_response(message: Dict):
             return
 
         # Check if this approval request exists
-        approval_request = pending_approvals_col.find_one({"approval_id": approval_id})
+        approval_request = smart_db_manager.get_approval(approval_id)
 
         if not approval_request:
             print(f"⚠️ No pending approval found for ID: {approval_id}")
@@ -297,10 +287,7 @@ def process_parent_response(message: Dict):
             return
 
         # Parse parent's response using AI agent
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        parsed_response = loop.run_until_complete(parse_parent_response(subject, body))
-        loop.close()
+        parsed_response = llm_runtime.run_sync(parse_parent_response(subject, body))
 
         if not parsed_response:
             print(f"❌ Failed to parse parent response for {approval_id}")
@@ -311,31 +298,29 @@ def process_parent_response(message: Dict):
 
         if parsed_response.decision.lower() == "approve":
             # Parent approved - add to whitelist
-            whitelist_col.insert_one({
+            smart_db_manager.insert_list_entry("whitelist", {
                 "link": link,
                 "added_at": datetime.now(),
                 "reason": f"Parent approved via email: {parsed_response.reasoning}"
             })
 
             # Remove from blacklist
-            blacklist_col.delete_one({"link": link})
+            smart_db_manager.delete_list_entry("blacklist", link)
+
+            # Keep the server's in-memory lists in step with the change
+            refresh_key("whitelist", link)
+            refresh_key("blacklist", link)
 
             # Update pending approval status
-            pending_approvals_col.update_one(
-                {"approval_id": approval_id},
-                {"$set": {
-                    "status": "parent_approved",
-                    "parent_response": body,
-                    "processed_at": datetime.now()
-                }}
-            )
+            smart_db_manager.update_approval(approval_id, {
+                "status": "parent_approved",
+                "parent_response": body,
+                "processed_at": datetime.now()
+            })
 
             # Update appeal status
             if appeal_id:
-                appeals_col.update_one(
-                    {"appeal_id": appeal_id},
-                    {"$set": {"status": "parent_approved"}}
-                )
+                smart_db_manager.update_appeal(appeal_id, {"status": "parent_approved"})
 
             print(f"✅ Parent APPROVED {link} - Added to whitelist")
 
@@ -347,34 +332,30 @@ def process_parent_response(message: Dict):
             was_reversed = False
             if approval_request.get("status") == "auto_approved":
                 # Parent is reversing an auto-approval - remove from whitelist and add to blacklist
-                whitelist_col.delete_one({"link": link})
-                blacklist_col.insert_one({
+                smart_db_manager.delete_list_entry("whitelist", link)
+                smart_db_manager.insert_list_entry("blacklist", {
                     "link": link,
                     "added_at": datetime.now(),
                     "reason": "Parent blocked via email",
                     "parental_reasoning": f"Parent reversed AI auto-approval: {parsed_response.reasoning}"
                 })
+                refresh_key("whitelist", link)
+                refresh_key("blacklist", link)
                 print(f"✅ Parent REVERSED auto-approval for {link} - Removed from whitelist and added to blacklist")
                 was_reversed = True
             else:
                 print(f"✅ Parent DENIED {link} - Keeping blocked")
 
             # Update pending approval status
-            pending_approvals_col.update_one(
-                {"approval_id": approval_id},
-                {"$set": {
-                    "status": "parent_denied",
-                    "parent_response": body,
-                    "processed_at": datetime.now()
-                }}
-            )
+            smart_db_manager.update_approval(approval_id, {
+                "status": "parent_denied",
+                "parent_response": body,
+                "processed_at": datetime.now()
+            })
 
             # Update appeal status
             if appeal_id:
-                appeals_col.update_one(
-                    {"appeal_id": appeal_id},
-                    {"$set": {"status": "parent_denied"}}
-                )
+                smart_db_manager.update_appeal(appeal_id, {"status": "parent_denied"})
 
             # Send confirmation email
             send_parent_confirmation(approval_id, link, "denied", was_reversed=was_reversed)
@@ -0,0 +1,142 @@
+"""
+List Changelog - Versioned change log over list replicas, for delta sync to the monitors
+Responsibilities:
+1. Record every key that is added, changed or removed in the attached lists, in order,
+   under one monotonically increasing sequence number
+2. Diff full resyncs against the previous contents, so a periodic resync costs clients nothing
+3. Answer "what changed since version V" with each changed key's net state (added or removed),
+   or with a full snapshot when V is unknown, from another server run, or too far behind
+
+Versions are opaque tokens '<epoch>.<seq>.<context>'. The context is chosen by the caller
+(e.g. the prompt fingerprint the blacklist is filtered by); when it differs from the
+client's, the entries its filter admits may have changed wholesale, so it forces a snapshot.
+"""
+
+import threading
+import uuid
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional
+
+# Changes on every restart: sequence numbers of another run mean nothing to this one
+_EPOCH = uuid.uuid4().hex[:8]
+
+
+class ListChangeLog:
+    """Bounded change log over one or more ListReplicas"""
+
+    def __init__(self, max_changes: int = 10000, max_delta: int = 2000):
+        self.max_changes = max_changes
+        self.max_delta = max_delta  # More changed keys than this and a snapshot is cheaper to send and apply
+
+        self._entries: Dict[str, Dict[str, dict]] = {}  # list -> key -> entry, as of the newest seq
+        self._loaded = set()  # Lists whose replica has done its first full load
+        self._changes = deque()  # (seq, list_name, key)
+        self._seq = 0
+        self._floor = 0  # Changes up to and including this seq are no longer in the log
+        self._lock = threading.Lock()
+        self._stats = {"deltas": 0, "snapshots": 0, "unchanged": 0}
+
+    # ==================== MAINTENANCE ====================
+
+    def attach(self, list_name: str, replica):
+        """Log this list's changes as the replica sees them"""
+        self._entries.setdefault(list_name, {})
+        replica.add_listener(
+            on_put=lambda key, entry: self._put(list_name, key, entry),
+            on_discard=lambda key: self._discard(list_name, key),
+            on_reset=lambda entries: self._reset(list_name, entries),
+        )
+
+    def _record(self, list_name: str, key: str):
+        """Append one change. Caller must hold the lock."""
+        self._seq += 1
+        self._changes.append((self._seq, list_name, key))
+        while len(self._changes) > self.max_changes:
+            self._floor = self._changes.popleft()[0]
+
+    def _put(self, list_name: str, key: str, entry: dict):
+        with self._lock:
+            self._entries[list_name][key] = entry
+            self._record(list_name, key)
+
+    def _discard(self, list_name: str, key: str):
+        with self._lock:
+            if self._entries[list_name].pop(key, None) is not None:
+                self._record(list_name, key)
+
+    def _reset(self, list_name: str, entries: Dict[str, dict]):
+        with self._lock:
+            previous = self._entries[list_name]
+            self._entries[list_name] = dict(entries)
+            if list_name not in self._loaded:
+                self._loaded.add(list_name)
+                return  # First load: no client can hold a version of this run yet
+            for key in previous.keys() | entries.keys():
+                if previous.get(key) != entries.get(key):
+                    self._record(list_name, key)
+
+    # ==================== READS ====================
+
+    def version(self, context: str = "") -> str:
+        return f"{_EPOCH}.{self._seq}.{context}"
+
+    def _since_seq(self, since: Optional[str], context: str) -> Optional[int]:
+        """The sequence number a client token stands for, or None if only a snapshot will do"""
+        try:
+            epoch, seq, token_context = (since or "").split(".", 2)
+            seq = int(seq)
+        except ValueError:
+            return None
+        if epoch != _EPOCH or token_context != context or not self._floor <= seq <= self._seq:
+            return None
+        return seq
+
+    def changes_since(self, since: Optional[str], lists: Dict[str, Optional[Callable[[dict], bool]]],
+                      context: str = "") -> Dict:
+        """
+        {"version", "full", list_name: {"added": [...], "removed": [...]}} for the given lists,
+        each with an optional keep(entry) filter. With full=True, 'added' is the whole list
+        and the client replaces its copy; otherwise it applies added and removed to it.
+        """
+        with self._lock:
+            seq = self._since_seq(since, context)
+            changed = None
+            if seq is not None:
+                changed = {name: set() for name in lists}
+                count = 0
+                # Newest first, stopping at the client's version
+                for change_seq, list_name, key in reversed(self._changes):
+                    if change_seq <= seq:
+                        break
+                    if list_name in changed and key not in changed[list_name]:
+                        changed[list_name].add(key)
+                        count += 1
+                        if count > self.max_delta:
+                            changed = None
+                            break
+            body = {"version": self.version(context), "full": changed is None}
+            for list_name, keep in lists.items():
+                entries = self._entries.get(list_name, {})
+                keys: Iterable[str] = entries if changed is None else changed[list_name]
+                added, removed = [], []
+                for key in keys:
+                    entry = entries.get(key)
+                    if entry is not None and (keep is None or keep(entry)):
+                        added.append(key)
+                    elif changed is not None:
+                        removed.append(key)
+                body[list_name] = {"added": sorted(added), "removed": sorted(removed)}
+
+        if changed is None:
+            self._stats["snapshots"] += 1
+        elif any(body[name]["added"] or body[name]["removed"] for name in lists):
+            self._stats["deltas"] += 1
+        else:
+            self._stats["unchanged"] += 1
+        return body
+
+    def snapshot(self) -> Dict:
+        """Counters for the metrics endpoint"""
+        stats = dict(self._stats)
+        stats.update({"version": self._seq, "logged_changes": len(self._changes), "floor": self._floor})
+        return stats
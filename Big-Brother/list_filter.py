@@ -0,0 +1,252 @@
+"""
+List Filter - Compact probabilistic snapshot of the URL and desktop lists for client-side pre-checks
+Responsibilities:
+1. Build one Bloom filter per list (URL blacklist/whitelist, desktop blacklist/whitelist),
+   sized for a target false-positive rate
+2. Carry an exact exception set per filter: keys known to be on another list that the
+   filter would wrongly report, so listed apps and sites never collide with each other
+3. Encode the filters into one versioned binary snapshot, and decode it again (the reference
+   reader for clients)
+4. Report size and false-positive rate (estimated and measured) as the lists grow
+
+A client tests the candidate keys of a URL (url_candidate_keys) or an app name against a
+filter. No candidate reported means the key is definitely not on that list; a reported
+candidate only means it may be, and the server decides.
+
+Binary format (big-endian):
+    "NLBF" | u8 format | u16 len, version (utf-8) | u8 section count | sections
+    section: u8 len, name | u32 entries | u32 bits | u8 hashes | u32 exception count
+             | bits / 8 bytes of filter | exceptions, each u16 len + utf-8
+Bit positions of a key: h1, h2 = the first two big-endian u32 of SHA-256(key), h2 forced
+odd; position i (0 <= i < hashes) is (h1 + i * h2) mod bits, bit (p % 8) of byte p // 8.
+"""
+
+import hashlib
+import math
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from url_canonicalizer import canonicalize_url
+from url_matcher import split_url
+
+MAGIC = b"NLBF"
+FORMAT_VERSION = 1
+
+# Smallest filter: double hashing into very few bits yields too few distinct position sequences
+MIN_BITS = 1024
+
+# Keys no list contains, probed to measure each filter's real false-positive rate
+_PROBES = [f"probe-{i}.invalid/{i}" for i in range(2000)]
+
+
+# ==================== KEYS ====================
+
+def _rule_key(labels: List[str], segments: List[str], query: str) -> str:
+    key = ".".join(reversed(labels)) + "".join("/" + segment for segment in segments)
+    return f"{key}?{query}" if query else key
+
+
+def url_rule_key(link: str) -> Optional[str]:
+    """The form a URL list key is stored in a filter (host, path segments, query), or None"""
+    labels, segments, query = split_url(link)
+    return _rule_key(labels, segments, query) if labels else None
+
+
+def url_candidate_keys(link: str) -> List[str]:
+    """
+    Every rule key that could cover a URL (see url_matcher): each host suffix, with each
+    path prefix, and the full path with its query
+    """
+    labels, segments, query = split_url(canonicalize_url(link))
+    keys = []
+    for host_depth in range(1, len(labels) + 1):
+        host = labels[:host_depth]
+        for path_depth in range(len(segments) + 1):
+            keys.append(_rule_key(host, segments[:path_depth], ""))
+        if query:
+            keys.append(_rule_key(host, segments, query))
+    return keys
+
+
+# ==================== BLOOM FILTER ====================
+
+class BloomFilter:
+    """Fixed-size Bloom filter with SHA-256 double hashing"""
+
+    def __init__(self, bits: int, hashes: int, data: Optional[bytearray] = None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = data if data is not None else bytearray(bits // 8)
+
+    @classmethod
+    def sized_for(cls, entries: int, fp_rate: float) -> "BloomFilter":
+        """Optimal bits and hash count for entries keys at fp_rate (at least MIN_BITS)"""
+        entries = max(entries, 1)
+        bits = math.ceil(-entries * math.log(fp_rate) / math.log(2) ** 2)
+        bits = max(MIN_BITS, (bits + 7) // 8 * 8)
+        hashes = min(16, max(1, round(bits / entries * math.log(2))))
+        return cls(bits, hashes)
+
+    def _positions(self, key: str):
+        h1, h2 = struct.unpack(">II", hashlib.sha256(key.encode("utf-8")).digest()[:8])
+        h2 |= 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def estimated_fp_rate(self, entries: int) -> float:
+        return (1 - math.exp(-self.hashes * entries / self.bits)) ** self.hashes
+
+
+class FilterSection:
+    """The filter of one list, with its exception set"""
+
+    def __init__(self, name: str, bloom: BloomFilter, entries: int, exceptions: Iterable[str] = ()):
+        self.name = name
+        self.bloom = bloom
+        self.entries = entries
+        self.exceptions = set(exceptions)
+
+    def might_contain(self, keys: Iterable[str]) -> bool:
+        """False only if none of keys is on this list"""
+        return any(key in self.bloom and key not in self.exceptions for key in keys)
+
+    def report(self) -> Dict:
+        measured = sum(probe in self.bloom for probe in _PROBES) / len(_PROBES)
+        return {
+            "entries": self.entries,
+            "bits": self.bloom.bits,
+            "hashes": self.bloom.hashes,
+            "bytes": len(self.bloom.data),
+            "bits_per_entry": round(self.bloom.bits / self.entries, 1) if self.entries else None,
+            "exceptions": len(self.exceptions),
+            "estimated_fp_rate": round(self.bloom.estimated_fp_rate(self.entries), 5),
+            "measured_fp_rate": round(measured, 5),
+        }
+
+
+# ==================== SNAPSHOT ====================
+
+class ListFilterSnapshot:
+    """One versioned set of list filters"""
+
+    def __init__(self, version: str, sections: Dict[str, FilterSection]):
+        self.version = version
+        self.sections = sections
+
+    @classmethod
+    def build(cls, version: str, lists: Dict[str, Iterable[str]], fp_rate: float = 0.01) -> "ListFilterSnapshot":
+        """Filter every list of keys; any key of another list the filter reports becomes an exception"""
+        lists = {name: set(keys) for name, keys in lists.items()}
+        sections = {}
+        for name, keys in lists.items():
+            bloom = BloomFilter.sized_for(len(keys), fp_rate)
+            for key in keys:
+                bloom.add(key)
+            others = set().union(*(other for other_name, other in lists.items() if other_name != name))
+            exceptions = [key for key in others - keys if key in bloom]
+            sections[name] = FilterSection(name, bloom, len(keys), exceptions)
+        return cls(version, sections)
+
+    def might_contain(self, name: str, keys: Iterable[str]) -> bool:
+        return self.sections[name].might_contain(keys)
+
+    def encode(self) -> bytes:
+        version = self.version.encode("utf-8")
+        parts = [MAGIC, struct.pack(">BH", FORMAT_VERSION, len(version)), version,
+                 struct.pack(">B", len(self.sections))]
+        for name, section in self.sections.items():
+            raw_name = name.encode("utf-8")
+            parts.append(struct.pack(">B", len(raw_name)) + raw_name)
+            parts.append(struct.pack(">IIBI", section.entries, section.bloom.bits, section.bloom.hashes,
+                                     len(section.exceptions)))
+            parts.append(bytes(section.bloom.data))
+            for key in sorted(section.exceptions):
+                raw_key = key.encode("utf-8")
+                parts.append(struct.pack(">H", len(raw_key)) + raw_key)
+        return b"".join(parts)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "ListFilterSnapshot":
+        """Parse an encoded snapshot. Raises ValueError if it is not one this reader understands."""
+        if data[:4] != MAGIC:
+            raise ValueError("not a list filter snapshot")
+        offset = 4
+
+        def take(fmt: str) -> Tuple:
+            nonlocal offset
+            values = struct.unpack_from(fmt, data, offset)
+            offset += struct.calcsize(fmt)
+            return values
+
+        def take_bytes(length: int) -> bytes:
+            nonlocal offset
+            offset += length
+            return data[offset - length:offset]
+
+        try:
+            format_version, version_length = take(">BH")
+            if format_version != FORMAT_VERSION:
+                raise ValueError(f"unsupported list filter format {format_version}")
+            version = take_bytes(version_length).decode("utf-8")
+            sections = {}
+            for _ in range(take(">B")[0]):
+                name = take_bytes(take(">B")[0]).decode("utf-8")
+                entries, bits, hashes, exception_count = take(">IIBI")
+                bloom = BloomFilter(bits, hashes, bytearray(take_bytes(bits // 8)))
+                exceptions = [take_bytes(take(">H")[0]).decode("utf-8") for _ in range(exception_count)]
+                sections[name] = FilterSection(name, bloom, entries, exceptions)
+        except struct.error:
+            raise ValueError("truncated list filter snapshot")
+        return cls(version, sections)
+
+    def report(self) -> Dict:
+        """Encoded size, and the size and false-positive rate of every filter"""
+        sections = {name: section.report() for name, section in self.sections.items()}
+        return {
+            "version": self.version,
+            "bytes": len(self.encode()),
+            "sections": sections,
+        }
+
+
+class ListFilterCache:
+    """The encoded snapshot for the current list versions, rebuilt only when they change"""
+
+    def __init__(self, fp_rate: float = 0.01):
+        self.fp_rate = fp_rate
+        self._snapshot: Optional[ListFilterSnapshot] = None
+        self._body = b""
+        self._report: Dict = {}
+        self._lock = threading.Lock()
+        self._stats = {"builds": 0, "served": 0, "build_ms": 0.0}
+
+    def get(self, version: str, lists: Callable[[], Dict[str, Iterable[str]]]) -> Tuple[ListFilterSnapshot, bytes]:
+        """(snapshot, encoded body) at version; lists() supplies the keys when a rebuild is needed"""
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                started = time.perf_counter()
+                snapshot = ListFilterSnapshot.build(version, lists(), self.fp_rate)
+                self._body = snapshot.encode()
+                self._snapshot = snapshot
+                self._report = snapshot.report()
+                self._stats["builds"] += 1
+                self._stats["build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self._stats["served"] += 1
+            return self._snapshot, self._body
+
+    def report(self) -> Dict:
+        """The last build's report ({} before the first)"""
+        return dict(self._report)
+
+    def snapshot(self) -> Dict:
+        stats = dict(self._stats)
+        stats.update({"fp_rate": self.fp_rate, "bytes": len(self._body)})
+        return stats
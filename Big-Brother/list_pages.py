@@ -0,0 +1,148 @@
+"""
+List Pages - Keyset pagination and conditional responses for the dashboard's list endpoints
+Responsibilities:
+1. Parse and validate page requests: filters, sort field and order, field projection, limit, cursor
+2. Page list entries by keyset (the last row's sort value and key), which stays stable
+   while entries are added or removed between page fetches, unlike offsets
+3. Weak ETags derived from a list version and the request's parameters, so an unchanged
+   poll is answered 304 without reading or serializing the list
+"""
+
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAX_PAGE_SIZE = 500
+
+# Changes on every restart, so an ETag never outlives the in-memory versions it was derived from
+_EPOCH = uuid.uuid4().hex[:8]
+
+
+class PageRequest:
+    """Validated page parameters of one list request"""
+
+    def __init__(self, sort: str, descending: bool, limit: Optional[int], after: Optional[tuple],
+                 fields: Optional[List[str]], filters: Dict[str, str], query: str):
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit  # None: the whole list, as a bare array (what older clients expect)
+        self.after = after
+        self.fields = fields
+        self.filters = filters
+        self.query = query
+
+
+def parse_page_args(args, sort_fields: Iterable[str], default_sort: str, default_order: str = "asc",
+                    filter_fields: Iterable[str] = ()) -> PageRequest:
+    """
+    Read ?sort=&order=&limit=&cursor=&fields=&q= plus equality filters from request args.
+    Raises ValueError with a message for the client on bad parameters.
+    """
+    sort = args.get("sort", default_sort)
+    if sort not in sort_fields:
+        raise ValueError(f"sort must be one of: {', '.join(sort_fields)}")
+    order = args.get("order", default_order).lower()
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc or desc")
+
+    limit = args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    after = decode_cursor(args["cursor"]) if args.get("cursor") else None
+    fields = [field.strip() for field in args["fields"].split(",") if field.strip()] if args.get("fields") else None
+    filters = {field: args[field] for field in filter_fields if args.get(field)}
+    return PageRequest(sort, order == "desc", limit, after, fields, filters, args.get("q", "").strip().lower())
+
+
+# ==================== CURSORS ====================
+
+def sort_value(value):
+    """A JSON-safe, totally ordered form of a sort field (missing values sort first)"""
+    if value is None:
+        return [0, ""]
+    if isinstance(value, bool):
+        return [1, int(value)]
+    if isinstance(value, (int, float)):
+        return [1, value]
+    if isinstance(value, datetime):
+        return [2, value.isoformat(timespec="microseconds")]
+    return [3, str(value)]
+
+
+def encode_cursor(value, key) -> str:
+    raw = json.dumps([sort_value(value), key], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple:
+    try:
+        value, key = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return tuple(value), key
+    except (ValueError, TypeError):
+        raise ValueError("cursor is not valid for this list")
+
+
+def cursor_datetime(after: tuple) -> Optional[datetime]:
+    """The datetime a cursor was positioned at, for keyset queries on a date field"""
+    (rank, value), _ = after
+    return datetime.fromisoformat(value) if rank == 2 else None
+
+
+# ==================== PAGING ====================
+
+def project(entry: Dict, fields: Optional[List[str]], key_field: str) -> Dict:
+    """Drop Mongo's _id, and keep only fields (plus the key) when given"""
+    if fields:
+        return {field: entry[field] for field in [key_field] + fields if field in entry}
+    return {field: value for field, value in entry.items() if field != "_id"}
+
+
+def page_entries(entries: Iterable[Dict], page: PageRequest, key_field: str) -> Tuple[List[Dict], Optional[str]]:
+    """Filter, sort and slice in-memory entries. Returns (items, next_cursor or None)."""
+    selected = [
+        entry for entry in entries
+        if (not page.query or page.query in str(entry.get(key_field, "")).lower())
+        and all(str(entry.get(field)) == value for field, value in page.filters.items())
+    ]
+
+    def order_key(entry):
+        return tuple(sort_value(entry.get(page.sort))), entry.get(key_field, "")
+
+    selected.sort(key=order_key, reverse=page.descending)
+    if page.after is not None:
+        after = (tuple(page.after[0]), page.after[1])
+        selected = [entry for entry in selected
+                    if (order_key(entry) < after if page.descending else order_key(entry) > after)]
+
+    next_cursor = None
+    if page.limit is not None and len(selected) > page.limit:
+        selected = selected[:page.limit]
+        last = selected[-1]
+        next_cursor = encode_cursor(last.get(page.sort), last.get(key_field, ""))
+    return [project(entry, page.fields, key_field) for entry in selected], next_cursor
+
+
+def page_body(items: List[Dict], next_cursor: Optional[str], page: PageRequest, version: str):
+    """A bare array for unpaged requests (the dashboard's original format), else a page envelope"""
+    if page.limit is None:
+        return items
+    return {"items": items, "next_cursor": next_cursor, "version": version}
+
+
+# ==================== CONDITIONAL REQUESTS ====================
+
+def list_version(*parts) -> str:
+    return ".".join([_EPOCH] + [str(part) for part in parts])
+
+
+def list_etag(name: str, version: str, args) -> str:
+    """Weak ETag for one list at one version, as requested with these parameters"""
+    params = "&".join(f"{key}={value}" for key, value in sorted(args.items(multi=True)))
+    return f"{name}.{version}.{uuid.uuid5(uuid.NAMESPACE_URL, params).hex[:12]}"
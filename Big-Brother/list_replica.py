@@ -0,0 +1,261 @@
+"""
+List Replica - Process-local, read-mostly copies of the URL and desktop lists
+Responsibilities:
+1. Hold an in-memory snapshot of a list collection keyed by 'link' or 'app'
+2. Stay current through write-through updates from the mutating helpers
+3. Tail a MongoDB change stream when the deployment supports it (replica sets)
+4. Fall back to a bounded periodic full resync so drift can never outlive resync_interval
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+from pymongo.errors import PyMongoError
+
+# Replicas by collection name, so other modules can invalidate them without importing the server
+_registry: Dict[str, "ListReplica"] = {}
+
+
+class ListReplica:
+    """In-memory mirror of one list collection"""
+
+    def __init__(self, collection, key_field: str, resync_interval: float = 60):
+        self.collection = collection
+        self.key_field = key_field
+        self.resync_interval = resync_interval
+
+        self._entries: Dict[str, dict] = {}
+        self._keys_by_id: Dict[object, str] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._resyncing = False
+        self._journal = []  # Mutations seen while a resync is reading the collection
+        self._thread = None
+        self._running = False
+        self._listeners = []  # Derived indexes fed from this replica
+
+        self.version = 0
+        self.last_resync = 0.0
+        self._stats = {"hits": 0, "misses": 0, "resyncs": 0, "change_events": 0, "change_stream": False}
+
+        _registry[collection.name] = self
+
+    # ==================== READS ====================
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the entry for key, or None"""
+        self._ensure_loaded()
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats["misses"] += 1
+        else:
+            self._stats["hits"] += 1
+        return entry
+
+    def contains(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def keys(self):
+        self._ensure_loaded()
+        return list(self._entries)
+
+    def items(self):
+        """Snapshot of (key, entry) pairs, for bulk readers that should not count as lookups"""
+        self._ensure_loaded()
+        return list(self._entries.items())
+
+    def current_version(self) -> int:
+        """Version of the loaded contents (loading them first); bumped on every change"""
+        self._ensure_loaded()
+        return self.version
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ==================== WRITE-THROUGH ====================
+
+    def put(self, doc: dict):
+        """Record an inserted or updated document"""
+        with self._lock:
+            self._apply("put", doc)
+
+    def discard(self, key: str):
+        """Record a deleted key"""
+        with self._lock:
+            self._apply("discard", key)
+
+    def reload_key(self, key: str):
+        """Re-read a single key after an in-place update"""
+        try:
+            doc = self.collection.find_one({self.key_field: key})
+        except PyMongoError as e:
+            print(f"Warning: could not refresh {self.collection.name}/{key}: {e}")
+            return
+        if doc is None:
+            self.discard(key)
+        else:
+            self.put(doc)
+
+    def add_listener(self, on_put=None, on_discard=None, on_reset=None):
+        """
+        Register callbacks for derived indexes. They run under the replica lock,
+        in mutation order, and on_reset receives the full key -> doc mapping.
+        """
+        self._listeners.append((on_put, on_discard, on_reset))
+        if self._loaded and on_reset:
+            with self._lock:
+                on_reset(dict(self._entries))
+
+    def _apply(self, op, value):
+        """Apply one mutation. Caller must hold the lock."""
+        if self._resyncing:
+            self._journal.append((op, value))
+        if op == "put":
+            key = value.get(self.key_field)
+            if key is None:
+                return
+            self._entries[key] = value
+            if "_id" in value:
+                self._keys_by_id[value["_id"]] = key
+            for on_put, _, _ in self._listeners:
+                if on_put:
+                    on_put(key, value)
+        else:
+            doc = self._entries.pop(value, None)
+            if doc is not None:
+                self._keys_by_id.pop(doc.get("_id"), None)
+            for _, on_discard, _ in self._listeners:
+                if on_discard:
+                    on_discard(value)
+        self.version += 1
+
+    # ==================== FULL RESYNC ====================
+
+    def resync(self):
+        """Reload the whole collection and atomically swap it in"""
+        with self._lock:
+            self._resyncing = True
+            self._journal = []
+        try:
+            docs = list(self.collection.find({}))
+        except PyMongoError as e:
+            with self._lock:
+                self._resyncing = False
+            print(f"Warning: resync of {self.collection.name} failed: {e}")
+            return False
+
+        entries = {}
+        keys_by_id = {}
+        for doc in docs:
+            key = doc.get(self.key_field)
+            if key is None:
+                continue
+            entries[key] = doc
+            keys_by_id[doc["_id"]] = key
+
+        with self._lock:
+            # Replay writes that raced with the read above
+            for op, value in self._journal:
+                if op == "put":
+                    entries[value[self.key_field]] = value
+                    if "_id" in value:
+                        keys_by_id[value["_id"]] = value[self.key_field]
+                else:
+                    entries.pop(value, None)
+            self._entries = entries
+            self._keys_by_id = keys_by_id
+            for _, _, on_reset in self._listeners:
+                if on_reset:
+                    on_reset(entries)
+            self._journal = []
+            self._resyncing = False
+            self._loaded = True
+            self.version += 1
+            self.last_resync = time.time()
+            self._stats["resyncs"] += 1
+        return True
+
+    def invalidate(self):
+        """Force a resync on the next background tick"""
+        self.last_resync = 0.0
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.resync()
+
+    # ==================== BACKGROUND REFRESH ====================
+
+    def start(self):
+        """Load the snapshot and start the change-stream tailer / resync loop"""
+        self._ensure_loaded()
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def _refresh_loop(self):
+        supported = True
+        while self._running:
+            if supported:
+                supported = self._tail_change_stream()
+            else:
+                # No change streams (standalone mongod): periodic resync only
+                time.sleep(1)
+            if time.time() - self.last_resync >= self.resync_interval:
+                self.resync()
+                supported = True  # Probe for change streams again after every resync
+
+    def _tail_change_stream(self) -> bool:
+        """Consume change events until the next resync is due. Returns False if unsupported."""
+        try:
+            with self.collection.watch(full_document="updateLookup", max_await_time_ms=1000) as stream:
+                self._stats["change_stream"] = True
+                while self._running and time.time() - self.last_resync < self.resync_interval:
+                    change = stream.try_next()
+                    if change is not None:
+                        self._on_change(change)
+            return True
+        except PyMongoError:
+            self._stats["change_stream"] = False
+            return False
+
+    def _on_change(self, change):
+        self._stats["change_events"] += 1
+        op = change.get("operationType")
+        if op in ("insert", "update", "replace") and change.get("fullDocument"):
+            self.put(change["fullDocument"])
+        elif op == "delete":
+            key = self._keys_by_id.pop(change["documentKey"]["_id"], None)
+            if key is not None:
+                self.discard(key)
+        elif op in ("drop", "rename", "invalidate"):
+            self.invalidate()
+
+    def snapshot(self) -> Dict:
+        """Counters for the metrics endpoint"""
+        stats = dict(self._stats)
+        stats.update({
+            "size": len(self._entries),
+            "version": self.version,
+            "seconds_since_resync": round(time.time() - self.last_resync, 1) if self.last_resync else None,
+        })
+        return stats
+
+
+def invalidate(collection_name: str):
+    """Ask the replica of a collection (if any in this process) to resync soon"""
+    replica = _registry.get(collection_name)
+    if replica is not None:
+        replica.invalidate()
+
+
+def refresh_key(collection_name: str, key: str):
+    """Re-read one key into the replica of a collection (if any in this process)"""
+    replica = _registry.get(collection_name)
+    if replica is not None:
+        replica.reload_key(key)
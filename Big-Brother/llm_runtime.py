@@ -0,0 +1,100 @@
+"""
+LLM Runtime - One long-lived event loop and one pooled HTTP client for every agent call
+Responsibilities:
+1. Own a persistent asyncio loop on a background thread, instead of asyncio.run() per request
+2. Share a single keep-alive HTTP client between all OpenAI / agents SDK calls
+3. Let sync callers (Flask workers, the email thread) and async callers (the ASGI server)
+   submit coroutines to that loop
+4. Run blocking database work from coroutines on a bounded thread pool
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+RUNTIME_DB_THREADS = int(os.getenv("RUNTIME_DB_THREADS", "16"))
+
+_loop = None
+_thread = None
+_http_client = None
+_lock = threading.Lock()
+
+
+def _configure_openai_client():
+    """Point the agents SDK at one AsyncOpenAI client with a pooled keep-alive transport"""
+    global _http_client
+    try:
+        import httpx
+        from openai import AsyncOpenAI
+        from agents import set_default_openai_client
+    except ImportError as e:
+        print(f"Warning: shared LLM HTTP client not configured: {e}")
+        return
+
+    _http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        ),
+        timeout=httpx.Timeout(LLM_HTTP_TIMEOUT, connect=10.0),
+    )
+    set_default_openai_client(AsyncOpenAI(http_client=_http_client))
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Start the runtime loop on first use and return it"""
+    global _loop, _thread
+    with _lock:
+        if _loop is not None:
+            return _loop
+
+        loop = asyncio.new_event_loop()
+        loop.set_default_executor(ThreadPoolExecutor(
+            max_workers=RUNTIME_DB_THREADS, thread_name_prefix="runtime-db"
+        ))
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            # The HTTP client must be created on the loop that will use it
+            _configure_openai_client()
+            ready.set()
+            loop.run_forever()
+
+        _thread = threading.Thread(target=run, name="llm-runtime", daemon=True)
+        _thread.start()
+        ready.wait()
+        _loop = loop
+        return _loop
+
+
+def run_sync(coro, timeout=None):
+    """Run a coroutine on the runtime loop and block the calling thread for its result"""
+    loop = get_loop()
+    if threading.current_thread() is _thread:
+        raise RuntimeError("run_sync() called from the runtime loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+async def run_async(coro):
+    """Await a coroutine on the runtime loop from another event loop (e.g. the ASGI server's)"""
+    loop = get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def shutdown():
+    """Close the shared HTTP client and stop the loop"""
+    global _loop
+    with _lock:
+        loop, _loop = _loop, None
+    if loop is None:
+        return
+    if _http_client is not None:
+        asyncio.run_coroutine_threadsafe(_http_client.aclose(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,239 @@
+"""
+LLM Scheduler - One gate in front of every agent run
+Responsibilities:
+1. Queue agent runs by priority class (interactive > desktop > background)
+2. Cap concurrency globally and per class, so a burst in one class cannot starve another
+3. Pace dispatch with a token bucket under the provider's request rate limit
+4. Retry rate-limited (429) runs with jittered exponential backoff
+5. Report queue depth, running counts and wait times per class
+
+All scheduling state lives on the LLM runtime loop; call run() from coroutines running there.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import os
+import random
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from agents import Runner
+
+PRIORITIES = ("interactive", "desktop", "background")
+
+_current_priority = contextvars.ContextVar("llm_priority", default="interactive")
+
+
+@contextlib.contextmanager
+def priority(name: str):
+    """Run the agent calls made inside this block (in this task) at the given priority"""
+    token = _current_priority.set(name)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts up to `capacity`"""
+
+    def __init__(self, rate_per_minute: float, capacity: int):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def seconds_until_token(self) -> float:
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def drain(self, seconds: float):
+        """Back off everyone after a 429: no tokens until `seconds` from now"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    if getattr(error, "status_code", None) != 429 and type(error).__name__ != "RateLimitError":
+        return False
+    # An exhausted quota will not recover by waiting
+    return getattr(error, "code", None) != "insufficient_quota"
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """Priority queue with global/per-class concurrency caps and a shared token bucket"""
+
+    def __init__(self, max_concurrency: int = 16, class_limits: Optional[Dict[str, int]] = None,
+                 rate_per_minute: float = 500, burst: int = 20, max_retries: int = 4,
+                 backoff_base: float = 1.0, backoff_cap: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.class_limits = {name: max_concurrency for name in PRIORITIES}
+        self.class_limits.update(class_limits or {})
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._waiting = {name: deque() for name in PRIORITIES}
+        self._running = {name: 0 for name in PRIORITIES}
+        self._wakeup = None
+        self._stats = {name: {"runs": 0, "wait_seconds": 0.0, "retries": 0, "rate_limited": 0, "failed": 0}
+                       for name in PRIORITIES}
+
+    # ==================== PUBLIC ====================
+
+    async def run(self, agent, input, priority: Optional[str] = None, timeout: Optional[float] = None, **kwargs):
+        """
+        Runner.run(agent, input) once the scheduler admits it, retrying on rate limits.
+        timeout bounds each attempt from admission on, so time spent queued never counts
+        against it; asyncio.TimeoutError is raised when an attempt overruns.
+        """
+        name = priority or _current_priority.get()
+        if name not in self._waiting:
+            raise ValueError(f"Unknown LLM priority class: {name}")
+
+        attempt = 0
+        while True:
+            queued_at = time.monotonic()
+            await self._acquire(name)
+            self._stats[name]["wait_seconds"] += time.monotonic() - queued_at
+            try:
+                result = await asyncio.wait_for(Runner.run(agent, input, **kwargs), timeout)
+                self._stats[name]["runs"] += 1
+                return result
+            except Exception as e:
+                if not _is_rate_limit(e):
+                    self._stats[name]["failed"] += 1
+                    raise
+                self._stats[name]["rate_limited"] += 1
+                if attempt >= self.max_retries:
+                    self._stats[name]["failed"] += 1
+                    raise
+                delay = _retry_after(e) or min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+                # Full jitter keeps retries from many callers from arriving together
+                delay = random.uniform(delay / 2, delay)
+                self.bucket.drain(delay)
+                attempt += 1
+                self._stats[name]["retries"] += 1
+                print(f"LLM rate limited ({name}), retry {attempt} in {delay:.1f}s", flush=True)
+            finally:
+                self._release(name)
+            await asyncio.sleep(delay)
+
+    def load(self, name: str) -> int:
+        """Runs of a priority class that are running or waiting"""
+        return self._running[name] + len(self._waiting[name])
+
+    def snapshot(self) -> Dict:
+        classes = {}
+        for name in PRIORITIES:
+            stats = dict(self._stats[name])
+            wait_seconds = stats.pop("wait_seconds")
+            admitted = stats["runs"] + stats["failed"] + stats["retries"]
+            stats["avg_wait_ms"] = round(wait_seconds / admitted * 1000, 1) if admitted else 0.0
+            stats["queued"] = len(self._waiting[name])
+            stats["running"] = self._running[name]
+            stats["limit"] = self.class_limits[name]
+            classes[name] = stats
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": sum(self._running.values()),
+            "queued": sum(len(waiting) for waiting in self._waiting.values()),
+            "tokens_available": round(max(self.bucket.tokens, 0), 2),
+            "classes": classes,
+        }
+
+    # ==================== ADMISSION ====================
+
+    async def _acquire(self, name: str):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[name].append(future)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller gave up: hand the slot back
+                self._release(name)
+            else:
+                with contextlib.suppress(ValueError):
+                    self._waiting[name].remove(future)
+            raise
+
+    def _release(self, name: str):
+        self._running[name] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Admit waiting runs, highest priority first, while slots and rate tokens last"""
+        while sum(self._running.values()) < self.max_concurrency:
+            name = next((name for name in PRIORITIES
+                         if self._waiting[name] and self._running[name] < self.class_limits[name]), None)
+            if name is None:
+                return
+            if not self.bucket.try_take():
+                self._schedule_wakeup(self.bucket.seconds_until_token())
+                return
+            future = self._waiting[name].popleft()
+            if future.cancelled():
+                self.bucket.tokens += 1
+                continue
+            self._running[name] += 1
+            future.set_result(None)
+
+    def _schedule_wakeup(self, delay: float):
+        if self._wakeup is not None and not self._wakeup.cancelled():
+            return
+        loop = asyncio.get_running_loop()
+
+        def wake():
+            self._wakeup = None
+            self._dispatch()
+
+        self._wakeup = loop.call_later(max(delay, 0.01), wake)
+
+
+def from_env() -> LLMScheduler:
+    """Scheduler configured from LLM_* environment variables"""
+    return LLMScheduler(
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+        class_limits={
+            "interactive": int(os.getenv("LLM_INTERACTIVE_CONCURRENCY", "16")),
+            "desktop": int(os.getenv("LLM_DESKTOP_CONCURRENCY", "4")),
+            "background": int(os.getenv("LLM_BACKGROUND_CONCURRENCY", "2")),
+        },
+        rate_per_minute=float(os.getenv("LLM_RATE_PER_MINUTE", "500")),
+        burst=int(os.getenv("LLM_RATE_BURST", "20")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+    )
+
+
+# Shared by the server and the email agent, which all run agents on the LLM runtime loop
+scheduler = from_env()
+
+
+async def run(agent, input, priority: Optional[str] = None, timeout: Optional[float] = None, **kwargs):
+    """Module-level shortcut for scheduler.run"""
+    return await scheduler.run(agent, input, priority=priority, timeout=timeout, **kwargs)
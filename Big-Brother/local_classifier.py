@@ -0,0 +1,236 @@
+"""
+Local Classifier - CPU-only verdict model learned from the stored lists
+Responsibilities:
+1. Turn a page (link and title) into hashed TF-IDF features
+2. Train a logistic regression on past whitelist/blacklist verdicts, in the background
+3. Short-circuit the agent only when the model is confident enough
+4. Log how often the model agrees with the agent, per confidence bucket, for calibration
+
+NumPy is optional: without it the classifier stays disabled and every page goes to the agent.
+"""
+
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FEATURE_DIMS = 2 ** 18
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def page_tokens(link: str, title: str = "") -> List[str]:
+    """Namespaced tokens for a canonical link and a page title"""
+    host, _, rest = (link or "").lower().partition("/")
+    path, _, query = rest.partition("?")
+    labels = host.split(".")
+    tokens = [f"h:{label}" for label in labels if label]
+    # Registrable-domain style suffixes ("h=google.com") carry most of the signal for a site
+    tokens += [f"h={'.'.join(labels[i:])}" for i in range(max(len(labels) - 3, 0), len(labels) - 1)]
+    tokens += [f"p:{word}" for word in _TOKEN_RE.findall(path)]
+    tokens += [f"q:{pair.split('=')[0]}" for pair in query.split("&") if pair]
+    title_words = _TOKEN_RE.findall((title or "").lower())
+    tokens += [f"t:{word}" for word in title_words]
+    tokens += [f"t:{a}_{b}" for a, b in zip(title_words, title_words[1:])]
+    return tokens
+
+
+def _hash_token(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8")) % FEATURE_DIMS
+
+
+class HashedTfidf:
+    """Hashing-trick TF-IDF with sublinear term frequency and L2 normalisation"""
+
+    def __init__(self):
+        self.idf = None
+
+    def fit(self, token_lists: List[List[str]]):
+        df = np.zeros(FEATURE_DIMS)
+        for tokens in token_lists:
+            df[list({_hash_token(token) for token in tokens})] += 1
+        self.idf = np.log((1 + len(token_lists)) / (1 + df)) + 1
+        # Buckets never seen in training carry no evidence; leaving them in would only
+        # dilute the normalised vector (a vocabulary-based TF-IDF drops them too)
+        self.idf[df == 0] = 0
+
+    def transform(self, tokens: List[str]) -> Tuple["np.ndarray", "np.ndarray"]:
+        counts: Dict[int, int] = {}
+        for token in tokens:
+            index = _hash_token(token)
+            counts[index] = counts.get(index, 0) + 1
+        cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        vals = np.fromiter((1 + math.log(count) for count in counts.values()), dtype=float, count=len(counts))
+        vals *= self.idf[cols]
+        norm = np.linalg.norm(vals)
+        return cols, (vals / norm if norm else vals)
+
+
+class VerdictClassifier:
+    """Logistic regression over hashed TF-IDF features; label 1 means block"""
+
+    def __init__(self, threshold: float = 0.95, min_examples: int = 200, audit_rate: float = 0.05):
+        self.threshold = threshold
+        self.min_examples = min_examples
+        self.audit_rate = audit_rate
+        self._lock = threading.Lock()
+        self._model = None  # (vectorizer, weights, bias)
+        self._stats = {"trained_at": None, "examples": 0, "validation_accuracy": None,
+                       "predictions": 0, "short_circuits": 0, "audited": 0}
+        # Agreement with the agent per confidence decile, for calibrating the threshold
+        self._agreement = {bucket: [0, 0] for bucket in range(5, 10)}
+
+    @property
+    def available(self) -> bool:
+        return np is not None
+
+    # ==================== TRAINING ====================
+
+    def train(self, examples: List[Tuple[str, str, str]]) -> bool:
+        """
+        Fit on (link, title, action) examples, holding out 20% to report accuracy.
+        Returns False (and keeps the previous model) when there is too little data.
+        """
+        if np is None:
+            return False
+        blocks = sum(1 for _, _, action in examples if action == "block")
+        if blocks < self.min_examples // 4 or len(examples) - blocks < self.min_examples // 4 \
+                or len(examples) < self.min_examples:
+            return False
+
+        shuffled = list(examples)
+        random.Random(0).shuffle(shuffled)
+        split = int(len(shuffled) * 0.8)
+        vectorizer, weights, bias = self._fit(shuffled[:split])
+        held_out = shuffled[split:]
+        correct = sum(
+            (self._probability(vectorizer, weights, bias, link, title) >= 0.5) == (action == "block")
+            for link, title, action in held_out
+        )
+        # The served model uses every example
+        model = self._fit(shuffled)
+        with self._lock:
+            self._model = model
+            self._stats["trained_at"] = time.time()
+            self._stats["examples"] = len(examples)
+            self._stats["validation_accuracy"] = round(correct / len(held_out), 4) if held_out else None
+        return True
+
+    def _fit(self, examples, iterations: int = 300, learning_rate: float = 10.0, l2: float = 1e-4):
+        token_lists = [page_tokens(link, title) for link, title, _ in examples]
+        vectorizer = HashedTfidf()
+        vectorizer.fit(token_lists)
+
+        rows, cols, vals = [], [], []
+        for row, tokens in enumerate(token_lists):
+            row_cols, row_vals = vectorizer.transform(tokens)
+            rows.append(np.full(len(row_cols), row))
+            cols.append(row_cols)
+            vals.append(row_vals)
+        rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+        labels = np.array([1.0 if action == "block" else 0.0 for _, _, action in examples])
+        # Balanced class weights, so a lopsided history does not bias the prior
+        positive = labels.mean()
+        sample_weights = np.where(labels == 1, 0.5 / max(positive, 1e-9), 0.5 / max(1 - positive, 1e-9))
+
+        weights = np.zeros(FEATURE_DIMS)
+        bias = 0.0
+        n = len(examples)
+        for _ in range(iterations):
+            logits = np.clip(np.bincount(rows, weights=vals * weights[cols], minlength=n) + bias, -30, 30)
+            error = (1 / (1 + np.exp(-logits)) - labels) * sample_weights
+            gradient = np.bincount(cols, weights=vals * error[rows], minlength=FEATURE_DIMS) / n
+            weights -= learning_rate * (gradient + l2 * weights)
+            bias -= learning_rate * error.mean()
+        return vectorizer, weights, bias
+
+    @staticmethod
+    def _probability(vectorizer, weights, bias, link, title) -> float:
+        cols, vals = vectorizer.transform(page_tokens(link, title))
+        logit = min(max(float(vals @ weights[cols]) + bias, -30.0), 30.0)
+        return 1 / (1 + math.exp(-logit))
+
+    # ==================== INFERENCE ====================
+
+    def predict(self, link: str, title: str) -> Optional[Tuple[str, float]]:
+        """(action, confidence) for a page, or None when no model is trained yet"""
+        with self._lock:
+            model = self._model
+            if model is None:
+                return None
+            self._stats["predictions"] += 1
+        probability = self._probability(*model, link, title)
+        if probability >= 0.5:
+            return "block", probability
+        return "approve", 1 - probability
+
+    def should_short_circuit(self, confidence: float) -> bool:
+        """Confident predictions skip the agent, except a small audit sample kept for calibration"""
+        if confidence < self.threshold:
+            return False
+        with self._lock:
+            if random.random() < self.audit_rate:
+                self._stats["audited"] += 1
+                return False
+            self._stats["short_circuits"] += 1
+        return True
+
+    def record_agreement(self, confidence: float, predicted: str, actual: str):
+        """Log whether a prediction matched the agent's verdict"""
+        bucket = min(int(confidence * 10), 9)
+        with self._lock:
+            counts = self._agreement[bucket]
+            counts[0] += predicted == actual
+            counts[1] += 1
+
+    def reset(self):
+        """Forget the model (the verdicts it learned from no longer apply)"""
+        with self._lock:
+            self._model = None
+            self._stats["trained_at"] = None
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            agreement = {
+                f"{bucket / 10:.1f}-{(bucket + 1) / 10:.1f}": {
+                    "agreed": agreed, "total": total,
+                    "rate": round(agreed / total, 4) if total else None,
+                }
+                for bucket, (agreed, total) in self._agreement.items()
+            }
+        stats["enabled"] = np is not None
+        stats["threshold"] = self.threshold
+        stats["agreement_by_confidence"] = agreement
+        return stats
+
+
+def start_background_training(classifier: VerdictClassifier,
+                              load_examples: Callable[[], Iterable[Tuple[str, str, str]]],
+                              interval: float = 1800):
+    """Retrain the classifier from load_examples() now and then every interval seconds"""
+    if not classifier.available:
+        print("Warning: numpy not installed, local verdict classifier disabled")
+        return None
+
+    def loop():
+        while True:
+            try:
+                examples = list(load_examples())
+                if classifier.train(examples):
+                    print(f"Local classifier trained on {len(examples)} verdicts "
+                          f"(validation accuracy {classifier.snapshot()['validation_accuracy']})", flush=True)
+            except Exception as e:
+                print(f"Local classifier training failed: {e}", flush=True)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="classifier-trainer", daemon=True)
+    thread.start()
+    return thread
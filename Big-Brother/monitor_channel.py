@@ -0,0 +1,178 @@
+"""
+Monitor Channel - Server-push channel to the connected desktop monitors
+Responsibilities:
+1. Hold one Server-Sent Events subscription per connected monitor, for both the Flask
+   (thread per stream) and the ASGI (async) serving modes
+2. Watch versioned sources (the config cache, the desktop list change log) from one
+   publisher thread, and push an event the moment a version moves
+3. Deliver commands ("terminate app X") to every monitor, or to one device
+4. Heartbeat idle streams so dead connections are noticed, and cut off monitors that stop
+   reading; both reconnect and get the current state again on connect
+
+Watching in-memory versions costs nothing per monitor, so an idle monitor puts no load
+on the server: it only receives heartbeats and the changes it would otherwise poll for.
+"""
+
+import asyncio
+import queue
+import threading
+from typing import Callable, Dict, List, Optional
+
+from analysis_tickets import sse_event
+
+
+class _Subscriber:
+    """The outgoing event queue of one connected monitor"""
+
+    def __init__(self, device: Optional[str], size: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.device = device
+        self.loop = loop
+        self.queue = asyncio.Queue(size) if loop else queue.Queue(size)
+        self.closed = False  # Fell too far behind; its stream ends and the monitor reconnects
+
+    def push(self, message: str):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._put, message)
+        else:
+            self._put(message)
+
+    def _put(self, message: str):
+        try:
+            self.queue.put_nowait(message)
+        except (queue.Full, asyncio.QueueFull):
+            self.closed = True
+
+
+class _Source:
+    """A versioned piece of state, pushed as event whenever probe() changes"""
+
+    def __init__(self, event: str, probe: Callable[[], object], build: Callable[[object], Dict]):
+        self.event = event
+        self.probe = probe
+        self.build = build  # build(previously pushed version) -> event data
+        self.version = None
+
+
+class MonitorChannel:
+    """Fan-out of state changes and commands to the connected monitors"""
+
+    def __init__(self, heartbeat: float = 15, poll_interval: float = 0.25, queue_size: int = 64):
+        self.heartbeat = heartbeat
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+
+        self._subscribers: List[_Subscriber] = []
+        self._sources: List[_Source] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {"connections": 0, "events": 0, "commands": 0, "overflows": 0}
+
+    # ==================== SOURCES ====================
+
+    def watch(self, event: str, probe: Callable[[], object], build: Callable[[object], Dict]):
+        """Push build(previous version) as event whenever probe() returns a new version"""
+        self._sources.append(_Source(event, probe, build))
+
+    def notify(self):
+        """A watched source changed: check now rather than at the next poll"""
+        self._wake.set()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        for source in self._sources:
+            source.version = source.probe()
+        self._thread = threading.Thread(target=self._publish_loop, daemon=True)
+        self._thread.start()
+
+    def _publish_loop(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            for source in self._sources:
+                try:
+                    version = source.probe()
+                    if version == source.version:
+                        continue
+                    data = source.build(source.version)
+                    source.version = version
+                except Exception as e:
+                    print(f"Warning: could not publish {source.event} to monitors: {e}")
+                    continue
+                self.publish(source.event, data)
+
+    # ==================== PUBLISHING ====================
+
+    def publish(self, event: str, data: Dict, device: Optional[str] = None) -> int:
+        """Send an event to every monitor (or those of one device). Returns how many got it."""
+        message = sse_event(event, data)
+        with self._lock:
+            targets = [sub for sub in self._subscribers if device is None or sub.device == device]
+        for sub in targets:
+            sub.push(message)
+        self._stats["events"] += 1
+        return len(targets)
+
+    def command(self, action: str, device: Optional[str] = None, **params) -> int:
+        """Push a command such as terminate(app=...) to the monitors; returns how many received it"""
+        self._stats["commands"] += 1
+        return self.publish("command", dict(params, action=action), device)
+
+    # ==================== STREAMS ====================
+
+    def _subscribe(self, device: Optional[str], loop=None) -> _Subscriber:
+        sub = _Subscriber(device, self.queue_size, loop)
+        with self._lock:
+            self._subscribers.append(sub)
+        self._stats["connections"] += 1
+        return sub
+
+    def _unsubscribe(self, sub: _Subscriber):
+        if sub.closed:
+            self._stats["overflows"] += 1
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    def _opening(self, initial: Callable[[], List[tuple]]) -> List[str]:
+        messages = [sse_event("hello", {"heartbeat": self.heartbeat})]
+        messages.extend(sse_event(event, data) for event, data in initial())
+        return messages
+
+    def stream(self, device: Optional[str] = None, initial: Callable[[], List[tuple]] = list):
+        """
+        Blocking SSE generator (Flask): 'hello', the (event, data) pairs of initial(), then
+        pushed events and heartbeats until the client goes away. initial() runs after
+        subscribing, so no change can fall between the opening state and the first push.
+        """
+        sub = self._subscribe(device)
+        try:
+            yield from self._opening(initial)
+            while not sub.closed:
+                try:
+                    yield sub.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+        finally:
+            self._unsubscribe(sub)
+
+    async def stream_async(self, device: Optional[str] = None, initial: Callable[[], List[tuple]] = list):
+        """Async SSE generator (ASGI), same events as stream"""
+        sub = self._subscribe(device, asyncio.get_running_loop())
+        try:
+            for message in self._opening(initial):
+                yield message
+            while not sub.closed:
+                try:
+                    yield await asyncio.wait_for(sub.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+        finally:
+            self._unsubscribe(sub)
+
+    def snapshot(self) -> Dict:
+        stats = dict(self._stats)
+        with self._lock:
+            stats["connected"] = len(self._subscribers)
+        return stats
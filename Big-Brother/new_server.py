@@ -1,16 +1,14 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
-from pymongo import MongoClient, ASCENDING
 import openai
 import os
 import argparse
 import sys
-from urllib.parse import urlparse, parse_qs
 import json
 from datetime import datetime
 import threading
 import time
-from agents import Agent, Runner, WebSearchTool, function_tool
+from agents import Agent, WebSearchTool, function_tool
 import queue
 from pydantic import BaseModel
 import asyncio
@@ -19,6 +17,36 @@ import prompts
 from email_agent import notify_parent_appeal_approved, send_approval_request_email, start_email_monitoring
 import base64
 import uuid
+from analysis_coalescer import SingleFlight, AnalysisWaitTimeout
+from analysis_tickets import TicketQueue, sse_stream, wait_for_ticket
+from analysis_batch import PrefetchGate, ndjson_stream
+import llm_runtime
+import llm_scheduler
+from list_replica import ListReplica
+from list_changelog import ListChangeLog
+from list_filter import ListFilterCache, url_rule_key
+from monitor_channel import MonitorChannel
+from url_matcher import UrlMatcher
+from url_canonicalizer import canonicalize_url, canonical_domain, extract_video_id, CanonicalizationStats
+from content_fingerprint import SimHashIndex, page_fingerprint, prompt_fingerprint
+from verdict_cache import VerdictCache, content_cache_key
+from rule_prescreen import RulePrescreen, TierStats
+from local_classifier import VerdictClassifier, start_background_training
+from content_reducer import ReductionStats, reduce_content
+from verdict_revalidation import Revalidator
+from cache_warmer import AccessTracker, CacheWarmer
+import smart_db_manager
+import db_indexes
+from smart_db_manager import (
+    db, whitelist_col, blacklist_col, whitelist_desktop_col, blacklist_desktop_col, monitoring_config,
+)
+from transcript_cache import TranscriptCache
+from transcript_condenser import condense_transcript
+from list_pages import (
+    cursor_datetime, encode_cursor, list_etag, list_version, page_body, page_entries, parse_page_args,
+)
+from url_matcher import AI_REASONS
+from concurrent.futures import CancelledError
 
 # ytt_api.fetch("6Lq3k-XQkrE")
 
@@ -43,46 +71,125 @@ CORS(app)
 #     response.headers['Access-Control-Max-Age'] = '600'
 #     return response
 
-analysis_locks = {}
-locks_lock = threading.Lock()
-
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-client = MongoClient(MONGO_URI)
-db = client["NorthlightDB"]
-
-# # Document structure:
-# {
-#     'link': 'google.com' or 'google.com/really-bad-page',
-#     'added_at': datetime,
-#     'approval_made': 0 or 1,
-#     'reason': 'AI Analysis' or 'Manual'
-# }
-
-whitelist_col = db["whitelist"]
-blacklist_col = db["blacklist"]
-whitelist_col.create_index([("link", ASCENDING)], unique=True)
-blacklist_col.create_index([("link", ASCENDING)], unique=True)\
+# Concurrent /analyze calls for the same link share one agent run; background work (prefetch,
+# re-scoring, warming) runs under its own keys so a visit never waits on a background flight
+analysis_flight = SingleFlight("web analysis")
+ANALYSIS_WAIT_TIMEOUT = float(os.getenv("ANALYSIS_WAIT_TIMEOUT", "90"))
+ANALYSIS_RUN_TIMEOUT = float(os.getenv("ANALYSIS_RUN_TIMEOUT", "120"))
 
+# Ticketed /analyze requests are answered later by a bounded pool of agent workers
+analysis_queue = TicketQueue(
+    workers=int(os.getenv("ANALYSIS_WORKERS", "8")),
+    ttl=float(os.getenv("ANALYSIS_TICKET_TTL", "600")),
+)
+ANALYSIS_EVENTS_HEARTBEAT = float(os.getenv("ANALYSIS_EVENTS_HEARTBEAT", "15"))
+ANALYSIS_LONG_POLL_MAX = float(os.getenv("ANALYSIS_LONG_POLL_MAX", "30"))
 
-appeals_col = db["appeals"]
-pending_approvals_col = db["pending_approvals"]
+# /analyze/batch prefetching: bounded, capped per batch, and yields to interactive analyses
+prefetch_gate = PrefetchGate(
+    concurrency=int(os.getenv("BATCH_CONCURRENCY", "2")),
+    yield_threshold=int(os.getenv("BATCH_YIELD_THRESHOLD", "4")),
+)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_MAX_ANALYSES = int(os.getenv("BATCH_MAX_ANALYSES", "10"))
 
-config_col = db["config"]
+# Collections, pooled client and repository functions live in smart_db_manager
 desktop_events_col = db[
     "desktop_events"
 ]  # Need to decide if I should include this or not
 
-blacklist_desktop_col = db["blacklist_desktop"]
-whitelist_desktop_col = db["whitelist_desktop"]
-
-# whitelist_col.create_index([("link", ASCENDING)], unique=True)
-# blacklist_col.create_index([("link", ASCENDING)], unique=True)
-
-whitelist_desktop_col.create_index([("app", ASCENDING)], unique=True)
-blacklist_desktop_col.create_index([("app", ASCENDING)], unique=True)
+# In-memory copies of the lists so per-request lookups never wait on Mongo
+LIST_RESYNC_INTERVAL = float(os.getenv("LIST_RESYNC_INTERVAL", "60"))
+whitelist_replica = ListReplica(whitelist_col, "link", resync_interval=LIST_RESYNC_INTERVAL)
+blacklist_replica = ListReplica(blacklist_col, "link", resync_interval=LIST_RESYNC_INTERVAL)
+whitelist_desktop_replica = ListReplica(whitelist_desktop_col, "app", resync_interval=LIST_RESYNC_INTERVAL)
+blacklist_desktop_replica = ListReplica(blacklist_desktop_col, "app", resync_interval=LIST_RESYNC_INTERVAL)
+
+# Change log over the desktop lists, so monitors fetch only what changed since their last sync
+desktop_list_changes = ListChangeLog(
+    max_changes=int(os.getenv("DESKTOP_LIST_LOG_SIZE", "10000")),
+    max_delta=int(os.getenv("DESKTOP_LIST_MAX_DELTA", "2000")),
+)
+desktop_list_changes.attach("whitelist", whitelist_desktop_replica)
+desktop_list_changes.attach("blacklist", blacklist_desktop_replica)
+
+# Push channel to the desktop monitors: config and list changes, and terminate commands
+monitor_channel = MonitorChannel(heartbeat=float(os.getenv("MONITOR_EVENTS_HEARTBEAT", "15")))
+
+# Bloom-filter snapshot of all four lists, for clients to rule out "not listed" locally
+list_filter = ListFilterCache(fp_rate=float(os.getenv("LIST_FILTER_FP_RATE", "0.01")))
+
+# Host-suffix / path-prefix index over the URL lists, fed by the replicas
+url_index = UrlMatcher()
+url_index.attach("whitelist", whitelist_replica)
+url_index.attach("blacklist", blacklist_replica)
+
+# How often canonical keys hit a verdict that the raw URL would have missed
+canonicalization_stats = CanonicalizationStats()
+
+# SimHash index over AI verdicts, so mirrors and re-hosted copies of a page reuse its verdict
+content_index = SimHashIndex(max_distance=int(os.getenv("SIMHASH_MAX_DISTANCE", "3")))
+content_index.attach("whitelist", whitelist_replica)
+content_index.attach("blacklist", blacklist_replica)
+
+# Exact title+content verdict cache, so URL variants of the same page never rerun the agent
+verdict_cache = VerdictCache(
+    db["verdict_cache"],
+    max_entries=int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "50000")),
+    ttl_seconds=int(os.getenv("VERDICT_CACHE_TTL", str(7 * 24 * 3600))),
+    lru_size=int(os.getenv("VERDICT_CACHE_LRU_SIZE", "2048")),
+)
+verdict_cache.ensure_indexes()
+
+# Fetched YouTube transcripts, so re-analyses and appeals of a video skip the YouTube round trip
+transcript_cache = TranscriptCache(
+    db["transcript_cache"],
+    max_bytes=int(os.getenv("TRANSCRIPT_CACHE_MB", "256")) * 1024 * 1024,
+    ttl_seconds=int(os.getenv("TRANSCRIPT_CACHE_TTL", str(30 * 24 * 3600))),
+    memory_entries=int(os.getenv("TRANSCRIPT_CACHE_MEMORY_ENTRIES", "64")),
+)
+transcript_cache.ensure_indexes()
+# Tokens of transcript the agent gets per video, however long the video is
+TRANSCRIPT_TOKEN_BUDGET = int(os.getenv("TRANSCRIPT_TOKEN_BUDGET", "1500"))
+TRANSCRIPT_WINDOW_SECONDS = float(os.getenv("TRANSCRIPT_WINDOW_SECONDS", "60"))
+
+# Site/keyword rules compiled from the monitoring prompt settle clear-cut pages locally
+rule_prescreen = RulePrescreen()
+# Which tier (lists, rules, content cache, near-duplicate, classifier, agent) answered each page
+decision_tiers = TierStats()
+
+# Logistic regression over past verdicts; answers only when confident, the agent decides the rest
+verdict_model = VerdictClassifier(
+    threshold=float(os.getenv("CLASSIFIER_THRESHOLD", "0.95")),
+    min_examples=int(os.getenv("CLASSIFIER_MIN_EXAMPLES", "200")),
+    audit_rate=float(os.getenv("CLASSIFIER_AUDIT_RATE", "0.05")),
+)
+CLASSIFIER_RETRAIN_INTERVAL = float(os.getenv("CLASSIFIER_RETRAIN_INTERVAL", "1800"))
+
+# Page text is cut down to this many tokens (boilerplate stripped, sampled across the page)
+CONTENT_TOKEN_BUDGET = int(os.getenv("CONTENT_TOKEN_BUDGET", "1200"))
+reduction_stats = ReductionStats()
+
+# Automatic verdicts carry the prompt_hash of the monitoring prompt they were made under. After a
+# prompt change the old ones stay in the lists until re-scored; meanwhile "lenient" serves them,
+# "balanced" serves stale blocks but re-checks a stale allow before the page loads, and "strict"
+# re-checks every stale verdict before answering
+STALE_VERDICT_MODE = os.getenv("STALE_VERDICT_MODE", "balanced")
+revalidator = Revalidator(
+    workers=int(os.getenv("REVALIDATION_WORKERS", "1")),
+    max_pending=int(os.getenv("REVALIDATION_MAX_PENDING", "256")),
+)
 
-appeals_col.create_index([("link", ASCENDING)])
-pending_approvals_col.create_index([("approval_id", ASCENDING)], unique=True)
+# Time-decayed visit counts per link and domain; the warmer pre-analyzes the hottest links
+# that lack a current verdict, off-peak and within an hourly budget of agent runs
+access_tracker = AccessTracker(half_life=float(os.getenv("ACCESS_HALF_LIFE", str(7 * 24 * 3600))))
+cache_warmer = CacheWarmer(
+    access_tracker,
+    runs_per_hour=int(os.getenv("WARMER_RUNS_PER_HOUR", "30")),
+    hours=os.getenv("WARMER_HOURS", "0-7"),
+    interval=float(os.getenv("WARMER_INTERVAL", "300")),
+)
+access_counters_col = db["access_counters"]
 
 
 # Critical system applications that should NEVER be terminated
@@ -113,18 +220,16 @@ def initialize_critical_system_apps():
     for app in CRITICAL_SYSTEM_APPS:
         try:
             # Use upsert to avoid duplicates
-            whitelist_desktop_col.update_one(
-                {'app': app.lower()},
-                {'$set': {
-                    'app': app.lower(),
-                    'added_at': datetime.now(),
-                    'reason': 'Critical system application',
-                    'protected': True  # Mark as protected
-                }},
-                upsert=True
-            )
+            smart_db_manager.upsert_list_entry("whitelist_desktop", app.lower(), {
+                'app': app.lower(),
+                'added_at': datetime.now(),
+                'reason': 'Critical system application',
+                'protected': True  # Mark as protected
+            })
+            whitelist_desktop_replica.reload_key(app.lower())
             # Remove from blacklist if somehow it got there
-            blacklist_desktop_col.delete_one({'app': app.lower()})
+            smart_db_manager.delete_list_entry("blacklist_desktop", app.lower())
+            blacklist_desktop_replica.discard(app.lower())
         except Exception as e:
             print(f"Warning: Could not whitelist {app}: {e}")
     print(f"Protected {len(CRITICAL_SYSTEM_APPS)} critical system applications")
@@ -133,11 +238,11 @@ def initialize_critical_system_apps():
 # Desktop monitoring helper functions
 def is_app_whitelisted(app_name):
     """Check if an app is in the whitelist"""
-    return whitelist_desktop_col.find_one({'app': app_name.lower()}) is not None
+    return whitelist_desktop_replica.contains(app_name.lower())
 
 def is_app_blacklisted(app_name):
     """Check if an app is in the blacklist"""
-    return blacklist_desktop_col.find_one({'app': app_name.lower()}) is not None
+    return blacklist_desktop_replica.contains(app_name.lower())
 
 def add_to_desktop_whitelist(app_name, reason='Manual'):
     """Add app to desktop whitelist"""
@@ -147,14 +252,17 @@ def add_to_desktop_whitelist(app_name, reason='Manual'):
             "added_at": datetime.now(),
             "reason": reason
         }
-        whitelist_desktop_col.insert_one(entry)
+        smart_db_manager.insert_list_entry("whitelist_desktop", entry)
+        whitelist_desktop_replica.put(entry)
         # Remove from blacklist if exists
-        blacklist_desktop_col.delete_one({'app': app_name.lower()})
+        smart_db_manager.delete_list_entry("blacklist_desktop", app_name.lower())
+        blacklist_desktop_replica.discard(app_name.lower())
+        monitor_channel.notify()
         return True
     except:
         return False
 
-def add_to_desktop_blacklist(app_name, reason='Manual', screenshot_id=None, reasoning=None, parental_reasoning=None):
+def add_to_desktop_blacklist(app_name, reason='Manual', screenshot_id=None, reasoning=None, parental_reasoning=None, prompt_hash=None):
     """Add app to desktop blacklist"""
     try:
         entry = {
@@ -165,17 +273,22 @@ def add_to_desktop_blacklist(app_name, reason='Manual', screenshot_id=None, reas
             "reasoning": reasoning,
             "parental_reasoning": parental_reasoning
         }
-        blacklist_desktop_col.insert_one(entry)
+        if prompt_hash:
+            entry["prompt_hash"] = prompt_hash
+        smart_db_manager.insert_list_entry("blacklist_desktop", entry)
+        blacklist_desktop_replica.put(entry)
         # Remove from whitelist if exists
-        whitelist_desktop_col.delete_one({'app': app_name.lower()})
+        smart_db_manager.delete_list_entry("whitelist_desktop", app_name.lower())
+        whitelist_desktop_replica.discard(app_name.lower())
+        monitor_channel.notify()
         return True
     except:
         return False
 
 
 def get_monitoring_config():
-    """Fetching the aprent's configuration from the database"""
-    config = config_col.find_one({"type": "monitoring_rules"})
+    """Fetching the aprent's configuration (a cached copy, see config_service)"""
+    config = smart_db_manager.get_config()
     if not config:
         config = {
             "type": "monitoring_rules",
@@ -186,20 +299,19 @@ def get_monitoring_config():
             "screenshot_interval": 15,
             "blocked_apps": ["steam.exe"],
         }
-        config_col.insert_one(config)
+        config = smart_db_manager.create_config(config)
     return config
 
 
 def update_monitoring_config(new_config):
-    """Update monitoring configuration"""
-    config_col.update_one(
-        {"type": "monitoring_rules"}, {"$set": new_config}, upsert=True
-    )
+    """Update monitoring configuration (bumps its version, so every cached copy reloads)"""
+    smart_db_manager.update_config(new_config)
 
 
 
-def add_to_whitelist(link, reason='Manual', reasoning=None, parental_reasoning=None):
-    """Add link to whitelist"""
+def add_to_whitelist(link, reason='Manual', reasoning=None, parental_reasoning=None, details=None):
+    """Add link to whitelist. details holds extra fields of an automatic verdict (fingerprint, title)."""
+    link = canonicalize_url(link)
     try:
         entry = {
             "link": link,
@@ -211,17 +323,22 @@ def add_to_whitelist(link, reason='Manual', reasoning=None, parental_reasoning=N
             entry["reasoning"] = reasoning
         if parental_reasoning:
             entry["parental_reasoning"] = parental_reasoning
+        if details:
+            entry.update(details)
 
-        whitelist_col.insert_one(entry)
+        smart_db_manager.insert_list_entry("whitelist", entry)
+        whitelist_replica.put(entry)
         # Remove from blacklist if exists
-        blacklist_col.delete_one({'link': link})
+        smart_db_manager.delete_list_entry("blacklist", link)
+        blacklist_replica.discard(link)
         return True
     except:
         return False
 
 
-def add_to_blacklist(link, reason='Manual', reasoning=None, parental_reasoning=None):
+def add_to_blacklist(link, reason='Manual', reasoning=None, parental_reasoning=None, details=None):
     """Add link to blacklist. Also add number of appeals"""
+    link = canonicalize_url(link)
     try:
         entry = {
             "link": link,
@@ -234,73 +351,28 @@ def add_to_blacklist(link, reason='Manual', reasoning=None, parental_reasoning=N
             entry["reasoning"] = reasoning
         if parental_reasoning:
             entry["parental_reasoning"] = parental_reasoning
+        if details:
+            entry.update(details)
 
-        blacklist_col.insert_one(entry)
+        smart_db_manager.insert_list_entry("blacklist", entry)
+        blacklist_replica.put(entry)
         # Remove from whitelist if exists
-        whitelist_col.delete_one({'link': link})
+        smart_db_manager.delete_list_entry("whitelist", link)
+        whitelist_replica.discard(link)
         return True
     except:
         return False
 
 def is_whitelisted(link):
-    return whitelist_col.find_one({'link': link}) is not None
+    return whitelist_replica.contains(link)
 
 def is_blacklisted(link):
     """Check if link is in blacklist"""
-    return blacklist_col.find_one({'link': link}) is not None
+    return blacklist_replica.contains(link)
 
 def get_blacklist_entry(link):
-    return blacklist_col.find_one({'link': link})
-
-
-
-# TODO: IMplement locks for analysis to prevent multiple agents analyzing the same link at the same time. Maybe ask Claude to implement this?
-# def acquire_analysis_lock(link):
-#     """Try to acquire lock for analyzing a link"""
-#     with locks_lock:
-#         if link in analysis_locks:
-#             return False  # Already being analyzed
-#         analysis_locks[link] = threading.Lock()
-#         analysis_locks[link].acquire()
-#         return True
-
-# def release_analysis_lock(link):
-#     """Release lock for a link"""
-#     with locks_lock:
-#         if link in analysis_locks:
-#             analysis_locks[link].release()
-#             del analysis_locks[link]
-# analysis_cache_col = db['analysis_cache']
-# analysis_cache_col.create_index([('link', ASCENDING)])
-
-# def get_cached_analysis(link):
-#     """Get cached analysis result"""
-#     cache = analysis_cache_col.find_one({'link': link})
-#     if cache:
-#         return cache.get('decision')
-#     return None
-
-# def cache_analysis(domain, result): # I dont think we need this
-#     """Cache analysis result"""
-#     analysis_cache_col.update_one(
-#         {'link': link},
-#         {'$set': {
-#             'link': link,
-#             'result': result,
-#             'timestamp': datetime.now()
-#         }},
-#         upsert=True
-#     )
-
-# def wait_for_analysis(link, timeout=10):
-#     start_time = time.time()
-#     while time.time() - start_time < timeout:
-#         # Check if analysis is complete (result in cache)
-#         cached = get_cached_analysis(link)
-#         if cached:
-#             return cached
-#         time.sleep(0.5)
-#     return None
+    return blacklist_replica.get(link)
+
 
 
 # Todo: Implement browser screebgit
@@ -309,16 +381,27 @@ def get_browser_screenshot():
     pass
 
 
+def fetch_youtube_snippets(video_id: str) -> list:
+    """Transcript of a video from YouTube, as [start, duration, text] snippets"""
+    # Get transcript using the new API (v1.2.2+)
+    ytt_api = YouTubeTranscriptApi()
+    fetched_transcript = ytt_api.fetch(video_id)
+    return [[snippet.start, snippet.duration, snippet.text] for snippet in fetched_transcript.snippets]
+
+
 @function_tool
-def get_youtube_transcript(link: str) -> dict:
+async def get_youtube_transcript(link: str) -> dict:
     """
-    Extracts the transcript from a YouTube video URL.
+    Extracts the transcript from a YouTube video URL, condensed to the passages that
+    matter for the parent's guidelines.
 
     Args:
         link: The YouTube video URL (supports youtube.com and youtu.be formats)
 
     Returns:
-        dict: Contains 'success' (bool), 'transcript' (str), and 'error' (str) if failed
+        dict: Contains 'success' (bool), 'transcript' (str: timestamped excerpts, '…' marks
+        skipped stretches), 'duration' (seconds), 'stopped_early' and 'flagged' (set when a
+        blocked keyword was found, with its timestamp), and 'error' (str) if failed
     """
     try:
         # Extract video ID from URL
@@ -326,16 +409,27 @@ def get_youtube_transcript(link: str) -> dict:
         if not video_id:
             return {"success": False, "transcript": "", "error": "Invalid YouTube URL"}
 
-        # Get transcript using the new API (v1.2.2+)
-        ytt_api = YouTubeTranscriptApi()
-        fetched_transcript = ytt_api.fetch(video_id)
-
-        # Combine all transcript snippets into single text
-        full_transcript = " ".join(
-            [snippet.text for snippet in fetched_transcript.snippets]
+        # Cached by video ID; the fetch is blocking, so keep it off the runtime loop
+        snippets = await asyncio.to_thread(transcript_cache.fetch, video_id, fetch_youtube_snippets)
+
+        # Timestamped digest within the token budget, instead of the whole transcript
+        monitoring_prompt = (await asyncio.to_thread(get_monitoring_config))["monitoring_prompt"]
+        condensed = condense_transcript(
+            snippets,
+            monitoring_prompt,
+            rules=rule_prescreen.compile(monitoring_prompt),
+            token_budget=TRANSCRIPT_TOKEN_BUDGET,
+            window_seconds=TRANSCRIPT_WINDOW_SECONDS,
         )
 
-        return {"success": True, "transcript": full_transcript, "error": ""}
+        return {
+            "success": True,
+            "transcript": condensed["digest"],
+            "duration": condensed["duration"],
+            "stopped_early": condensed["stopped_early"],
+            "flagged": condensed["flagged"],
+            "error": "",
+        }
 
     except Exception as e:
         return {
@@ -345,24 +439,6 @@ def get_youtube_transcript(link: str) -> dict:
         }
 
 
-def extract_video_id(link: str) -> str:
-    if "youtu.be/" in link:
-        return link.split("youtu.be/")[-1].split("?")[0].split("&")[0]
-
-    # Pattern for youtube.com links
-    parsed_url = urlparse(link)
-    if parsed_url.hostname in ["www.youtube.com", "youtube.com", "m.youtube.com"]:
-        if parsed_url.path == "/watch":
-            query_params = parse_qs(parsed_url.query)
-            return query_params.get("v", [None])[0]
-        elif parsed_url.path.startswith("/embed/"):
-            return parsed_url.path.split("/embed/")[-1].split("?")[0]
-        elif parsed_url.path.startswith("/v/"):
-            return parsed_url.path.split("/v/")[-1].split("?")[0]
-
-    return None
-
-
 # Remember to put this prompt in a different file
 # Todo: Maybe be consider a method by which you can take a screenshot of the webpage behind the analysis wall.
 # web_analysis_prompt = """
@@ -390,18 +466,28 @@ web_checker_agent = Agent(
 )
 
 
-async def web_content_analysis(link, title, content):
-    """This agent will analyze the content using the standards set by the parent"""
-    config = get_monitoring_config()
+async def web_content_analysis(link, title, content, reduce=True):
+    """
+    This agent will analyze the content using the standards set by the parent.
+    The page text is reduced to CONTENT_TOKEN_BUDGET first unless reduce is False.
+    """
+    config = await asyncio.to_thread(get_monitoring_config)
     try:
+        if reduce:
+            start = time.perf_counter()
+            reduced = await asyncio.to_thread(reduce_content, content, title, CONTENT_TOKEN_BUDGET)
+            reduction_stats.record(content, reduced, time.perf_counter() - start)
+            content = reduced
+
         prompt = prompts.web_analysis_prompt.format(
             parental_prompt=config["monitoring_prompt"],
             url=link,
             title=title,
-            content=content[:5000],
+            content=content,
         )
 
-        result = await Runner.run(web_checker_agent, prompt)
+        # The timeout starts once the scheduler admits the run, so a long queue is not a failure
+        result = await llm_scheduler.run(web_checker_agent, prompt, timeout=ANALYSIS_RUN_TIMEOUT)
         structured = result.final_output_as(web_content_analysis_JSON)
         # response = await web_checker_agent.run(
         #     prompt=prompts.web_analysis_prompt.format(
@@ -423,19 +509,71 @@ async def web_content_analysis(link, title, content):
             "action": "block",
             "reasoning": "We couldn't check this content properly. Please try again later.",
             "parental_reasoning": "Error during analysis, review manually.",
+            "analysis_failed": True,
         }
 
-def check_webpage_against_DB(link):
-    """Check if the webpage is in the whitelist or blacklist"""
-    domain = urlparse(link).netloc.lower()
+def find_blocking_entry(link):
+    """Return the blacklist entry that blocks this URL (exact, parent path or parent domain), if any"""
+    match = url_index.match(link)
+    if match is not None and match.list_name == "blacklist":
+        return match.entry
+    return None
+
+
+def is_stale_verdict(entry, prompt_hash, prefetch=False):
+    """
+    An automatic verdict made under a monitoring prompt other than the current one, or (unless
+    prefetch) one prefetched from a link's anchor text that a visit with the page must re-decide
+    """
+    if entry.get("reason") not in AI_REASONS:
+        return False
+    return entry.get("prompt_hash") != prompt_hash or (entry.get("prefetched", False) and not prefetch)
+
+
+def serves_stale(list_name):
+    """Whether STALE_VERDICT_MODE answers from a stale entry of this list until it is re-scored"""
+    if STALE_VERDICT_MODE == "lenient":
+        return True
+    return STALE_VERDICT_MODE == "balanced" and list_name == "blacklist"
 
-    bl_entry = (
-        blacklist_col.find_one({"link": link})
-        or blacklist_col.find_one({"link": domain})
-    )
 
-    if bl_entry:
-        appeals_used = bl_entry.get("appeals", 0)
+def check_webpage_against_DB(link, prompt_hash=None, serve_stale=True, prefetch=False):
+    """
+    Check if the webpage is covered by a whitelist or blacklist rule (see url_matcher for precedence).
+
+    With prompt_hash, a stale automatic verdict is only returned if serve_stale and the
+    STALE_VERDICT_MODE allow it, and then carries 'stale' (the key of the stale entry).
+    Prefetched verdicts count as current only for another prefetch.
+    """
+    match = url_index.match(link)
+    if match is None:
+        return None
+
+    stale = prompt_hash is not None and is_stale_verdict(match.entry, prompt_hash, prefetch)
+    if stale and not (serve_stale and serves_stale(match.list_name)):
+        return None
+
+    result = verdict_from_match(link, match)
+    if stale:
+        result["stale"] = match.key
+    return result
+
+
+def appeals_used(link, entry):
+    """
+    Appeals used on a page: counted on its own blacklist entry, or, under a parent's
+    domain or path rule, from the page's appeal records (so one page never uses up the site's)
+    """
+    if entry["link"] == link:
+        return entry.get("appeals", 0)
+    return smart_db_manager.count_appeals(link)
+
+
+def verdict_from_match(link, match):
+    """The /analyze verdict for a list entry that covers the link"""
+    if match.list_name == "blacklist":
+        bl_entry = match.entry
+        appeals_used_count = appeals_used(link, bl_entry)
         # Support both old and new format
         reasoning = bl_entry.get("reasoning", "This content has been blocked.")
         parental_reasoning = bl_entry.get("parental_reasoning", bl_entry.get("reason", "Blacklisted"))
@@ -444,59 +582,490 @@ def check_webpage_against_DB(link):
             "action": "block",
             "reasoning": reasoning,
             "parental_reasoning": parental_reasoning,
-            "appeals_used": appeals_used,
+            "appeals_used": appeals_used_count,
         }
 
-    if is_whitelisted(link) or is_whitelisted(domain):
-        return {
-            "link": link,
-            "action": "allow",
-            "reasoning": "This content is approved.",
-            "parental_reasoning": "URL or domain whitelisted",
-            "appeals_used": 0,
-        }
-
-    return None
-
-@app.route("/analyze", methods=["POST"])
-def analyze_webpage():
-    data = request.json
-    link = data.get("url", "")
-    title = data.get("title", "")
-    content = data.get("content", "")
-
-    config = get_monitoring_config()
-    agent_can_auto_approve = config.get("agent_can_auto_approve", False)
-
-    result = check_webpage_against_DB(link)
-    if result is not None:
-        result["appeal_enabled"] = True  # Always allow appeals
-        result["agent_has_authority"] = agent_can_auto_approve
-        return jsonify(result)
+    return {
+        "link": link,
+        "action": "allow",
+        "reasoning": "This content is approved.",
+        "parental_reasoning": "URL or domain whitelisted",
+        "appeals_used": 0,
+    }
 
-    result = asyncio.run(web_content_analysis(link, title, content))
+def store_web_verdict(link, result, details=None, reason="AI Analysis", prompt_hash=None):
+    """
+    Persist an automatic verdict under the canonical link (reason must be one of AI_REASONS),
+    stamped with the prompt_hash it was made under. It replaces any earlier automatic
+    verdict for the link, so re-scoring a stale verdict never collides with it.
+    """
+    details = dict(details or {}, prompt_hash=prompt_hash) if prompt_hash else details
+    for list_name, replica in (("whitelist", whitelist_replica), ("blacklist", blacklist_replica)):
+        entry = replica.get(link)
+        if entry is not None and entry.get("reason") in AI_REASONS:
+            smart_db_manager.delete_list_entry(list_name, link, reasons=AI_REASONS)
+            replica.discard(link)
 
     if result["action"] == "block":
         add_to_blacklist(
             link,
-            reason="AI Analysis",  # Fixed: Always use "AI Analysis" for AI-generated entries
+            reason=reason,
             reasoning=result.get("reasoning"),
-            parental_reasoning=result.get("parental_reasoning")
+            parental_reasoning=result.get("parental_reasoning"),
+            details=details,
         )
-        result["appeals_used"] = 0
     else:
         add_to_whitelist(
             link,
-            reason="AI Analysis",  # Fixed: Always use "AI Analysis" for AI-generated entries
+            reason=reason,
             reasoning=result.get("reasoning"),
-            parental_reasoning=result.get("parental_reasoning")
+            parental_reasoning=result.get("parental_reasoning"),
+            details=details,
         )
+
+
+def near_duplicate_verdict(link, title, content, monitoring_prompt):
+    """
+    Look for a stored AI verdict on near-identical content under the same monitoring prompt.
+
+    Returns:
+        (result, fingerprint): the reused verdict (None if there is none) and the fingerprint
+        fields to store with this page's verdict (None if the page is too short to fingerprint)
+    """
+    content_simhash = page_fingerprint(title, content)
+    if content_simhash is None:
+        return None, None
+    prompt_hash = prompt_fingerprint(monitoring_prompt)
+    fingerprint = {"content_simhash": content_simhash, "prompt_hash": prompt_hash}
+
+    near = content_index.nearest(content_simhash, prompt_hash)
+    if near is None:
+        return None, fingerprint
+
+    list_name, source_link, entry, distance = near
+    print(f"Reusing verdict of {source_link} for {link} (SimHash distance {distance})", flush=True)
+    fingerprint["reused_from"] = source_link
+    return {
+        "link": link,
+        "action": "block" if list_name == "blacklist" else "allow",
+        "reasoning": entry.get("reasoning", "This content has been reviewed."),
+        "parental_reasoning": f"Same content as {source_link}: {entry.get('parental_reasoning', entry.get('reason', ''))}",
+    }, fingerprint
+
+
+def classifier_examples():
+    """(link, title, action) for every list verdict the local classifier may learn from"""
+    prompt_hash = prompt_fingerprint(get_monitoring_config()["monitoring_prompt"])
+    for replica, action in ((blacklist_replica, "block"), (whitelist_replica, "approve")):
+        for key, entry in replica.items():
+            # Never learn from the classifier's own guesses, nor from verdicts under an old prompt
+            if entry.get("reason") != "Local classifier" and not is_stale_verdict(entry, prompt_hash):
+                yield key, entry.get("title", ""), action
+
+
+def classifier_verdict(link, title):
+    """
+    The local classifier's verdict for a page when it is confident enough to skip the agent.
+
+    Returns:
+        (result, prediction): result is None when the agent must decide; prediction is the
+        (action, confidence) to compare with the agent's verdict, if a model is trained
+    """
+    prediction = verdict_model.predict(link, title)
+    if prediction is None:
+        return None, None
+    action, confidence = prediction
+    if not verdict_model.should_short_circuit(confidence):
+        return None, prediction
+
+    return {
+        "link": link,
+        "action": action,
+        "reasoning": "This content is approved." if action != "block" else "This content may not be appropriate for you right now.",
+        "parental_reasoning": f"Predicted from similar past verdicts ({confidence:.0%} confidence).",
+    }, prediction
+
+
+async def decide_uncached(link, url, title, content, monitoring_prompt):
+    """
+    Verdict for a page the content cache has not seen: near-duplicate reuse, then the
+    local classifier, then the agent.
+
+    Returns:
+        (result, details, reason, cacheable): details are the extra fields stored with the
+        verdict; cacheable is False for verdicts that must not be reused for other pages
+    """
+    result, fingerprint = await asyncio.to_thread(near_duplicate_verdict, link, title, content, monitoring_prompt)
+    details = dict(fingerprint or {}, title=title[:200])
+    if result is not None:
+        decision_tiers.record("near_duplicate")
+        return result, details, "AI Analysis", True
+
+    result, prediction = classifier_verdict(link, title)
+    if result is not None:
+        decision_tiers.record("classifier")
+        # A guess is never offered to near-duplicates nor learned from
+        return result, {"title": title[:200]}, "Local classifier", False
+
+    decision_tiers.record("agent")
+    result = await web_content_analysis(url, title, content)
+    # A failed run must not be offered to near-duplicates or cached as a real verdict
+    if result.get("analysis_failed"):
+        return result, {"title": title[:200]}, "AI Analysis", False
+    if prediction is not None:
+        verdict_model.record_agreement(prediction[1], prediction[0], "block" if result["action"] == "block" else "approve")
+    return result, details, "AI Analysis", True
+
+
+async def run_and_store_analysis(link, url, title, content, prefetch=False):
+    """
+    Decide a page and persist its verdict under the canonical link.
+    Executed once per link by the single-flight leader; the agent sees the original url.
+    A prefetch (anchor text, no page) is stored marked as prefetched and bypasses the content cache.
+    """
+    config = await asyncio.to_thread(get_monitoring_config)
+    prompt_hash = prompt_fingerprint(config["monitoring_prompt"])
+
+    # A previous leader may have stored the verdict between our DB check and taking the lead
+    result = check_webpage_against_DB(link, prompt_hash, serve_stale=False, prefetch=prefetch)
+    if result is not None:
+        return result
+
+    # Anchor texts such as "Read more" say nothing about the page behind them
+    cache_key = None if prefetch else content_cache_key(title, content, config["monitoring_prompt"])
+    cached = await asyncio.to_thread(verdict_cache.get, cache_key) if cache_key else None
+    reason = "AI Analysis"
+    if cached is not None:
+        decision_tiers.record("content_cache")
+        result = {
+            "link": link,
+            "action": cached["action"],
+            "reasoning": cached["reasoning"],
+            "parental_reasoning": cached["parental_reasoning"],
+        }
+        details = dict(cached.get("fingerprint") or {}, title=title[:200])
+    else:
+        result, details, reason, cacheable = await decide_uncached(link, url, title, content, config["monitoring_prompt"])
+        if cacheable and cache_key:
+            await asyncio.to_thread(verdict_cache.put, cache_key, {
+                "action": result["action"],
+                "reasoning": result.get("reasoning"),
+                "parental_reasoning": result.get("parental_reasoning"),
+                "fingerprint": {key: value for key, value in details.items() if key != "title"},
+            })
+
+    if result.get("analysis_failed"):
+        # Fail closed for this request only: an error is not a verdict, and storing it would
+        # block the page (and replace any earlier verdict) until a parent intervenes
         result["appeals_used"] = 0
+        return result
 
+    if prefetch:
+        # A visit may have stored the page's own verdict meanwhile; never replace it with a guess
+        current = check_webpage_against_DB(link, prompt_hash, serve_stale=False)
+        if current is not None:
+            return current
+        details = dict(details or {}, prefetched=True)
+
+    await asyncio.to_thread(store_web_verdict, link, result, details, reason, prompt_hash)
+    result["appeals_used"] = 0
+    return result
+
+
+def with_appeal_fields(result, config):
+    """Add the appeal flags every /analyze verdict carries"""
     result["appeal_enabled"] = True  # Always allow appeals
-    result["agent_has_authority"] = agent_can_auto_approve
+    result["agent_has_authority"] = config.get("agent_can_auto_approve", False)
+    return result
+
+
+def prescreen_verdict(link, title, monitoring_prompt, prefetch=False):
+    """
+    Verdict from the rules compiled out of the monitoring prompt, or None if the page
+    needs the agent. Blocks are stored so they can be appealed like any other block
+    (marked as prefetched when title is only a link's anchor text).
+    """
+    decision = rule_prescreen.evaluate(link, title, monitoring_prompt)
+    if decision is None:
+        return None
+
+    if decision["rule"]:
+        parental_reasoning = f'Matched "{decision["rule"]}" in your monitoring instructions.'
+    else:
+        parental_reasoning = "No site named in your monitoring instructions matched, so their default applies."
+    result = {
+        "link": link,
+        "action": decision["action"],
+        "reasoning": "This content is approved." if decision["action"] != "block" else "This website isn't available right now.",
+        "parental_reasoning": parental_reasoning,
+        "appeals_used": 0,
+    }
+    if decision["action"] == "block":
+        details = {"prefetched": True} if prefetch else None
+        store_web_verdict(link, result, details, reason="Rule pre-screen", prompt_hash=prompt_fingerprint(monitoring_prompt))
+    return result
+
+
+def quick_verdict(url, link, title, config, content="", prefetch=False):
+    """
+    Verdict from the lists or the prompt rules, or None if the page needs the agent.
+    A stale verdict that is served is queued for re-scoring with this page (not with a
+    prefetch's anchor text).
+    """
+    result = check_webpage_against_DB(link, prompt_fingerprint(config["monitoring_prompt"]), prefetch=prefetch)
+    canonicalization_stats.record(url, link, url_index.match(url) is not None, result is not None)
+    if result is not None:
+        decision_tiers.record("lists")
+        # Only a verdict stored for this very page can be re-scored from its content
+        if result.pop("stale", None) == link and not prefetch:
+            revalidator.submit(link, result["action"], url, title, content)
+        return result
+
+    result = prescreen_verdict(link, title, config["monitoring_prompt"], prefetch)
+    if result is not None:
+        decision_tiers.record("rules")
+    return result
+
+
+async def analyze_with_agent(link, url, title, content, config):
+    """The coalesced agent path of /analyze, for pages no list or rule settles"""
+    try:
+        with prefetch_gate.interactive():
+            result = await analysis_flight.do_async(
+                link,
+                lambda: run_and_store_analysis(link, url, title, content),
+                timeout=ANALYSIS_WAIT_TIMEOUT,
+            )
+        # Followers share the leader's dict, so never mutate it in place
+        result = dict(result)
+    except (AnalysisWaitTimeout, CancelledError) as e:
+        print(f"Analysis for {link} did not complete: {e}", flush=True)
+        # Fail closed without persisting, the leader (or a retry) stores the real verdict
+        result = {
+            "link": link,
+            "action": "block",
+            "reasoning": "We couldn't check this content properly. Please try again later.",
+            "parental_reasoning": "Analysis still in progress or cancelled, review manually.",
+            "appeals_used": 0,
+        }
+    return with_appeal_fields(result, config)
+
+
+async def revalidate_verdict(link, url, title, content):
+    """
+    Re-decide a page at background priority (revalidator and cache warmer callback). Returns the
+    new action; raises if the analysis failed, so the existing verdict is kept (stale) as it was.
+    """
+    with llm_scheduler.priority("background"):
+        # Its own flight: a visit joining it would wait behind the background queue
+        result = await analysis_flight.do_async(
+            f"background:{link}",
+            lambda: run_and_store_analysis(link, url, title, content),
+            timeout=ANALYSIS_WAIT_TIMEOUT,
+        )
+    if result.get("analysis_failed"):
+        raise RuntimeError("analysis failed, keeping the existing verdict")
+    return "block" if result["action"] == "block" else "allow"
+
+
+async def analyze_page(data):
+    """The /analyze pipeline, shared by the Flask route and the ASGI server. Returns the response body."""
+    url = data.get("url", "")
+    link = canonicalize_url(url)
+    title = data.get("title", "")
+    content = data.get("content", "")
+
+    access_tracker.record(link, canonical_domain(link), url, title, content)
+    config = await asyncio.to_thread(get_monitoring_config)
+    result = await asyncio.to_thread(quick_verdict, url, link, title, config, content)
+    if result is not None:
+        return with_appeal_fields(result, config)
+
+    return await analyze_with_agent(link, url, title, content, config)
+
+
+def needs_warming(link, url, title):
+    """Whether a hot link has no verdict the next visit could be answered from (cache warmer callback)"""
+    config = get_monitoring_config()
+    if check_webpage_against_DB(link, prompt_fingerprint(config["monitoring_prompt"]), serve_stale=False):
+        return False
+    return rule_prescreen.evaluate(link, title, config["monitoring_prompt"]) is None
+
+
+def interactive_load():
+    """Whether the child is waiting on analyses right now, so background LLM work should hold off"""
+    return prefetch_gate.snapshot()["interactive_running"] > 0 or llm_scheduler.scheduler.load("interactive") > 0
+
+
+def parse_batch_request(data):
+    """
+    Validate a /analyze/batch body: {"items": [url or {url, title, content}], "max_analyses": n}
+
+    Returns:
+        (items, max_analyses, error): error is a message when the body is invalid
+    """
+    raw_items = (data or {}).get("items")
+    if not isinstance(raw_items, list) or not raw_items:
+        return None, 0, "items must be a non-empty list"
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        return None, 0, f"At most {BATCH_MAX_ITEMS} items per batch"
+
+    items = []
+    for raw in raw_items:
+        item = {"url": raw} if isinstance(raw, str) else raw
+        if not isinstance(item, dict) or not item.get("url"):
+            return None, 0, "Every item needs a url"
+        items.append(item)
+
+    try:
+        max_analyses = int(data.get("max_analyses", BATCH_MAX_ANALYSES))
+    except (TypeError, ValueError):
+        return None, 0, "max_analyses must be an integer"
+    # Clients may lower the per-batch cost cap, never raise it
+    return items, max(0, min(max_analyses, BATCH_MAX_ANALYSES)), None
+
+
+async def run_analysis_batch(items, max_analyses, emit):
+    """
+    Prefetch verdicts for many links. Links with a list or rule verdict are answered at
+    once; at most max_analyses of the rest are analyzed (the per-batch cost cap), at
+    prefetch priority, and stored as prefetched so the first visit re-decides them from
+    the page itself; emit() receives one line per link and a final summary.
+    """
+    config = await asyncio.to_thread(get_monitoring_config)
+    summary = {"cached": 0, "analyzed": 0, "skipped": 0, "errors": 0}
+
+    unique = {}
+    for item in items:
+        unique.setdefault(canonicalize_url(item["url"]), item)
+
+    def quick_verdicts():
+        return [(link, item, quick_verdict(item["url"], link, item.get("title", ""), config,
+                                           item.get("content", ""), prefetch=True))
+                for link, item in unique.items()]
+
+    pending = []
+    for link, item, result in await asyncio.to_thread(quick_verdicts):
+        if result is not None:
+            summary["cached"] += 1
+            emit({"url": item["url"], "link": link, "status": "cached", "action": result["action"]})
+        elif len(pending) < max_analyses:
+            pending.append((link, item))
+        else:
+            summary["skipped"] += 1
+            emit({"url": item["url"], "link": link, "status": "skipped", "reason": "Batch analysis cap reached"})
+
+    async def analyze(link, item):
+        url, title, content = item["url"], item.get("title", ""), item.get("content", "")
+        try:
+            async with prefetch_gate.prefetch_slot():
+                with llm_scheduler.priority("background"):
+                    # Its own flight: a visit must neither be answered from an anchor-text guess
+                    # nor wait behind the background queue
+                    result = await analysis_flight.do_async(
+                        f"prefetch:{link}",
+                        lambda: run_and_store_analysis(link, url, title, content, prefetch=True),
+                        timeout=ANALYSIS_WAIT_TIMEOUT,
+                    )
+            if result.get("analysis_failed"):
+                summary["errors"] += 1
+                emit({"url": url, "link": link, "status": "error"})
+                return
+            summary["analyzed"] += 1
+            emit({"url": url, "link": link, "status": "analyzed", "action": result["action"]})
+        except Exception as e:
+            print(f"Batch analysis for {link} failed: {e}", flush=True)
+            summary["errors"] += 1
+            emit({"url": url, "link": link, "status": "error"})
+
+    await asyncio.gather(*(analyze(link, item) for link, item in pending))
+    emit(dict(summary, done=True))
+
+
+def wants_analysis_ticket(data, headers):
+    """Clients opt into ticket mode with {"async": true} or a Prefer: respond-async header"""
+    return bool(data.get("async")) or "respond-async" in headers.get("Prefer", "")
+
+
+def start_analysis_ticket(data):
+    """
+    Ticket mode of /analyze. Answers from the lists or the prompt rules immediately,
+    otherwise queues the agent run and returns its ticket.
+
+    Returns:
+        (body, status): the verdict with 200, or the ticket with 202
+    """
+    url = data.get("url", "")
+    link = canonicalize_url(url)
+    title = data.get("title", "")
+    content = data.get("content", "")
+
+    access_tracker.record(link, canonical_domain(link), url, title, content)
+    config = get_monitoring_config()
+    result = quick_verdict(url, link, title, config, content)
+    if result is not None:
+        return with_appeal_fields(result, config), 200
+
+    ticket = analysis_queue.submit(link, lambda: analyze_with_agent(link, url, title, content, config))
+    return {
+        "status": "pending",
+        "ticket": ticket.id,
+        "events_url": f"/analyze/{ticket.id}/events",
+        "poll_url": f"/analyze/{ticket.id}",
+    }, 202
+
+
+@app.route("/analyze", methods=["POST"])
+def analyze_webpage():
+    data = request.json
+    if wants_analysis_ticket(data, request.headers):
+        body, status = start_analysis_ticket(data)
+        return jsonify(body), status
+    return jsonify(llm_runtime.run_sync(analyze_page(data)))
+
+
+@app.route("/analyze/batch", methods=["POST"])
+def analyze_batch():
+    """Prefetch verdicts for many links; streams one NDJSON line per link, then a summary"""
+    items, max_analyses, error = parse_batch_request(request.json)
+    if error:
+        return jsonify({"ok": False, "error": error}), 400
+
+    return Response(
+        stream_with_context(ndjson_stream(lambda emit: run_analysis_batch(items, max_analyses, emit))),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/analyze/<ticket_id>/events", methods=["GET"])
+def analysis_ticket_events(ticket_id):
+    """Server-Sent Events stream that delivers a ticket's verdict as a single 'result' event"""
+    ticket = analysis_queue.get(ticket_id)
+    if ticket is None:
+        return jsonify({"error": "Unknown or expired ticket"}), 404
+
+    return Response(
+        stream_with_context(sse_stream(ticket, heartbeat=ANALYSIS_EVENTS_HEARTBEAT)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
-    return jsonify(result)
+@app.route("/analyze/<ticket_id>", methods=["GET"])
+def poll_analysis_ticket(ticket_id):
+    """Long-poll a ticket: ?wait=<seconds> blocks until the verdict is ready (202 while pending)"""
+    ticket = analysis_queue.get(ticket_id)
+    if ticket is None:
+        return jsonify({"error": "Unknown or expired ticket"}), 404
+
+    try:
+        wait = min(max(float(request.args.get("wait", 0)), 0), ANALYSIS_LONG_POLL_MAX)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+
+    finished = wait_for_ticket(ticket, wait)
+    return jsonify(ticket.to_dict()), 200 if finished else 202
 
 
 # @app.route("/analyze", methods=["POST", "OPTIONS"])
@@ -533,16 +1102,50 @@ def analyze_webpage():
 
 #     return jsonify(result)
 
+# ==================== DASHBOARD LIST ENDPOINTS ====================
+# GET list endpoints accept ?sort=&order=&q=&reason=&fields=&limit=&cursor=. Without limit they
+# return the whole (filtered) list as a bare array; with it, {"items", "next_cursor", "version"}.
+# Every response carries an ETag, so an unchanged poll is answered 304 from the version alone.
+
+def conditional_list_response(name, version, build):
+    """304 if the client already holds this version of the list, else build() as JSON"""
+    etag = list_etag(name, version, request.args)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"  # Browsers revalidate with If-None-Match
+    response.headers["X-List-Version"] = version
+    return response
+
+
+def replica_list_response(name, replica, keep=None, extra_version=()):
+    """A list endpoint served from its in-memory replica; keep(entry) filters entries out"""
+    key_field = replica.key_field
+    try:
+        page = parse_page_args(request.args, (key_field, "added_at", "reason"), default_sort="added_at",
+                               filter_fields=("reason",))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    version = list_version(replica.current_version(), *extra_version)
+
+    def build():
+        entries = [entry for _, entry in replica.items() if keep is None or keep(entry)]
+        items, next_cursor = page_entries(entries, page, key_field)
+        return page_body(items, next_cursor, page, version)
+
+    return conditional_list_response(name, version, build)
+
+
 @app.route("/whitelist", methods=["GET"])
 def get_whitelist():
-    items = list(whitelist_col.find({}, {"_id": 0}))
-    return jsonify(items)
+    return replica_list_response("whitelist", whitelist_replica)
 
 
 @app.route("/blacklist", methods=["GET"])
 def get_blacklist():
-    items = list(blacklist_col.find({}, {"_id": 0}))
-    return jsonify(items)
+    return replica_list_response("blacklist", blacklist_replica)
 
 
 @app.route("/config", methods=["GET"])
@@ -578,29 +1181,33 @@ def update_config():
     }
 
     update_monitoring_config(new_config)
+    monitor_channel.notify()
+    rule_prescreen.compile(new_config["monitoring_prompt"])
 
-    # If monitoring prompt changed, clear AI-generated lists
+    # If monitoring prompt changed, AI-generated verdicts become stale
     if prompt_changed:
-        print("Monitoring prompt changed - clearing AI-generated lists...")
+        print("Monitoring prompt changed - AI-generated verdicts will be re-checked...")
 
-        # Clear web blacklist (AI-generated only)
-        result = blacklist_col.delete_many({"reason": {"$in": ["AI Analysis", "Appeal auto-approved"]}})
-        print(f"Removed {result.deleted_count} AI-generated blacklist entries")
+        # Analyses still running were started under the old prompt
+        cancelled = analysis_flight.cancel_all()
+        if cancelled:
+            print(f"Cancelled {cancelled} in-flight analyses")
 
-        # Clear web whitelist (AI-generated only, keep manually added)
-        result = whitelist_col.delete_many({"reason": {"$in": ["AI Analysis", "Appeal auto-approved"]}})
-        print(f"Removed {result.deleted_count} AI-generated whitelist entries")
+        result = verdict_cache.retain_prompt(new_config["monitoring_prompt"])
+        print(f"Removed {result} cached content verdicts")
 
-        # Clear desktop blacklist (AI-generated only)
-        result = blacklist_desktop_col.delete_many({"reason": "AI Analysis"})
-        print(f"Removed {result.deleted_count} AI-generated desktop blacklist entries")
+        # The classifier learned the old prompt's verdicts; it retrains once new ones accumulate
+        verdict_model.reset()
+
+        # List verdicts are kept: their prompt_hash no longer matches, so STALE_VERDICT_MODE
+        # decides whether they are served, and they are re-scored as the child visits them
 
         # Reinitialize critical system apps
         initialize_critical_system_apps()
 
         return jsonify({
             "ok": True,
-            "message": "Configuration updated successfully. AI-generated lists cleared to apply new guidelines."
+            "message": "Configuration updated successfully. AI-generated verdicts will be re-checked against the new guidelines."
         })
 
     return jsonify({"ok": True, "message": "Configuration updated successfully"})
@@ -610,7 +1217,7 @@ def update_config():
 def add_to_whitelist_endpoint():
     """Add domain to whitelist"""
     data = request.json
-    domain = data.get("domain", "").strip().lower()
+    domain = canonicalize_url(data.get("domain", "").strip().lower())
 
     if not domain:
         return jsonify({"ok": False, "error": "Domain is required"}), 400
@@ -624,10 +1231,9 @@ def add_to_whitelist_endpoint():
 @app.route("/whitelist/<path:domain>", methods=["DELETE"])
 def remove_from_whitelist(domain):
     """Remove domain from whitelist and add to blacklist"""
-    domain = domain.strip().lower()
-    result = whitelist_col.delete_one({"link": domain})
-
-    if result.deleted_count > 0:
+    domain = canonicalize_url(domain.strip().lower())
+    if smart_db_manager.delete_list_entry("whitelist", domain):
+        whitelist_replica.discard(domain)
         # Add to blacklist when parent removes from whitelist
         add_to_blacklist(domain, reason="Parent added", parental_reasoning="Parent manually removed this website from whitelist")
         return jsonify({"ok": True, "message": f"Removed {domain} from whitelist and added to blacklist"})
@@ -639,7 +1245,7 @@ def remove_from_whitelist(domain):
 def add_to_blacklist_endpoint():
     """Add domain to blacklist"""
     data = request.json
-    domain = data.get("domain", "").strip().lower()
+    domain = canonicalize_url(data.get("domain", "").strip().lower())
 
     if not domain:
         return jsonify({"ok": False, "error": "Domain is required"}), 400
@@ -653,10 +1259,9 @@ def add_to_blacklist_endpoint():
 @app.route("/blacklist/<path:domain>", methods=["DELETE"])
 def remove_from_blacklist(domain):
     """Remove domain from blacklist and add to whitelist"""
-    domain = domain.strip().lower()
-    result = blacklist_col.delete_one({"link": domain})
-
-    if result.deleted_count > 0:
+    domain = canonicalize_url(domain.strip().lower())
+    if smart_db_manager.delete_list_entry("blacklist", domain):
+        blacklist_replica.discard(domain)
         # Add to whitelist when parent unblocks
         add_to_whitelist(domain, reason="Parent approved", parental_reasoning="Parent manually unblocked this website")
         return jsonify({"ok": True, "message": f"Removed {domain} from blacklist and added to whitelist"})
@@ -666,13 +1271,31 @@ def remove_from_blacklist(domain):
 
 @app.route("/pending-approvals", methods=["GET"])
 def get_pending_approvals():
-    """Get all pending parent approvals"""
-    approvals = list(pending_approvals_col.find(
-        {"status": "awaiting_parent"},
-        {"_id": 0}
-    ).sort("timestamp", -1))
+    """Get pending parent approvals, newest first (?status= for other states; paged like the lists)"""
+    try:
+        page = parse_page_args(request.args, ("timestamp",), default_sort="timestamp", default_order="desc")
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    status = request.args.get("status", "awaiting_parent")
+    version = list_version(smart_db_manager.approvals_version())
+
+    def build():
+        # Keyset query on the (status, timestamp) index; one extra row tells whether a next page exists
+        approvals = smart_db_manager.approvals_page(
+            status,
+            descending=page.descending,
+            after=cursor_datetime(page.after) if page.after else None,
+            after_id=page.after[1] if page.after else "",
+            limit=page.limit + 1 if page.limit else None,
+            fields=page.fields,
+        )
+        next_cursor = None
+        if page.limit and len(approvals) > page.limit:
+            approvals = approvals[:page.limit]
+            next_cursor = encode_cursor(approvals[-1].get("timestamp"), approvals[-1].get("approval_id", ""))
+        return page_body(approvals, next_cursor, page, version)
 
-    return jsonify(approvals)
+    return conditional_list_response("pending-approvals", version, build)
 
 
 @app.route("/approve-appeal", methods=["POST"])
@@ -685,7 +1308,7 @@ def approve_appeal():
         return jsonify({"ok": False, "error": "approval_id is required"}), 400
 
     # Find the pending approval
-    approval = pending_approvals_col.find_one({"approval_id": approval_id})
+    approval = smart_db_manager.get_approval(approval_id)
     if not approval:
         return jsonify({"ok": False, "error": "Approval request not found"}), 404
 
@@ -698,16 +1321,10 @@ def approve_appeal():
     add_to_whitelist(link, reason="Parent approved appeal")
 
     # Update the appeal status
-    appeals_col.update_one(
-        {"appeal_id": approval.get("appeal_id")},
-        {"$set": {"status": "parent_approved", "resolved_at": datetime.now()}}
-    )
+    smart_db_manager.update_appeal(approval.get("appeal_id"), {"status": "parent_approved", "resolved_at": datetime.now()})
 
     # Update pending approval status
-    pending_approvals_col.update_one(
-        {"approval_id": approval_id},
-        {"$set": {"status": "approved", "resolved_at": datetime.now()}}
-    )
+    smart_db_manager.update_approval(approval_id, {"status": "approved", "resolved_at": datetime.now()})
 
     return jsonify({"ok": True, "message": f"Appeal approved for {link}"})
 
@@ -722,7 +1339,7 @@ def deny_appeal():
         return jsonify({"ok": False, "error": "approval_id is required"}), 400
 
     # Find the pending approval
-    approval = pending_approvals_col.find_one({"approval_id": approval_id})
+    approval = smart_db_manager.get_approval(approval_id)
     if not approval:
         return jsonify({"ok": False, "error": "Approval request not found"}), 404
 
@@ -730,16 +1347,10 @@ def deny_appeal():
         return jsonify({"ok": False, "error": "This approval has already been processed"}), 409
 
     # Update the appeal status
-    appeals_col.update_one(
-        {"appeal_id": approval.get("appeal_id")},
-        {"$set": {"status": "parent_denied", "resolved_at": datetime.now()}}
-    )
+    smart_db_manager.update_appeal(approval.get("appeal_id"), {"status": "parent_denied", "resolved_at": datetime.now()})
 
     # Update pending approval status
-    pending_approvals_col.update_one(
-        {"approval_id": approval_id},
-        {"$set": {"status": "denied", "resolved_at": datetime.now()}}
-    )
+    smart_db_manager.update_approval(approval_id, {"status": "denied", "resolved_at": datetime.now()})
 
     return jsonify({"ok": True, "message": "Appeal denied"})
 
@@ -790,7 +1401,7 @@ async def evaluate_appeal_with_llm(link, title, previous_evaluation_reason  , ap
                 past_reasoning=previous_evaluation_reason,
                 appeal_reason=appeal_reason
         )
-        result = await Runner.run(appeal_agent, prompt)
+        result = await llm_scheduler.run(appeal_agent, prompt, priority="interactive")
         structured = result.final_output_as(Final_Appeal_JSON)
         # response = await appeal_agent.run(
         #     prompt=prompts.appeals_prompt.format(
@@ -831,7 +1442,7 @@ async def analyze_desktop_screenshot(app_name, window_title, image_data_url, mon
             ]
         }]
 
-        result = await Runner.run(desktop_monitor_agent, input=input_items)
+        result = await llm_scheduler.run(desktop_monitor_agent, input_items, priority="desktop")
         structured = result.final_output_as(Desktop_Analysis_JSON)
         return structured.model_dump()
 
@@ -844,34 +1455,13 @@ async def analyze_desktop_screenshot(app_name, window_title, image_data_url, mon
         }
 
 
-@app.route("/appeal", methods=["POST"])
-def submit_appeal():
-    """Child submits appeal for blocked content"""
-    data = request.json
-    link = data.get("url", "")
-    appeal_reason = data.get("appeal_reason", "")
-    title = data.get("title", "")
-
-    domain = urlparse(link).netloc.lower()
-    config = get_monitoring_config()
-    agent_can_auto_approve = config.get("agent_can_auto_approve", False)
-
-    entry = blacklist_col.find_one({"link": link})
-    if not entry:
-        return jsonify({
-            "ok": False,
-            "error": "URL is not blacklisted, nothing to appeal."
-        }), 400
-
-    appeals_used = entry.get("appeals", 0)
-    if appeals_used >= 1:
-        return jsonify({
-            "ok": False,
-            "error": "Appeal already used for this URL."
-        }), 403
-
+def open_appeal(entry, link, domain, appeal_reason):
+    """
+    Record a new appeal and use up the page's appeal (on the blocking entry only when it is
+    the page's own; a parent's domain or path rule is left untouched). Returns the appeal_id.
+    """
     appeal_id = f"appeal_{int(time.time())}"
-    appeals_col.insert_one({
+    smart_db_manager.insert_appeal({
         "appeal_id": appeal_id,
         "link": link,
         "domain": domain,
@@ -880,66 +1470,55 @@ def submit_appeal():
         "status": "pending",
     })
 
+    if entry["link"] != link:
+        return appeal_id  # The appeal record itself counts against the page
+
     # Mark that an appeal was used
-    blacklist_col.update_one(
-        {"_id": entry["_id"]},
-        {
-            "$inc": {"appeals": 1},
-            "$set": {
-                "last_appeal_at": datetime.now(),
-                "last_appeal_message": appeal_reason,
-            },
+    smart_db_manager.update_list_entry(
+        "blacklist",
+        entry["link"],
+        set_fields={
+            "last_appeal_at": datetime.now(),
+            "last_appeal_message": appeal_reason,
         },
+        inc={"appeals": 1},
     )
+    blacklist_replica.reload_key(entry["link"])
+    return appeal_id
 
-    # SCENARIO 2: Agent does NOT have auto-approve authority
-    # Skip AI evaluation and go directly to parent
-    if not agent_can_auto_approve:
-        approval_id = f"approval_{int(time.time())}"
-        pending_approvals_col.insert_one({
-            "approval_id": approval_id,
-            "appeal_id": appeal_id,
-            "link": link,
-            "domain": domain,
-            "child_reason": appeal_reason,
-            "timestamp": datetime.now(),
-            "status": "awaiting_parent",
-        })
 
-        appeals_col.update_one(
-            {"appeal_id": appeal_id},
-            {"$set": {"status": "awaiting_parent"}},
-        )
+def send_appeal_to_parent(appeal_id, link, domain, appeal_reason):
+    """Queue an appeal for the parent's decision and email them"""
+    approval_id = f"approval_{int(time.time())}"
+    smart_db_manager.insert_approval({
+        "approval_id": approval_id,
+        "appeal_id": appeal_id,
+        "link": link,
+        "domain": domain,
+        "child_reason": appeal_reason,
+        "timestamp": datetime.now(),
+        "status": "awaiting_parent",
+    })
 
-        send_approval_request_email(approval_id, link, appeal_reason)
+    smart_db_manager.update_appeal(appeal_id, {"status": "awaiting_parent"})
 
-        return jsonify({
-            "ok": True,
-            "status": "pending_parent",
-            "action": "block",
-            "reason": "Your request has been sent to your parent for approval.",
-        })
+    send_approval_request_email(approval_id, link, appeal_reason)
 
-    # SCENARIO 1: Agent HAS auto-approve authority
-    # Let AI evaluate first
-    # Use parental_reasoning from entry, fallback to old "reason" field for backward compatibility
-    past_reasoning = entry.get("parental_reasoning", entry.get("reason", "Previously blocked"))
-    decision = asyncio.run(evaluate_appeal_with_llm(link, title, past_reasoning, appeal_reason, config["monitoring_prompt"]))
 
+def apply_appeal_decision(entry, appeal_id, link, domain, appeal_reason, decision, prompt_hash=None):
+    """Persist the appeal agent's decision and return the response body for the child"""
     # Update blacklist with AI decision (store both reasoning types)
-    blacklist_col.update_one(
-        {"_id": entry["_id"]},
-        {"$set": {
-            "last_appeal_llm_reasoning": decision.get("reasoning"),
-            "last_appeal_llm_parental_reasoning": decision.get("parental_reasoning")
-        }},
-    )
+    smart_db_manager.update_list_entry("blacklist", entry["link"], set_fields={
+        "last_appeal_llm_reasoning": decision.get("reasoning"),
+        "last_appeal_llm_parental_reasoning": decision.get("parental_reasoning")
+    })
+    blacklist_replica.reload_key(entry["link"])
 
     if decision["action"] == "approve":
         # AI approved the appeal
         # Create a pending approval record so parent can respond to reverse the decision
         approval_id = f"approval_{int(time.time())}"
-        pending_approvals_col.insert_one({
+        smart_db_manager.insert_approval({
             "approval_id": approval_id,
             "appeal_id": appeal_id,
             "link": link,
@@ -950,52 +1529,107 @@ def submit_appeal():
             "ai_decision": decision.get("parental_reasoning"),
         })
 
-        whitelist_col.insert_one({
+        whitelisted_entry = {
             "link": link,
             "added_at": datetime.now(),
             "reason": "Appeal auto-approved",  # Fixed: Use consistent tag for filtering
             "reasoning": decision.get("reasoning"),
             "parental_reasoning": decision.get("parental_reasoning"),
+            "prompt_hash": prompt_hash,
+        }
+        smart_db_manager.insert_list_entry("whitelist", whitelisted_entry)
+        whitelist_replica.put(whitelisted_entry)
+        smart_db_manager.delete_list_entry("blacklist", entry["link"])
+        blacklist_replica.discard(entry["link"])
+
+        smart_db_manager.update_appeal(appeal_id, {
+            "status": "auto_approved",
+            "agent_decision": decision.get("parental_reasoning"),
+            "reasoning": decision.get("reasoning")
         })
-        blacklist_col.delete_one({"link": link})
-
-        appeals_col.update_one(
-            {"appeal_id": appeal_id},
-            {"$set": {
-                "status": "auto_approved",
-                "agent_decision": decision.get("parental_reasoning"),
-                "reasoning": decision.get("reasoning")
-            }},
-        )
 
         notify_parent_appeal_approved(approval_id, link, appeal_reason, decision.get("parental_reasoning"))
 
-        return jsonify({
+        return {
             "ok": True,
             "status": "approved",
             "action": "allow",
             "reasoning": decision.get("reasoning"),  # Child-safe message
             "reload": True,
-        })
+        }
 
     # AI denied the appeal - offer escalation to parent
-    appeals_col.update_one(
-        {"appeal_id": appeal_id},
-        {"$set": {
-            "status": "ai_denied",
-            "agent_decision": decision.get("parental_reasoning"),
-            "reasoning": decision.get("reasoning")
-        }},
-    )
+    smart_db_manager.update_appeal(appeal_id, {
+        "status": "ai_denied",
+        "agent_decision": decision.get("parental_reasoning"),
+        "reasoning": decision.get("reasoning")
+    })
 
-    return jsonify({
+    return {
         "ok": True,
         "status": "ai_denied",
         "action": "block",
         "reasoning": decision.get("reasoning"),  # Child-safe message
         "can_escalate": True,
         "appeal_id": appeal_id,
-    })
+    }
+
+
+async def process_appeal(data):
+    """The /appeal pipeline, shared by the Flask route and the ASGI server. Returns (body, status)."""
+    url = data.get("url", "")
+    link = canonicalize_url(url)
+    appeal_reason = data.get("appeal_reason", "")
+    title = data.get("title", "")
+
+    domain = canonical_domain(link)
+    config = await asyncio.to_thread(get_monitoring_config)
+    agent_can_auto_approve = config.get("agent_can_auto_approve", False)
+
+    entry = find_blocking_entry(link)
+    if not entry:
+        return {
+            "ok": False,
+            "error": "URL is not blacklisted, nothing to appeal."
+        }, 400
+
+    if await asyncio.to_thread(appeals_used, link, entry) >= 1:
+        return {
+            "ok": False,
+            "error": "Appeal already used for this URL."
+        }, 403
+
+    appeal_id = await asyncio.to_thread(open_appeal, entry, link, domain, appeal_reason)
+
+    # SCENARIO 2: Agent does NOT have auto-approve authority, or the block is the parent's own
+    # rule (which an automatic approval could neither lift nor outrank): go directly to parent
+    if not agent_can_auto_approve or entry.get("reason") not in AI_REASONS:
+        await asyncio.to_thread(send_appeal_to_parent, appeal_id, link, domain, appeal_reason)
+        return {
+            "ok": True,
+            "status": "pending_parent",
+            "action": "block",
+            "reason": "Your request has been sent to your parent for approval.",
+        }, 200
+
+    # SCENARIO 1: Agent HAS auto-approve authority
+    # Let AI evaluate first
+    # Use parental_reasoning from entry, fallback to old "reason" field for backward compatibility
+    past_reasoning = entry.get("parental_reasoning", entry.get("reason", "Previously blocked"))
+    decision = await evaluate_appeal_with_llm(url, title, past_reasoning, appeal_reason, config["monitoring_prompt"])
+
+    body = await asyncio.to_thread(
+        apply_appeal_decision, entry, appeal_id, link, domain, appeal_reason, decision,
+        prompt_fingerprint(config["monitoring_prompt"]),
+    )
+    return body, 200
+
+
+@app.route("/appeal", methods=["POST"])
+def submit_appeal():
+    """Child submits appeal for blocked content"""
+    body, status = llm_runtime.run_sync(process_appeal(request.json))
+    return jsonify(body), status
 
 
 @app.route("/escalate-to-parent", methods=["POST"])
@@ -1003,11 +1637,11 @@ def escalate_to_parent():
     """Child escalates to parent after AI denied the appeal"""
     data = request.json
     appeal_id = data.get("appeal_id", "")
-    link = data.get("url", "")
+    link = canonicalize_url(data.get("url", ""))
     appeal_reason = data.get("appeal_reason", "")
 
     # Verify the appeal exists and was AI-denied
-    appeal = appeals_col.find_one({"appeal_id": appeal_id})
+    appeal = smart_db_manager.get_appeal(appeal_id)
     if not appeal:
         return jsonify({
             "ok": False,
@@ -1020,11 +1654,11 @@ def escalate_to_parent():
             "error": "This appeal cannot be escalated."
         }), 403
 
-    domain = urlparse(link).netloc.lower()
+    domain = canonical_domain(link)
 
     # Create pending approval for parent review
     approval_id = f"approval_{int(time.time())}"
-    pending_approvals_col.insert_one({
+    smart_db_manager.insert_approval({
         "approval_id": approval_id,
         "appeal_id": appeal_id,
         "link": link,
@@ -1037,10 +1671,7 @@ def escalate_to_parent():
     })
 
     # Update appeal status
-    appeals_col.update_one(
-        {"appeal_id": appeal_id},
-        {"$set": {"status": "escalated_to_parent"}},
-    )
+    smart_db_manager.update_appeal(appeal_id, {"status": "escalated_to_parent"})
 
     # Send email to parent
     send_approval_request_email(approval_id, link, appeal_reason)
@@ -1076,96 +1707,263 @@ def initialize_monitoring():
         "blocked_apps": blocked_apps,
     }
     update_monitoring_config(new_config)
+    monitor_channel.notify()
+    rule_prescreen.compile(monitoring_prompt)
     return jsonify({"status": "success", "message": "Monitoring configuration initialized."})
 
 
-# Desktop monitoring endpoints
-@app.route("/desktop/screenshot", methods=["POST"])
-def analyze_desktop_app():
-    """Analyze desktop application screenshot"""
-    data = request.json
+def record_desktop_block(app_name, screenshot_base64, result, prompt_hash=None):
+    """Save the offending screenshot and blacklist the app, replacing a stale automatic block"""
+    # Generate unique image ID
+    image_id = str(uuid.uuid4())
+
+    # Create screenshots directory if it doesn't exist
+    screenshots_dir = os.path.join(os.path.dirname(__file__), "screenshots")
+    os.makedirs(screenshots_dir, exist_ok=True)
+
+    # Save screenshot
+    screenshot_path = os.path.join(screenshots_dir, f"{image_id}.png")
+    try:
+        with open(screenshot_path, "wb") as f:
+            f.write(base64.b64decode(screenshot_base64))
+    except Exception as e:
+        print(f"Error saving screenshot: {e}")
+        screenshot_path = None
+
+    # Add to blacklist
+    drop_stale_desktop_block(app_name)
+    add_to_desktop_blacklist(
+        app_name,
+        reason="AI Analysis",
+        screenshot_id=image_id,
+        reasoning=result.get("reasoning"),
+        parental_reasoning=result.get("parental_reasoning"),
+        prompt_hash=prompt_hash,
+    )
+
+
+def drop_stale_desktop_block(app_name):
+    """Remove an app's automatic block once it has been re-screened"""
+    entry = blacklist_desktop_replica.get(app_name.lower())
+    if entry is not None and entry.get("reason") == "AI Analysis":
+        smart_db_manager.delete_list_entry("blacklist_desktop", app_name.lower(), reasons=["AI Analysis"])
+        blacklist_desktop_replica.discard(app_name.lower())
+
+
+def is_current_desktop_block(entry, prompt_hash):
+    """
+    Whether a desktop blacklist entry still applies. An automatic block made under an older
+    prompt does not: the monitor never reports blacklisted apps, so such a block is only
+    re-screened if the app is treated as unknown again.
+    """
+    return entry is not None and not (entry.get("reason") == "AI Analysis" and entry.get("prompt_hash") != prompt_hash)
+
+
+async def process_desktop_screenshot(data):
+    """The /desktop/screenshot pipeline, shared by the Flask route and the ASGI server. Returns (body, status)."""
     app_name = data.get("app_name", "")
     window_title = data.get("window_title", "")
     screenshot_base64 = data.get("screenshot", "")
 
     if not app_name or not screenshot_base64:
-        return jsonify({"action": "ok", "reason": "Missing required data"}), 400
+        return {"action": "ok", "reason": "Missing required data"}, 400
 
     # Check if app is whitelisted
     if is_app_whitelisted(app_name):
-        return jsonify({
+        return {
             "action": "ok",
             "reason": "Application is whitelisted"
-        })
+        }, 200
+
+    # Get monitoring config
+    config = await asyncio.to_thread(get_monitoring_config)
+    monitoring_prompt = config.get("monitoring_prompt", "")
+    prompt_hash = prompt_fingerprint(monitoring_prompt)
 
     # Check if app is already blacklisted
-    if is_app_blacklisted(app_name):
-        return jsonify({
+    if is_current_desktop_block(blacklist_desktop_replica.get(app_name.lower()), prompt_hash):
+        return {
             "action": "terminate",
             "reason": "Application has been blocked by parental settings. Please wait for parental approval."
-        })
-
-    # Get monitoring config
-    config = get_monitoring_config()
-    monitoring_prompt = config.get("monitoring_prompt", "")
+        }, 200
 
     # Convert base64 to data URL for vision API
     image_data_url = f"data:image/png;base64,{screenshot_base64}"
 
     # Analyze screenshot with vision agent
-    result = asyncio.run(analyze_desktop_screenshot(
+    result = await analyze_desktop_screenshot(
         app_name, window_title, image_data_url, monitoring_prompt
-    ))
+    )
 
     if result["action"] == "block":
-        # Generate unique image ID
-        image_id = str(uuid.uuid4())
-
-        # Create screenshots directory if it doesn't exist
-        screenshots_dir = os.path.join(os.path.dirname(__file__), "screenshots")
-        os.makedirs(screenshots_dir, exist_ok=True)
-
-        # Save screenshot
-        screenshot_path = os.path.join(screenshots_dir, f"{image_id}.png")
-        try:
-            with open(screenshot_path, "wb") as f:
-                f.write(base64.b64decode(screenshot_base64))
-        except Exception as e:
-            print(f"Error saving screenshot: {e}")
-            screenshot_path = None
-
-        # Add to blacklist
-        add_to_desktop_blacklist(
-            app_name,
-            reason="AI Analysis",
-            screenshot_id=image_id,
-            reasoning=result.get("reasoning"),
-            parental_reasoning=result.get("parental_reasoning")
-        )
+        await asyncio.to_thread(record_desktop_block, app_name, screenshot_base64, result, prompt_hash)
 
-        return jsonify({
+        return {
             "action": "terminate",
             "reason": result.get("reasoning", "This application may violate parental guidelines. Please wait for parental approval.")
-        })
+        }, 200
 
-    return jsonify({
+    # A stale block the new prompt no longer supports is lifted
+    await asyncio.to_thread(drop_stale_desktop_block, app_name)
+    return {
         "action": "allow",
         "reason": ""
-    })
+    }, 200
+
+
+# Desktop monitoring endpoints
+@app.route("/desktop/screenshot", methods=["POST"])
+def analyze_desktop_app():
+    """Analyze desktop application screenshot"""
+    body, status = llm_runtime.run_sync(process_desktop_screenshot(request.json))
+    return jsonify(body), status
 
 
 @app.route("/desktop/whitelist", methods=["GET"])
 def get_desktop_whitelist():
     """Get all whitelisted desktop apps"""
-    items = list(whitelist_desktop_col.find({}, {"_id": 0}))
-    return jsonify(items)
+    return replica_list_response("desktop-whitelist", whitelist_desktop_replica)
 
 
 @app.route("/desktop/blacklist", methods=["GET"])
 def get_desktop_blacklist():
-    """Get all blacklisted desktop apps"""
-    items = list(blacklist_desktop_col.find({}, {"_id": 0}))
-    return jsonify(items)
+    """Get all blacklisted desktop apps, except stale automatic blocks (re-screened on next use)"""
+    prompt_hash = prompt_fingerprint(get_monitoring_config()["monitoring_prompt"])
+    return replica_list_response(
+        "desktop-blacklist",
+        blacklist_desktop_replica,
+        keep=lambda entry: is_current_desktop_block(entry, prompt_hash),
+        extra_version=(prompt_hash,),
+    )
+
+
+def desktop_list_delta(since):
+    """Changes to both desktop lists since a change-log version (see ListChangeLog.changes_since)"""
+    prompt_hash = prompt_fingerprint(get_monitoring_config()["monitoring_prompt"])
+    # Load the replicas before reading the log, so the first sync is not an empty snapshot
+    whitelist_desktop_replica.current_version()
+    blacklist_desktop_replica.current_version()
+    return desktop_list_changes.changes_since(
+        since,
+        {"whitelist": None, "blacklist": lambda entry: is_current_desktop_block(entry, prompt_hash)},
+        # A prompt change re-filters the blacklist wholesale, so versions are per prompt
+        context=prompt_hash,
+    )
+
+
+def desktop_lists_version():
+    return desktop_list_changes.version(prompt_fingerprint(get_monitoring_config()["monitoring_prompt"]))
+
+
+def monitor_config():
+    """The part of the monitoring configuration the desktop monitor acts on"""
+    config = get_monitoring_config()
+    return {
+        "desktop_monitoring_enabled": config.get("desktop_monitoring_enabled", True),
+        "screenshot_interval": config.get("screenshot_interval", 15),
+        "version": config.get("version", 0),
+    }
+
+
+# Pushed to every monitor when the config cache or the list change log moves; a 'lists'
+# event carries the version it applies to ('since'), so a monitor at another version refetches
+monitor_channel.watch("config", lambda: monitoring_config.version, lambda _: monitor_config())
+monitor_channel.watch("lists", desktop_lists_version, lambda since: dict(desktop_list_delta(since), since=since))
+
+
+@app.route("/desktop/lists", methods=["GET"])
+def get_desktop_list_changes():
+    """
+    App names added to / removed from both desktop lists since ?since=<version>, or the full
+    lists (full: true) when there is no usable version. The monitor keeps the returned version.
+    """
+    return jsonify(desktop_list_delta(request.args.get("since")))
+
+
+def monitor_opening_events(since):
+    """What a monitor receives on (re)connect: the current config and its list changes"""
+    return lambda: [
+        ("config", monitor_config()),
+        ("lists", dict(desktop_list_delta(since), since=since)),
+    ]
+
+
+@app.route("/desktop/events", methods=["GET"])
+def desktop_monitor_events():
+    """
+    Server-Sent Events stream for a desktop monitor (?since=<lists version>&device=<id>):
+    'config', 'lists' and 'command' events as they happen, with heartbeats in between
+    """
+    since = request.args.get("since")
+    return Response(
+        stream_with_context(monitor_channel.stream(request.args.get("device"), monitor_opening_events(since))),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/desktop/terminate", methods=["POST"])
+def terminate_desktop_app():
+    """Tell connected monitors (all, or ?device's) to close an app now, without blacklisting it (never a protected one)"""
+    data = request.json or {}
+    app_name = data.get("app_name", "").strip().lower()
+    if not app_name:
+        return jsonify({"ok": False, "error": "App name is required"}), 400
+    entry = whitelist_desktop_replica.get(app_name)
+    if app_name in CRITICAL_SYSTEM_APPS or (entry is not None and entry.get("protected")):
+        return jsonify({"ok": False, "error": f"{app_name} is a protected system application"}), 403
+
+    delivered = monitor_channel.command("terminate", data.get("device"), app=app_name)
+    return jsonify({"ok": True, "delivered": delivered})
+
+
+# ==================== CLIENT LIST FILTER ====================
+
+def list_filter_version():
+    prompt_hash = prompt_fingerprint(get_monitoring_config()["monitoring_prompt"])
+    replicas = (whitelist_replica, blacklist_replica, whitelist_desktop_replica, blacklist_desktop_replica)
+    return list_version(*(replica.current_version() for replica in replicas), prompt_hash), prompt_hash
+
+
+def list_filter_keys(prompt_hash):
+    """Keys of every list as stored in the filters; desktop blocks exclude stale automatic ones"""
+    def url_keys(replica):
+        return {key for key in map(url_rule_key, replica.keys()) if key}
+
+    return {
+        "url_blacklist": url_keys(blacklist_replica),
+        "url_whitelist": url_keys(whitelist_replica),
+        "desktop_blacklist": {app for app, entry in blacklist_desktop_replica.items()
+                              if is_current_desktop_block(entry, prompt_hash)},
+        "desktop_whitelist": set(whitelist_desktop_replica.keys()),
+    }
+
+
+@app.route("/lists/filter", methods=["GET"])
+def get_list_filter():
+    """
+    Binary Bloom-filter snapshot of the URL and desktop lists (format: see list_filter).
+    Clients rule out 'not listed' locally and only ask the server about possible hits.
+    """
+    version, prompt_hash = list_filter_version()
+    etag = list_etag("list-filter", version, request.args)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        _, body = list_filter.get(version, lambda: list_filter_keys(prompt_hash))
+        response = Response(body, mimetype="application/octet-stream")
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-List-Version"] = version
+    return response
+
+
+@app.route("/lists/filter/report", methods=["GET"])
+def get_list_filter_report():
+    """Size and false-positive rate of each filter in the current snapshot"""
+    version, prompt_hash = list_filter_version()
+    list_filter.get(version, lambda: list_filter_keys(prompt_hash))
+    return jsonify(list_filter.report())
 
 
 @app.route("/desktop/whitelist", methods=["POST"])
@@ -1189,12 +1987,12 @@ def remove_from_desktop_blacklist(app_name):
     app_name = app_name.strip().lower()
 
     # Get the entry to find screenshot ID
-    entry = blacklist_desktop_col.find_one({"app": app_name})
+    entry = smart_db_manager.find_list_entry("blacklist_desktop", app_name)
 
     # Delete the entry
-    result = blacklist_desktop_col.delete_one({"app": app_name})
-
-    if result.deleted_count > 0:
+    if smart_db_manager.delete_list_entry("blacklist_desktop", app_name):
+        blacklist_desktop_replica.discard(app_name)
+        monitor_channel.notify()
         # Add to whitelist when parent approves
         add_to_desktop_whitelist(app_name, reason="Parent approved")
 
@@ -1234,10 +2032,41 @@ def health_check():
     return jsonify({"status": "ok"})
 
 
-def main():
-    """
-    Entry point for the service. Validates configuration and starts the Flask app.
-    """
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Runtime counters for the caching and coalescing layers"""
+    return jsonify({
+        "analysis_coalescing": analysis_flight.snapshot(),
+        "analysis_tickets": analysis_queue.snapshot(),
+        "prefetch": prefetch_gate.snapshot(),
+        "list_replicas": {
+            "whitelist": whitelist_replica.snapshot(),
+            "blacklist": blacklist_replica.snapshot(),
+            "whitelist_desktop": whitelist_desktop_replica.snapshot(),
+            "blacklist_desktop": blacklist_desktop_replica.snapshot(),
+        },
+        "desktop_list_changes": desktop_list_changes.snapshot(),
+        "monitor_channel": monitor_channel.snapshot(),
+        "list_filter": list_filter.snapshot(),
+        "url_index": url_index.sizes(),
+        "canonicalization": canonicalization_stats.snapshot(),
+        "near_duplicates": content_index.snapshot(),
+        "verdict_cache": verdict_cache.snapshot(),
+        "transcript_cache": transcript_cache.snapshot(),
+        "rule_prescreen": rule_prescreen.describe(),
+        "decision_tiers": decision_tiers.snapshot(),
+        "stale_verdicts": dict(revalidator.snapshot(), mode=STALE_VERDICT_MODE),
+        "cache_warmer": cache_warmer.snapshot(),
+        "local_classifier": verdict_model.snapshot(),
+        "content_reduction": reduction_stats.snapshot(),
+        "monitoring_config": monitoring_config.snapshot(),
+        "llm_scheduler": llm_scheduler.scheduler.snapshot(),
+        "database": smart_db_manager.snapshot(),
+    })
+
+
+def parse_args():
+    """Command-line options shared by the Flask and ASGI entry points"""
     parser = argparse.ArgumentParser(description="Northlight content filter API")
     parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"),
                         help="Host interface to bind (default: 127.0.0.1)")
@@ -1245,37 +2074,100 @@ def main():
                         help="Port to bind (default: 5000)")
     parser.add_argument("--debug", action="store_true",
                         help="Enable Flask debug mode")
-    args = parser.parse_args()
+    return parser.parse_args()
 
+
+def stamp_unversioned_verdicts(prompt_hash):
+    """
+    Stamp automatic verdicts that have no prompt_hash with the current one. Before
+    versioning, a prompt change deleted them, so all that remain were made under it.
+    """
+    for list_name, replica, reasons in (
+        ("whitelist", whitelist_replica, AI_REASONS),
+        ("blacklist", blacklist_replica, AI_REASONS),
+        ("blacklist_desktop", blacklist_desktop_replica, ["AI Analysis"]),
+    ):
+        stamped = smart_db_manager.stamp_list_entries(list_name, reasons, prompt_hash)
+        if stamped:
+            print(f"Stamped {stamped} {list_name} verdicts with the current prompt")
+            replica.invalidate()
+
+
+def initialize_services():
+    """Validate configuration and start the background services both server modes rely on"""
     # --- Validate critical env/config ---
     if not openai.api_key:
         print("WARNING: OPENAI_API_KEY not set. LLM checks will fail.", file=sys.stderr)
 
     # --- Check Mongo connectivity early (fast fail) ---
     try:
-        client.admin.command("ping")
+        smart_db_manager.ping()
         print("MongoDB connection successful.")
     except Exception as e:
-        print(f"ERROR: Could not connect to MongoDB at {MONGO_URI}\\n{e}", file=sys.stderr)
+        print(f"ERROR: Could not connect to MongoDB at {smart_db_manager.MONGO_URI}\\n{e}", file=sys.stderr)
         sys.exit(1)
 
+    # --- Create / migrate the declared indexes (python db_indexes.py --check verifies the query plans) ---
+    index_report = db_indexes.ensure_indexes(db)
+    if index_report["created"] or index_report["rebuilt"]:
+        print(f"Indexes created: {index_report['created']}; rebuilt: {index_report['rebuilt']}")
+
     # --- Initialize monitoring config with defaults if it doesn't exist ---
     print("Initializing default monitoring configuration...")
-    get_monitoring_config()
+    monitoring_prompt = get_monitoring_config()["monitoring_prompt"]
+    rule_prescreen.compile(monitoring_prompt)
     print("Monitoring configuration initialized.")
 
+    # --- Stamp verdicts stored before prompt versioning ---
+    stamp_unversioned_verdicts(prompt_fingerprint(monitoring_prompt))
+
     # --- Initialize critical system apps whitelist ---
     initialize_critical_system_apps()
 
+    # --- Load in-memory list replicas and keep them in sync ---
+    for replica in (whitelist_replica, blacklist_replica, whitelist_desktop_replica, blacklist_desktop_replica):
+        replica.start()
+    print("List replicas loaded.")
+
+    # --- Push config and desktop list changes to connected monitors ---
+    monitor_channel.start()
+
+    # --- Train the local verdict classifier from the lists, and keep retraining it ---
+    start_background_training(verdict_model, classifier_examples, interval=CLASSIFIER_RETRAIN_INTERVAL)
+
+    # --- Start the shared LLM event loop and HTTP client ---
+    llm_runtime.get_loop()
+    print("LLM runtime started.")
+
+    # --- Re-score stale verdicts in the background as they are visited ---
+    revalidator.start(revalidate_verdict)
+
+    # --- Pre-analyze the most visited pages off-peak, and persist the visit counters ---
+    access_tracker.load(access_counters_col)
+    cache_warmer.start(
+        needs_warming,
+        revalidate_verdict,
+        busy=interactive_load,
+        on_tick=lambda: access_tracker.save(access_counters_col),
+    )
+
     # --- Start Email Monitoring Service ---
     print("Starting email monitoring service...")
     start_email_monitoring(check_interval=10)  # Check inbox every 60 seconds
     print("Email monitoring service initialized.")
 
+
+def main():
+    """
+    Entry point for the service. Validates configuration and starts the Flask app.
+    For the async serving mode run asgi_server.py instead.
+    """
+    args = parse_args()
+    initialize_services()
+
     # --- Start Flask app ---
     print(f"Starting server on {args.host}:{args.port}...")
     app.run(host=args.host, port=args.port, debug=args.debug)
 
 if __name__ == "__main__":
     main()
-
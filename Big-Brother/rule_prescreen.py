@@ -0,0 +1,309 @@
+"""
+Rule Pre-screen - Settle clear-cut pages from the monitoring prompt without an agent run
+Responsibilities:
+1. Derive structured site and keyword rules from the parent's free-text monitoring prompt
+2. Compile them once per prompt: site lookups by domain, and an Aho-Corasick automaton for keywords
+3. Decide a page in microseconds when a rule settles it, and escalate everything else
+4. Count how often each decision tier (lists, rules, caches, agent) answers a page
+
+Only prompts made of simple instructions are settled locally, e.g.
+    "Block google only."             -> block google, allow everything else
+    "Block youtube.com and reddit."  -> block those, escalate everything else
+    "Only allow wikipedia."          -> allow wikipedia, block everything else
+    'Block pages with "casino".'     -> block URLs/titles containing the quoted term
+Any sentence that is not one of these (e.g. "no violent content") is left to the agent,
+and then pages no rule matches always escalate. So do pages of any site or keyword such a
+sentence mentions ("Block youtube. Allow educational youtube videos."): its rules are dropped,
+since the sentence may carve out exceptions the parser cannot see.
+"""
+
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+from url_canonicalizer import canonical_domain
+
+BLOCK_VERBS = {"block", "ban", "deny", "disallow", "forbid", "prevent", "restrict", "stop"}
+ALLOW_VERBS = {"allow", "permit", "unblock", "approve", "whitelist"}
+# Words that carry no rule content in "block the google website only"-style sentences
+FILLER_WORDS = {
+    "a", "access", "all", "also", "and", "any", "anything", "com", "containing", "contains",
+    "domain", "domains", "dot", "else", "everything", "for", "from", "in", "just", "of", "on",
+    "only", "or", "other", "page", "pages", "please", "site", "sites", "that", "the", "to",
+    "url", "urls", "with", "website", "websites", "except", "but",
+}
+# Bare names treated as sites ("block google"), with the domains they stand for; any other
+# bare word is a topic for the agent. Explicit domains, so "github" never covers *.github.io
+KNOWN_SITES = {
+    "amazon": ["amazon.com"],
+    "bing": ["bing.com"],
+    "discord": ["discord.com", "discord.gg"],
+    "duckduckgo": ["duckduckgo.com"],
+    "facebook": ["facebook.com"],
+    "instagram": ["instagram.com"],
+    "netflix": ["netflix.com"],
+    "pinterest": ["pinterest.com"],
+    "reddit": ["reddit.com", "redd.it"],
+    "roblox": ["roblox.com"],
+    "snapchat": ["snapchat.com"],
+    "spotify": ["spotify.com"],
+    "steam": ["steampowered.com", "steamcommunity.com"],
+    "tiktok": ["tiktok.com"],
+    "tumblr": ["tumblr.com"],
+    "twitch": ["twitch.tv"],
+    "twitter": ["twitter.com", "x.com"],
+    "wikipedia": ["wikipedia.org"],
+    "yahoo": ["yahoo.com"],
+    "youtube": ["youtube.com", "youtu.be"],
+    "google": ["google.com"],
+    "whatsapp": ["whatsapp.com"],
+    "khanacademy": ["khanacademy.org"],
+    "github": ["github.com"],
+}
+
+_SENTENCE_RE = re.compile(r"[.;!?\n]+(?=\s|$)")
+_DOMAIN_RE = re.compile(r"\b[a-z0-9](?:[a-z0-9-]*[a-z0-9])?(?:\.[a-z0-9-]+)+\b")
+# Double quotes only, so apostrophes ("don't", "kids'") never open a keyword
+_QUOTED_RE = re.compile(r"[\"“]([^\"”]{2,})[\"”]")
+_WORD_RE = re.compile(r"[a-z0-9-]+")
+# Second-level labels under country TLDs that are not themselves registrable (google.co.uk)
+_SECOND_LEVEL = {"ac", "co", "com", "edu", "gov", "net", "org"}
+
+
+def site_name(host: str) -> str:
+    """The leftmost label of a host's registrable domain: 'google' for maps.google.co.uk"""
+    labels = host.split(":")[0].split(".")
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL:
+        return labels[-3]
+    return labels[-2] if len(labels) >= 2 else labels[0]
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher: one pass over the text finds every pattern"""
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for index, pattern in enumerate(self.patterns):
+            node = 0
+            for char in pattern:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            self._out[node].append(index)
+
+        # Breadth-first failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def iter_matches(self, text: str):
+        """Yield (end_index, pattern_index) for every occurrence; end_index is exclusive"""
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for index in self._out[node]:
+                yield position + 1, index
+
+
+class Rule:
+    """One derived rule: a site or keyword target with the action it triggers"""
+
+    def __init__(self, kind: str, target: str, action: str, source: str):
+        self.kind = kind  # "site" or "keyword"
+        self.target = target
+        self.action = action  # "block" or "approve"
+        self.source = source  # The prompt sentence it came from
+
+    def __repr__(self):
+        return f"Rule({self.kind}:{self.target} -> {self.action})"
+
+
+class CompiledRules:
+    """Rules derived from one monitoring prompt, with the action for pages no rule matches"""
+
+    def __init__(self, rules: List[Rule], default_action: Optional[str]):
+        self.rules = rules
+        self.default_action = default_action  # None: unmatched pages escalate to the agent
+        site_rules = [rule for rule in rules if rule.kind == "site"]
+        keyword_rules = [rule for rule in rules if rule.kind == "keyword"]
+        # Site rules match the domain itself or any subdomain of it
+        self._site_domains: Dict[str, List[Rule]] = {}
+        for rule in site_rules:
+            self._site_domains.setdefault(rule.target, []).append(rule)
+        self._keyword_rules = keyword_rules
+        self._keywords = AhoCorasick([rule.target for rule in keyword_rules])
+
+    def match(self, host: str, text: str) -> Optional[Rule]:
+        """Matching rule for a page, blocks first. text is the lower-cased URL and title."""
+        hits = []
+        labels = host.split(":")[0].split(".")
+        for depth in range(len(labels)):
+            hits += self._site_domains.get(".".join(labels[depth:]), [])
+        for end, index in self._keywords.iter_matches(text):
+            rule = self._keyword_rules[index]
+            start = end - len(rule.target)
+            if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                hits.append(rule)
+        if not hits:
+            return None
+        return next((rule for rule in hits if rule.action == "block"), hits[0])
+
+
+def _parse_sentence(sentence: str):
+    """
+    Rules from one prompt sentence.
+
+    Returns:
+        (rules, default_action, understood): default_action is set by "X only" /
+        "only allow X" / "block everything except X"; understood is False when the
+        sentence says anything the parser cannot express as rules
+    """
+    text = sentence.lower().strip()
+    if not text:
+        return [], None, True
+
+    words = _WORD_RE.findall(text)
+    verbs = [word for word in words if word in BLOCK_VERBS or word in ALLOW_VERBS]
+    if len(set(verbs)) != 1:
+        return [], None, False
+    action = "block" if verbs[0] in BLOCK_VERBS else "approve"
+    opposite = "approve" if action == "block" else "block"
+
+    rules = []
+    keywords = [match.strip() for match in _QUOTED_RE.findall(sentence.lower())]
+    for keyword in keywords:
+        rules.append(Rule("keyword", keyword, action, sentence.strip()))
+    remainder = _QUOTED_RE.sub(" ", text)
+
+    domains = _DOMAIN_RE.findall(remainder)
+    remainder = _DOMAIN_RE.sub(" ", remainder)
+    targets = [domain[4:] if domain.startswith("www.") else domain for domain in domains]
+    leftover = []
+    for word in _WORD_RE.findall(remainder):
+        if word in KNOWN_SITES:
+            targets += KNOWN_SITES[word]
+        elif word not in FILLER_WORDS and word != verbs[0]:
+            leftover.append(word)
+    if leftover or not (targets or keywords):
+        return [], None, False
+
+    default_action = None
+    if "except" in words or "but" in words:
+        # "block everything except wikipedia": the listed sites get the opposite action
+        if not ({"everything", "all", "anything"} & set(words)) or keywords:
+            return [], None, False
+        rules = [Rule("site", target, opposite, sentence.strip()) for target in targets]
+        default_action = action
+    else:
+        rules += [Rule("site", target, action, sentence.strip()) for target in targets]
+        if "only" in words or "just" in words:
+            # "block google only" allows the rest; "only allow wikipedia" blocks the rest
+            default_action = opposite
+    return rules, default_action, True
+
+
+def _mentioned(rule: Rule, sentence: str) -> bool:
+    """Whether a sentence names a rule's site or contains its keyword"""
+    if rule.kind == "keyword":
+        return rule.target in sentence
+    names = {site_name(rule.target)} | {name for name, domains in KNOWN_SITES.items() if rule.target in domains}
+    return rule.target in sentence or bool(names.intersection(_WORD_RE.findall(sentence)))
+
+
+def compile_prompt(monitoring_prompt: str) -> CompiledRules:
+    """Derive and compile the rules of a monitoring prompt"""
+    rules, defaults, not_understood = [], set(), []
+    for sentence in _SENTENCE_RE.split(monitoring_prompt or ""):
+        sentence_rules, default_action, sentence_understood = _parse_sentence(sentence)
+        rules += sentence_rules
+        if not sentence_understood:
+            not_understood.append(sentence.lower())
+        if default_action:
+            defaults.add(default_action)
+    # A target a sentence we could not parse talks about is left to the agent entirely
+    rules = [rule for rule in rules if not any(_mentioned(rule, sentence) for sentence in not_understood)]
+    # A default is only safe when every sentence was understood and they agree on it
+    default_action = defaults.pop() if not not_understood and len(defaults) == 1 else None
+    return CompiledRules(rules, default_action)
+
+
+class RulePrescreen:
+    """Rules for the current monitoring prompt, recompiled only when the prompt changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prompt = None
+        self._compiled = CompiledRules([], None)
+
+    def compile(self, monitoring_prompt: str) -> CompiledRules:
+        with self._lock:
+            if monitoring_prompt != self._prompt:
+                self._compiled = compile_prompt(monitoring_prompt)
+                self._prompt = monitoring_prompt
+                print(f"Rule pre-screen compiled {len(self._compiled.rules)} rules "
+                      f"(default: {self._compiled.default_action or 'escalate'})", flush=True)
+            return self._compiled
+
+    def evaluate(self, link: str, title: str, monitoring_prompt: str) -> Optional[Dict]:
+        """
+        Verdict for a canonical link when a rule settles it.
+
+        Returns:
+            {"action", "rule"} or None when the page must go to the agent
+        """
+        compiled = self.compile(monitoring_prompt)
+        if not compiled.rules and compiled.default_action is None:
+            return None
+        rule = compiled.match(canonical_domain(link), f"{link} {title or ''}".lower())
+        if rule is not None:
+            return {"action": rule.action, "rule": rule.source}
+        if compiled.default_action is not None:
+            return {"action": compiled.default_action, "rule": None}
+        return None
+
+    def describe(self) -> Dict:
+        with self._lock:
+            return {
+                "rules": [repr(rule) for rule in self._compiled.rules],
+                "default_action": self._compiled.default_action,
+            }
+
+
+class TierStats:
+    """Which decision tier answered each page"""
+
+    TIERS = ("lists", "rules", "content_cache", "near_duplicate", "classifier", "agent")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {tier: 0 for tier in self.TIERS}
+
+    def record(self, tier: str):
+        with self._lock:
+            self._counts[tier] += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        return {
+            "total": total,
+            "counts": counts,
+            "hit_rates": {tier: round(count / total, 4) if total else 0.0 for tier, count in counts.items()},
+        }
@@ -0,0 +1,302 @@
+"""
+Smart DB Manager - The one data-access layer shared by the server and the email agent
+Responsibilities:
+1. Own a single pooled MongoClient per process, with pool size and timeouts from the environment,
+   or an embedded SQLite database when MONGO_URI is sqlite:///path (see sqlite_store)
+2. Hand out the shared collection handles (lists, appeals, approvals, config and caches)
+3. Repository functions for the list, appeal, approval and configuration operations
+4. Time every database command by collection and operation, for /metrics
+
+Each module used to open its own MongoClient, so the process held two connection
+pools and two copies of every collection handle. Going through this module also
+leaves one place to add caching or batching later.
+"""
+
+import math
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, MongoClient, monitoring
+
+from config_service import ConfigService
+from sqlite_store import SqliteDatabase, sqlite_path
+
+# mongodb://... or mongodb+srv://... for MongoDB, sqlite:///northlight.db for the embedded store
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+STORAGE_BACKEND = "sqlite" if MONGO_URI.startswith("sqlite:") else "mongodb"
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "NorthlightDB")
+
+# Connection pool: the Flask threads, ticket workers and background services share it
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))
+MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", "300000"))
+# Timeouts (ms): fail a request quickly rather than hang a worker when Mongo is down or the pool is exhausted
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+
+# Key field of each list collection
+LIST_KEYS = {
+    "whitelist": "link",
+    "blacklist": "link",
+    "whitelist_desktop": "app",
+    "blacklist_desktop": "app",
+}
+
+MONITORING_CONFIG_QUERY = {"type": "monitoring_rules"}
+
+
+# ==================== LATENCY INSTRUMENTATION ====================
+
+class LatencyListener(monitoring.CommandListener):
+    """Per (collection, command) latency, fed by the driver's command monitoring events"""
+
+    # Handshakes and cursor continuations (change streams block in getMore by design)
+    IGNORED = {"hello", "ismaster", "isMaster", "ping", "getMore", "killCursors", "endSessions"}
+
+    def __init__(self, samples: int = 256):
+        self.samples = samples
+        self._targets: Dict[tuple, str] = {}
+        self._ops: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name in self.IGNORED:
+            return
+        target = event.command.get(event.command_name)
+        name = f"{target}.{event.command_name}" if isinstance(target, str) else event.command_name
+        with self._lock:
+            self._targets[(event.connection_id, event.request_id)] = name
+
+    def succeeded(self, event):
+        self._record(event, failed=False)
+
+    def failed(self, event):
+        self._record(event, failed=True)
+
+    def _record(self, event, failed: bool):
+        with self._lock:
+            name = self._targets.pop((event.connection_id, event.request_id), None)
+        if name is not None:
+            self.record(name, event.duration_micros / 1000.0, failed)
+
+    def record(self, name: str, ms: float, failed: bool = False):
+        """One operation on 'collection.command' (also called directly by the SQLite backend)"""
+        with self._lock:
+            op = self._ops.get(name)
+            if op is None:
+                op = self._ops[name] = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                        "recent": deque(maxlen=self.samples)}
+            op["count"] += 1
+            op["errors"] += failed
+            op["total_ms"] += ms
+            op["max_ms"] = max(op["max_ms"], ms)
+            op["recent"].append(ms)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            ops = {name: dict(op, recent=sorted(op["recent"])) for name, op in self._ops.items()}
+        report = {}
+        for name, op in sorted(ops.items()):
+            recent = op.pop("recent")
+            report[name] = {
+                "count": op["count"],
+                "errors": op["errors"],
+                "avg_ms": round(op["total_ms"] / op["count"], 2) if op["count"] else 0.0,
+                "p95_ms": round(recent[max(0, math.ceil(len(recent) * 0.95) - 1)], 2) if recent else 0.0,
+                "max_ms": round(op["max_ms"], 2),
+            }
+        return report
+
+
+latency = LatencyListener()
+
+if STORAGE_BACKEND == "sqlite":
+    client = None
+    db = SqliteDatabase(sqlite_path(MONGO_URI), on_operation=latency.record)
+else:
+    client = MongoClient(
+        MONGO_URI,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        event_listeners=[latency],
+    )
+    db = client[MONGO_DB_NAME]
+
+# # List document structure:
+# {
+#     'link': 'google.com' or 'google.com/really-bad-page',   ('app': 'steam.exe' for desktop lists)
+#     'added_at': datetime,
+#     'approval_made': 0 or 1,
+#     'reason': 'AI Analysis' or 'Manual'
+# }
+whitelist_col = db["whitelist"]
+blacklist_col = db["blacklist"]
+whitelist_desktop_col = db["whitelist_desktop"]
+blacklist_desktop_col = db["blacklist_desktop"]
+
+appeals_col = db["appeals"]
+pending_approvals_col = db["pending_approvals"]
+config_col = db["config"]
+
+# In-process copy of the monitoring rules, versioned on every write
+monitoring_config = ConfigService.shared(config_col, MONITORING_CONFIG_QUERY)
+
+
+def ping():
+    """Raises if the database cannot be reached (within the server selection timeout for Mongo)"""
+    db.command("ping")
+
+
+# ==================== LISTS ====================
+
+def find_list_entry(list_name: str, key: str) -> Optional[dict]:
+    return db[list_name].find_one({LIST_KEYS[list_name]: key})
+
+
+def insert_list_entry(list_name: str, entry: dict):
+    """Insert entry (raises DuplicateKeyError if the key is listed already); entry gains its _id"""
+    db[list_name].insert_one(entry)
+
+
+def upsert_list_entry(list_name: str, key: str, fields: Dict):
+    db[list_name].update_one({LIST_KEYS[list_name]: key}, {"$set": fields}, upsert=True)
+
+
+def update_list_entry(list_name: str, key: str, set_fields: Optional[Dict] = None, inc: Optional[Dict] = None):
+    update = {}
+    if set_fields:
+        update["$set"] = set_fields
+    if inc:
+        update["$inc"] = inc
+    db[list_name].update_one({LIST_KEYS[list_name]: key}, update)
+
+
+def delete_list_entry(list_name: str, key: str, reasons: Optional[Iterable[str]] = None) -> bool:
+    """Delete the entry for key (only if its reason is one of reasons, when given). True if one was deleted."""
+    query = {LIST_KEYS[list_name]: key}
+    if reasons is not None:
+        query["reason"] = {"$in": list(reasons)}
+    return db[list_name].delete_one(query).deleted_count > 0
+
+
+def stamp_list_entries(list_name: str, reasons: Iterable[str], prompt_hash: str) -> int:
+    """Set prompt_hash on entries with one of reasons that have none. Returns how many were stamped."""
+    result = db[list_name].update_many(
+        {"reason": {"$in": list(reasons)}, "prompt_hash": {"$exists": False}},
+        {"$set": {"prompt_hash": prompt_hash}},
+    )
+    return result.modified_count
+
+
+# ==================== APPEALS ====================
+
+def insert_appeal(appeal: dict):
+    appeals_col.insert_one(appeal)
+
+
+def get_appeal(appeal_id: str) -> Optional[dict]:
+    return appeals_col.find_one({"appeal_id": appeal_id})
+
+
+def update_appeal(appeal_id: str, fields: Dict):
+    appeals_col.update_one({"appeal_id": appeal_id}, {"$set": fields})
+
+
+def count_appeals(link: str) -> int:
+    """Appeals made for one page"""
+    return appeals_col.count_documents({"link": link})
+
+
+# ==================== APPROVALS ====================
+
+# Approval writes made through this module, so the list endpoint can tell an unchanged list without a query
+_approval_writes = 0
+_approval_lock = threading.Lock()
+
+
+def _approvals_changed():
+    global _approval_writes
+    with _approval_lock:
+        _approval_writes += 1
+
+
+def approvals_version() -> int:
+    return _approval_writes
+
+
+def insert_approval(approval: dict):
+    pending_approvals_col.insert_one(approval)
+    _approvals_changed()
+
+
+def get_approval(approval_id: str) -> Optional[dict]:
+    return pending_approvals_col.find_one({"approval_id": approval_id})
+
+
+def update_approval(approval_id: str, fields: Dict):
+    pending_approvals_col.update_one({"approval_id": approval_id}, {"$set": fields})
+    _approvals_changed()
+
+
+def approvals_page(status: str, descending: bool = True, after: Optional[datetime] = None,
+                   after_id: str = "", limit: Optional[int] = None,
+                   fields: Optional[List[str]] = None) -> List[dict]:
+    """
+    Approvals in one status ordered by (timestamp, approval_id) (newest first by default),
+    without Mongo's _id. after and after_id are the keyset position: the timestamp and id of
+    the previous page's last approval, so approvals sharing a timestamp are never skipped.
+    Served by the (status, timestamp, approval_id) index.
+    """
+    query = {"status": status}
+    if after is not None:
+        op = "$lt" if descending else "$gt"
+        query["$or"] = [{"timestamp": {op: after}}, {"timestamp": after, "approval_id": {op: after_id}}]
+    projection = {"_id": 0}
+    if fields:
+        projection.update(dict.fromkeys(["approval_id", "timestamp"] + fields, 1))
+    direction = DESCENDING if descending else ASCENDING
+    cursor = pending_approvals_col.find(query, projection).sort([("timestamp", direction), ("approval_id", direction)])
+    if limit:
+        cursor = cursor.limit(limit)
+    return list(cursor)
+
+
+# ==================== CONFIG ====================
+
+def get_config() -> Optional[dict]:
+    """The monitoring configuration (cached, see config_service), or None if there is none yet"""
+    return monitoring_config.get()
+
+
+def create_config(defaults: Dict) -> dict:
+    return monitoring_config.create(defaults)
+
+
+def update_config(fields: Dict) -> dict:
+    return monitoring_config.update(fields)
+
+
+def snapshot() -> Dict:
+    if STORAGE_BACKEND == "sqlite":
+        storage = {"path": db.path, "journal_mode": db.journal_mode()}
+    else:
+        storage = {
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        }
+    return {
+        "backend": STORAGE_BACKEND,
+        "storage": storage,
+        "operations": latency.snapshot(),
+    }
@@ -0,0 +1,506 @@
+"""
+SQLite Store - Embedded storage backend for single-machine deployments
+Responsibilities:
+1. Store each collection as a SQLite table of JSON documents, in one WAL-mode database file
+2. Answer the subset of the pymongo Collection API the data layer and caches use
+   (find/find_one, insert, update/replace/delete, find_one_and_update, create_index)
+3. Back create_index with expression indexes on the same json_extract() the queries use,
+   so key lookups are index seeks, and emulate TTL indexes with a periodic sweep
+4. Report indexes and query plans in the shape db_indexes checks for Mongo
+   (index_information(), cursor.explain() with COLLSCAN for a table scan)
+5. Report each operation's latency under the same names as Mongo's command monitoring
+
+Selected in smart_db_manager with MONGO_URI=sqlite:///path/to/northlight.db. Most
+households run the server on the child's PC, where a lookup against a local file beats
+a socket round trip to a separate mongod process. Change streams are not available, so
+the list replicas and the config service fall back to their polling paths.
+"""
+
+import base64
+import json
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+# Statements cached per connection; queries are parameterized, so each shape is compiled once
+STATEMENT_CACHE_SIZE = 512
+BUSY_TIMEOUT_MS = 5000
+TTL_SWEEP_INTERVAL = 60
+
+_FIELD = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+_COMPARISONS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def sqlite_path(uri: str) -> str:
+    """'sqlite:///northlight.db' -> 'northlight.db', 'sqlite:////var/db/n.db' -> '/var/db/n.db'"""
+    path = uri[len("sqlite://"):]
+    return path[1:] if path.startswith("/") else path
+
+
+# ==================== DOCUMENT ENCODING ====================
+
+def _encode_default(value):
+    # Extended-JSON style tags. isoformat with fixed precision keeps dates ordered as text.
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat(timespec="microseconds")}
+    if isinstance(value, (bytes, bytearray)):
+        return {"$binary": base64.b64encode(bytes(value)).decode("ascii")}
+    raise TypeError(f"Cannot store {type(value).__name__} in SQLite")
+
+
+def _decode_hook(obj):
+    if len(obj) == 1:
+        if "$date" in obj:
+            return datetime.fromisoformat(obj["$date"])
+        if "$binary" in obj:
+            return base64.b64decode(obj["$binary"])
+    return obj
+
+
+def encode(doc) -> str:
+    # Compact separators match json_extract()'s rendering of stored objects
+    return json.dumps(doc, default=_encode_default, separators=(",", ":"), ensure_ascii=False)
+
+
+def decode(text: str):
+    return json.loads(text, object_hook=_decode_hook)
+
+
+def _sql_value(value):
+    """A query value as json_extract() returns the stored field"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return encode(value)
+
+
+def _field_sql(field: str) -> str:
+    if field == "_id":
+        return "id"
+    if not _FIELD.match(field):
+        raise ValueError(f"Unsupported field name: {field!r}")
+    return f"json_extract(doc, '$.{field}')"
+
+
+# ==================== QUERIES AND UPDATES ====================
+
+def _where(query: Optional[Dict]) -> Tuple[str, list]:
+    clauses, params = [], []
+    for field, condition in (query or {}).items():
+        if field == "$or":
+            alternatives = [_where(alternative) for alternative in condition]
+            clauses.append("(" + " OR ".join(f"({sql})" for sql, _ in alternatives) + ")" if alternatives else "0")
+            params.extend(param for _, alternative_params in alternatives for param in alternative_params)
+            continue
+        column = _field_sql(field)
+        if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+            for op, value in condition.items():
+                if op == "$in":
+                    values = list(value)
+                    if not values:
+                        clauses.append("0")
+                        continue
+                    clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                    params.extend(_sql_value(v) for v in values)
+                elif op == "$ne":
+                    if value is None:
+                        clauses.append(f"{column} IS NOT NULL")
+                    else:
+                        clauses.append(f"({column} IS NULL OR {column} != ?)")
+                        params.append(_sql_value(value))
+                elif op == "$exists":
+                    if field == "_id":
+                        clauses.append("1" if value else "0")
+                    else:
+                        clauses.append(f"json_type(doc, '$.{field}') IS {'NOT ' if value else ''}NULL")
+                elif op in _COMPARISONS:
+                    clauses.append(f"{column} {_COMPARISONS[op]} ?")
+                    params.append(_sql_value(value))
+                else:
+                    raise NotImplementedError(f"Query operator {op} is not supported by the SQLite backend")
+        elif condition is None:
+            clauses.append(f"{column} IS NULL")
+        else:
+            clauses.append(f"{column} = ?")
+            params.append(_sql_value(condition))
+    return " AND ".join(clauses) or "1", params
+
+
+def _apply_update(doc: dict, update: Dict, inserting: bool) -> dict:
+    for op, fields in update.items():
+        if op == "$set":
+            doc.update(fields)
+        elif op == "$setOnInsert":
+            if inserting:
+                doc.update(fields)
+        elif op == "$inc":
+            for field, amount in fields.items():
+                doc[field] = doc.get(field, 0) + amount
+        elif op == "$unset":
+            for field in fields:
+                doc.pop(field, None)
+        else:
+            raise NotImplementedError(f"Update operator {op} is not supported by the SQLite backend")
+    return doc
+
+
+def _upsert_seed(query: Optional[Dict]) -> dict:
+    """The equality fields of a query, which an upsert copies into the new document"""
+    return {field: value for field, value in (query or {}).items()
+            if not (isinstance(value, dict) and any(key.startswith("$") for key in value))}
+
+
+def _project(doc: dict, projection: Optional[Dict]) -> dict:
+    if not projection:
+        return doc
+    if any(projection.values()):
+        projected = {field: doc[field] for field, keep in projection.items() if keep and field in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            projected["_id"] = doc["_id"]
+        return projected
+    return {field: value for field, value in doc.items() if field not in projection}
+
+
+def _sort_sql(spec) -> str:
+    return ", ".join(f"{_field_sql(field)} {'DESC' if direction < 0 else 'ASC'}" for field, direction in spec)
+
+
+class _Result:
+    """Stand-in for pymongo's InsertOneResult / UpdateResult / DeleteResult"""
+
+    def __init__(self, inserted_id=None, matched_count=0, modified_count=0, upserted_id=None, deleted_count=0):
+        self.inserted_id = inserted_id
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.deleted_count = deleted_count
+        self.acknowledged = True
+
+
+# ==================== DATABASE ====================
+
+class SqliteDatabase:
+    """A SQLite file holding one table per collection, with one connection per thread"""
+
+    def __init__(self, path: str, on_operation: Optional[Callable[[str, float, bool], None]] = None):
+        self.path = path
+        self.name = path
+        self.on_operation = on_operation
+        self._local = threading.local()
+        self._collections: Dict[str, "SqliteCollection"] = {}
+        self._lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit; writes take BEGIN IMMEDIATE themselves so read-modify-write is atomic
+            conn = sqlite3.connect(self.path, isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    def __getitem__(self, name: str) -> "SqliteCollection":
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = SqliteCollection(self, name)
+            return self._collections[name]
+
+    get_collection = __getitem__
+
+    def command(self, name: str):
+        if name != "ping":
+            raise NotImplementedError(f"Command {name} is not supported by the SQLite backend")
+        self.connection().execute("SELECT 1").fetchone()
+        return {"ok": 1.0}
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def journal_mode(self) -> str:
+        return self.connection().execute("PRAGMA journal_mode").fetchone()[0]
+
+
+class SqliteCursor:
+    """Lazy find() result supporting sort() and limit()"""
+
+    def __init__(self, collection: "SqliteCollection", query, projection):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self._sort = []
+        self._limit = 0
+        self._docs = None
+
+    def sort(self, key, direction: int = 1) -> "SqliteCursor":
+        self._sort = list(key) if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def limit(self, count: int) -> "SqliteCursor":
+        self._limit = count
+        return self
+
+    def __iter__(self):
+        if self._docs is None:
+            self._docs = self.collection._select(self.query, self.projection, self._sort, self._limit, "find")
+        return iter(self._docs)
+
+    def explain(self) -> Dict:
+        """SQLite's query plan in the shape of Mongo's explain(): a table scan reports COLLSCAN"""
+        sql, params = self.collection._select_sql(self.query, self._sort, self._limit)
+        details = [row[-1] for row in self.collection.database.connection().execute(
+            "EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+        stages = []
+        for detail in details:
+            if detail.startswith("SCAN") and "USING" not in detail:
+                stages.append("COLLSCAN")
+            elif detail.startswith(("SEARCH", "SCAN")):
+                stages.append("IXSCAN")
+            elif "TEMP B-TREE" in detail:
+                stages.append("SORT")
+        plan = {"stage": "FETCH", "inputStages": [{"stage": stage} for stage in stages], "details": details}
+        return {"queryPlanner": {"winningPlan": plan}}
+
+
+class SqliteCollection:
+    """One collection, stored as rows of (id, JSON document)"""
+
+    def __init__(self, database: SqliteDatabase, name: str):
+        if not re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", name):
+            raise ValueError(f"Unsupported collection name: {name!r}")
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self._ttl: Dict[str, float] = {}
+        self._last_sweep = 0.0
+        database.connection().execute(f'CREATE TABLE IF NOT EXISTS "{name}" (id TEXT PRIMARY KEY, doc TEXT NOT NULL)')
+
+    # ==================== PLUMBING ====================
+
+    def _timed(self, command: str, fn, *args):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = fn(*args)
+            failed = False
+            return result
+        finally:
+            if self.database.on_operation is not None:
+                self.database.on_operation(f"{self.name}.{command}", (time.perf_counter() - started) * 1000.0, failed)
+
+    def _write(self, command: str, fn, *args):
+        """Run fn(conn, *args) in one immediate transaction"""
+        def run():
+            conn = self.database.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn, *args)
+                self._sweep_expired(conn)
+                conn.execute("COMMIT")
+                return result
+            except sqlite3.IntegrityError as e:
+                conn.execute("ROLLBACK")
+                raise DuplicateKeyError(f"{self.name}: {e}", 11000)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self._timed(command, run)
+
+    def _select_sql(self, query, sort=(), limit=0) -> Tuple[str, list]:
+        where, params = _where(query)
+        sql = f'SELECT id, doc FROM "{self.name}" WHERE {where}'
+        if sort:
+            sql += f" ORDER BY {_sort_sql(sort)}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return sql, params
+
+    def _rows(self, conn, query, sort=(), limit=0) -> List[tuple]:
+        sql, params = self._select_sql(query, sort, limit)
+        return conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _doc(row) -> dict:
+        doc = decode(row[1])
+        doc["_id"] = row[0]
+        return doc
+
+    def _select(self, query, projection, sort, limit, command) -> List[dict]:
+        rows = self._timed(command, lambda: self._rows(self.database.connection(), query, sort, limit))
+        return [_project(self._doc(row), projection) for row in rows]
+
+    def _store(self, conn, doc: dict, insert: bool):
+        body = {field: value for field, value in doc.items() if field != "_id"}
+        if insert:
+            conn.execute(f'INSERT INTO "{self.name}" (id, doc) VALUES (?, ?)', (doc["_id"], encode(body)))
+        else:
+            conn.execute(f'UPDATE "{self.name}" SET doc = ? WHERE id = ?', (encode(body), doc["_id"]))
+
+    def _sweep_expired(self, conn):
+        """TTL indexes: drop expired documents, at most once per TTL_SWEEP_INTERVAL"""
+        if not self._ttl or time.time() - self._last_sweep < TTL_SWEEP_INTERVAL:
+            return
+        self._last_sweep = time.time()
+        for field, seconds in self._ttl.items():
+            cutoff = _sql_value(datetime.now() - timedelta(seconds=seconds))
+            conn.execute(f'DELETE FROM "{self.name}" WHERE {_field_sql(field)} < ?', (cutoff,))
+
+    # ==================== READS ====================
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> SqliteCursor:
+        return SqliteCursor(self, query, projection)
+
+    def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> Optional[dict]:
+        docs = self._select(query, projection, (), 1, "find")
+        return docs[0] if docs else None
+
+    def estimated_document_count(self) -> int:
+        return self._timed("count", lambda: self.database.connection().execute(
+            f'SELECT COUNT(*) FROM "{self.name}"').fetchone()[0])
+
+    def count_documents(self, query: Dict) -> int:
+        where, params = _where(query)
+        return self._timed("count", lambda: self.database.connection().execute(
+            f'SELECT COUNT(*) FROM "{self.name}" WHERE {where}', params).fetchone()[0])
+
+    def aggregate(self, pipeline: List[Dict]) -> List[dict]:
+        """Only a single {"$group": {"_id": None, name: {"$sum": "$field" or 1}}} stage"""
+        if len(pipeline) != 1 or "$group" not in pipeline[0] or pipeline[0]["$group"].get("_id") is not None:
+            raise NotImplementedError("Only whole-collection $group/$sum pipelines are supported by the SQLite backend")
+        sums = {name: spec["$sum"] for name, spec in pipeline[0]["$group"].items() if name != "_id"}
+        columns = ", ".join(f"TOTAL({_field_sql(value[1:]) if isinstance(value, str) else float(value)})"
+                            for value in sums.values())
+        row = self._timed("aggregate", lambda: self.database.connection().execute(
+            f'SELECT COUNT(*), {columns} FROM "{self.name}"').fetchone())
+        if not row[0]:
+            return []
+        totals = {name: int(total) if total == int(total) else total for name, total in zip(sums, row[1:])}
+        return [dict(totals, _id=None)]
+
+    def watch(self, *args, **kwargs):
+        raise OperationFailure("Change streams are not supported by the SQLite backend")
+
+    # ==================== WRITES ====================
+
+    def insert_one(self, doc: dict) -> _Result:
+        def insert(conn):
+            doc.setdefault("_id", uuid.uuid4().hex)
+            self._store(conn, doc, insert=True)
+            return _Result(inserted_id=doc["_id"])
+        return self._write("insert", insert)
+
+    def insert_many(self, docs: Iterable[dict]) -> List:
+        docs = list(docs)
+
+        def insert(conn):
+            for doc in docs:
+                doc.setdefault("_id", uuid.uuid4().hex)
+                self._store(conn, doc, insert=True)
+            return [doc["_id"] for doc in docs]
+        return self._write("insert", insert)
+
+    def _update(self, conn, query, update, upsert, many):
+        rows = self._rows(conn, query, limit=0 if many else 1)
+        for row in rows:
+            self._store(conn, _apply_update(self._doc(row), update, inserting=False), insert=False)
+        if rows or not upsert:
+            return _Result(matched_count=len(rows), modified_count=len(rows))
+        doc = _apply_update(_upsert_seed(query), update, inserting=True)
+        doc.setdefault("_id", uuid.uuid4().hex)
+        self._store(conn, doc, insert=True)
+        return _Result(upserted_id=doc["_id"])
+
+    def update_one(self, query: Dict, update: Dict, upsert: bool = False) -> _Result:
+        return self._write("update", self._update, query, update, upsert, False)
+
+    def update_many(self, query: Dict, update: Dict, upsert: bool = False) -> _Result:
+        return self._write("update", self._update, query, update, upsert, True)
+
+    def replace_one(self, query: Dict, replacement: Dict, upsert: bool = False) -> _Result:
+        def replace(conn):
+            rows = self._rows(conn, query, limit=1)
+            if rows:
+                self._store(conn, dict(replacement, _id=rows[0][0]), insert=False)
+                return _Result(matched_count=1, modified_count=1)
+            if not upsert:
+                return _Result()
+            doc = dict(_upsert_seed(query), **replacement)
+            doc.setdefault("_id", uuid.uuid4().hex)
+            self._store(conn, doc, insert=True)
+            return _Result(upserted_id=doc["_id"])
+        return self._write("update", replace)
+
+    def find_one_and_update(self, query: Dict, update: Dict, projection: Optional[Dict] = None,
+                            upsert: bool = False, return_document: bool = False) -> Optional[dict]:
+        """return_document is pymongo's ReturnDocument (BEFORE is False, AFTER is True)"""
+        def find_and_modify(conn):
+            rows = self._rows(conn, query, limit=1)
+            if rows:
+                before = self._doc(rows[0])
+                after = _apply_update(self._doc(rows[0]), update, inserting=False)
+                self._store(conn, after, insert=False)
+                return _project(after if return_document else before, projection)
+            if not upsert:
+                return None
+            doc = _apply_update(_upsert_seed(query), update, inserting=True)
+            doc.setdefault("_id", uuid.uuid4().hex)
+            self._store(conn, doc, insert=True)
+            return _project(doc, projection) if return_document else None
+        return self._write("findAndModify", find_and_modify)
+
+    def _delete(self, conn, query, many):
+        where, params = _where(query)
+        if many:
+            cursor = conn.execute(f'DELETE FROM "{self.name}" WHERE {where}', params)
+        else:
+            cursor = conn.execute(
+                f'DELETE FROM "{self.name}" WHERE id IN (SELECT id FROM "{self.name}" WHERE {where} LIMIT 1)', params)
+        return _Result(deleted_count=cursor.rowcount)
+
+    def delete_one(self, query: Dict) -> _Result:
+        return self._write("delete", self._delete, query, False)
+
+    def delete_many(self, query: Dict) -> _Result:
+        return self._write("delete", self._delete, query, True)
+
+    # ==================== INDEXES ====================
+
+    def create_index(self, keys, unique: bool = False, expireAfterSeconds: Optional[float] = None, name: str = None):
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        # Mongo's default name ('link_1'); SQLite index names are per database, so prefix the table
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        columns = ", ".join(f"{_field_sql(field)} {'DESC' if direction < 0 else 'ASC'}" for field, direction in keys)
+        self._timed("createIndexes", lambda: self.database.connection().execute(
+            f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{self.name}.{name}" ON "{self.name}" ({columns})'))
+        if expireAfterSeconds is not None:
+            self._ttl[keys[0][0]] = expireAfterSeconds
+        return name
+
+    def index_information(self) -> Dict[str, Dict]:
+        """{name: {"key": [(field, direction)], "unique": bool}} like pymongo's, including _id_"""
+        info = {"_id_": {"key": [("_id", 1)]}}
+        rows = self.database.connection().execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (self.name,)).fetchall()
+        for name, sql in rows:
+            keys = [(field, -1 if order == "DESC" else 1)
+                    for field, order in re.findall(r"json_extract\(doc, '\$\.([\w.]+)'\) (ASC|DESC)", sql)]
+            entry = {"key": keys}
+            if sql.upper().startswith("CREATE UNIQUE"):
+                entry["unique"] = True
+            info[name[len(self.name) + 1:] if name.startswith(self.name + ".") else name] = entry
+        return info
+
+    def drop_index(self, name: str):
+        self._timed("dropIndexes", lambda: self.database.connection().execute(
+            f'DROP INDEX IF EXISTS "{self.name}.{name}"'))
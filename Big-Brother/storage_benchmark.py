@@ -0,0 +1,119 @@
+"""
+Storage Benchmark - Lookup and insert latency of the SQLite backend against MongoDB
+Responsibilities:
+1. Replay the list operations the server performs (insert, key lookup, miss, $inc update, delete)
+   against a throwaway collection on each backend
+2. Use a local mongod when one answers, otherwise mongomock as an in-memory stand-in
+3. Print per-operation mean / p50 / p95 latency, so the backends can be compared on the target PC
+
+Usage:
+    python storage_benchmark.py [--count 2000] [--mongo-uri mongodb://localhost:27017/]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from pymongo import ASCENDING
+
+from sqlite_store import SqliteDatabase
+
+BENCHMARK_COLLECTION = "benchmark_list"
+BENCHMARK_DB_NAME = "NorthlightBenchmark"
+
+
+def _timed(fn: Callable, args: List) -> List[float]:
+    samples = []
+    for arg in args:
+        started = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    return samples
+
+
+def run_operations(col, count: int) -> Dict[str, List[float]]:
+    """Latency samples (microseconds) per operation against one collection"""
+    col.create_index([("link", ASCENDING)], unique=True)
+    links = [f"site{i}.example.com/page/{i}" for i in range(count)]
+    return {
+        "insert": _timed(lambda link: col.insert_one({
+            "link": link, "added_at": datetime.now(), "reason": "AI Analysis", "appeals": 0,
+        }), links),
+        "lookup": _timed(lambda link: col.find_one({"link": link}), links),
+        "lookup_miss": _timed(lambda link: col.find_one({"link": "missing." + link}), links),
+        "update": _timed(lambda link: col.update_one({"link": link}, {"$inc": {"appeals": 1}}), links),
+        "delete": _timed(lambda link: col.delete_one({"link": link}), links),
+    }
+
+
+def sqlite_backend(directory: str):
+    database = SqliteDatabase(os.path.join(directory, "benchmark.db"))
+    return database, database[BENCHMARK_COLLECTION], "sqlite (WAL file)"
+
+
+def mongo_backend(uri: str):
+    """(collection, label) for a reachable mongod, else for mongomock, else (None, reason)"""
+    try:
+        from pymongo import MongoClient
+        client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+        client.admin.command("ping")
+        client.drop_database(BENCHMARK_DB_NAME)
+        return client[BENCHMARK_DB_NAME][BENCHMARK_COLLECTION], f"mongodb ({uri})"
+    except Exception as e:
+        reason = f"no mongod at {uri} ({type(e).__name__})"
+    try:
+        import mongomock
+    except ImportError:
+        return None, reason + "; pip install mongomock for an in-memory stand-in"
+    return mongomock.MongoClient()[BENCHMARK_DB_NAME][BENCHMARK_COLLECTION], "mongomock (in-memory stand-in)"
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "mean": statistics.fmean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[max(0, int(len(ordered) * 0.95) - 1)],
+    }
+
+
+def print_report(results: Dict[str, Dict[str, List[float]]]):
+    print(f"{'operation':<12} {'backend':<36} {'mean us':>9} {'p50 us':>9} {'p95 us':>9}")
+    operations = next(iter(results.values())).keys()
+    for operation in operations:
+        for label, samples in results.items():
+            stats = summarize(samples[operation])
+            print(f"{operation:<12} {label:<36} {stats['mean']:>9.1f} {stats['p50']:>9.1f} {stats['p95']:>9.1f}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--count", type=int, default=2000, help="Documents per operation (default: 2000)")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/",
+                        help="mongod to compare against (default: mongodb://localhost:27017/)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        database, col, label = sqlite_backend(directory)
+        results[label] = run_operations(col, args.count)
+        database.close()
+
+        col, label = mongo_backend(args.mongo_uri)
+        if col is None:
+            print(f"Skipping MongoDB: {label}")
+        else:
+            results[label] = run_operations(col, args.count)
+            if label.startswith("mongodb"):
+                col.database.client.drop_database(BENCHMARK_DB_NAME)
+
+    print(f"{args.count} documents per operation\n")
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
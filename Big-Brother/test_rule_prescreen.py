@@ -0,0 +1,40 @@
+"""Rule pre-screen: prompts mixing simple instructions with sentences only the agent understands"""
+
+from rule_prescreen import compile_prompt
+
+
+def decide(prompt, link, title=""):
+    compiled = compile_prompt(prompt)
+    rule = compiled.match(link.split("/")[0], f"{link} {title}".lower())
+    return rule.action if rule is not None else compiled.default_action
+
+
+def test_exception_in_unparsed_sentence_escalates_its_site():
+    prompt = "Block youtube. Allow educational youtube videos like Khan Academy."
+    assert compile_prompt(prompt).rules == []
+    assert decide(prompt, "youtube.com/watch?v=abc", "Khan Academy: Fractions") is None
+
+
+def test_unparsed_sentence_keeps_rules_for_sites_it_does_not_mention():
+    prompt = "Block youtube and reddit. No violent content."
+    assert decide(prompt, "reddit.com/r/aww") == "block"
+    assert decide(prompt, "example.com") is None
+
+
+def test_unparsed_sentence_drops_mentioned_keywords():
+    prompt = 'Block pages with "casino". Casino history lessons are fine.'
+    assert decide(prompt, "example.com/casino") is None
+
+
+def test_fully_understood_prompt_keeps_its_default():
+    prompt = "Block youtube. Block reddit only."
+    assert decide(prompt, "youtube.com/watch?v=abc") == "block"
+    assert decide(prompt, "example.com") == "approve"
+
+
+def test_bare_site_name_covers_its_domains_only():
+    prompt = "Only allow github."
+    assert decide(prompt, "github.com/org/repo") == "approve"
+    assert decide(prompt, "gist.github.com/user") == "approve"
+    assert decide(prompt, "someone.github.io") == "block"
+    assert decide("Block youtube.", "youtu.be/abc") == "block"
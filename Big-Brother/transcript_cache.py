@@ -0,0 +1,178 @@
+"""
+Transcript Cache - Persistent store of YouTube transcripts, keyed by video ID
+Responsibilities:
+1. Keep fetched transcripts (timestamped snippets) zlib-compressed in a Mongo collection
+2. Bound the collection by age (TTL index) and by compressed size (least recently used evicted first)
+3. Serve hot videos from an in-process LRU in front of Mongo
+4. Measure transcript tool-call latency separately for cache hits and misses
+
+The agent asks for the same transcript on every re-analysis (after a prompt change, on
+appeal); fetching it from YouTube each time costs seconds and risks being rate limited.
+"""
+
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from bson.binary import Binary
+from pymongo import ASCENDING
+
+# A snippet is [start seconds, duration seconds, text]
+Snippets = List[list]
+
+
+def compress_snippets(snippets: Snippets) -> bytes:
+    return zlib.compress(json.dumps(snippets, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decompress_snippets(data: bytes) -> Snippets:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def transcript_text(snippets: Snippets) -> str:
+    return " ".join(snippet[2] for snippet in snippets)
+
+
+class TranscriptCache:
+    """Two-level (LRU over Mongo) transcript store under a byte budget"""
+
+    def __init__(self, collection, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: int = 30 * 24 * 3600,
+                 memory_entries: int = 64, evict_every: int = 50):
+        self.collection = collection
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.evict_every = evict_every
+        self._lru: "OrderedDict[str, Snippets]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self._stats = {
+            "memory_hits": 0, "db_hits": 0, "misses": 0, "fetch_errors": 0, "writes": 0, "evicted": 0,
+            "raw_bytes_written": 0, "stored_bytes_written": 0,
+            "hit_seconds": 0.0, "miss_seconds": 0.0,
+        }
+
+    def ensure_indexes(self):
+        self.collection.create_index([("video_id", ASCENDING)], unique=True)
+        self.collection.create_index([("created_at", ASCENDING)], expireAfterSeconds=self.ttl_seconds)
+        self.collection.create_index([("last_used", ASCENDING)])
+
+    # ==================== LOOKUP ====================
+
+    def get(self, video_id: str) -> Optional[Snippets]:
+        """Cached snippets for a video, or None"""
+        with self._lock:
+            snippets = self._lru.get(video_id)
+            if snippets is not None:
+                self._lru.move_to_end(video_id)
+                self._stats["memory_hits"] += 1
+                return snippets
+
+        now = datetime.now()
+        doc = self.collection.find_one_and_update(
+            {"video_id": video_id, "created_at": {"$gt": now - timedelta(seconds=self.ttl_seconds)}},
+            {"$set": {"last_used": now}, "$inc": {"hits": 1}},
+            projection={"_id": 0, "data": 1},
+        )
+        if doc is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        snippets = decompress_snippets(doc["data"])
+        with self._lock:
+            self._stats["db_hits"] += 1
+            self._remember(video_id, snippets)
+        return snippets
+
+    def put(self, video_id: str, snippets: Snippets):
+        data = compress_snippets(snippets)
+        now = datetime.now()
+        with self._lock:
+            self._remember(video_id, snippets)
+            self._stats["writes"] += 1
+            self._stats["raw_bytes_written"] += sum(len(snippet[2]) for snippet in snippets)
+            self._stats["stored_bytes_written"] += len(data)
+            self._writes_since_evict += 1
+            evict = self._writes_since_evict >= self.evict_every
+            if evict:
+                self._writes_since_evict = 0
+
+        self.collection.update_one(
+            {"video_id": video_id},
+            {"$set": {
+                "video_id": video_id,
+                "data": Binary(data),
+                "size": len(data),
+                "created_at": now,
+                "last_used": now,
+            }, "$setOnInsert": {"hits": 0}},
+            upsert=True,
+        )
+        if evict:
+            self.evict_overflow()
+
+    def fetch(self, video_id: str, loader: Callable[[str], Snippets]) -> Snippets:
+        """Snippets for a video from the cache, or from loader(video_id) (then cached)"""
+        start = time.perf_counter()
+        snippets = self.get(video_id)
+        if snippets is not None:
+            with self._lock:
+                self._stats["hit_seconds"] += time.perf_counter() - start
+            return snippets
+
+        try:
+            snippets = loader(video_id)
+        except Exception:
+            with self._lock:
+                self._stats["fetch_errors"] += 1
+            raise
+        self.put(video_id, snippets)
+        with self._lock:
+            self._stats["miss_seconds"] += time.perf_counter() - start
+        return snippets
+
+    def _remember(self, video_id, snippets):
+        """Caller must hold the lock"""
+        self._lru[video_id] = snippets
+        self._lru.move_to_end(video_id)
+        while len(self._lru) > self.memory_entries:
+            self._lru.popitem(last=False)
+
+    # ==================== EVICTION ====================
+
+    def stored_bytes(self) -> int:
+        totals = list(self.collection.aggregate([{"$group": {"_id": None, "bytes": {"$sum": "$size"}}}]))
+        return totals[0]["bytes"] if totals else 0
+
+    def evict_overflow(self) -> int:
+        """Delete least recently used transcripts until the collection fits max_bytes"""
+        overflow = self.stored_bytes() - self.max_bytes
+        if overflow <= 0:
+            return 0
+        stale = []
+        for doc in self.collection.find({}, {"_id": 1, "video_id": 1, "size": 1}).sort("last_used", ASCENDING):
+            stale.append(doc["_id"])
+            overflow -= doc["size"]
+            if overflow <= 0:
+                break
+        deleted = self.collection.delete_many({"_id": {"$in": stale}}).deleted_count
+        with self._lock:
+            self._stats["evicted"] += deleted
+        return deleted
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._lru)
+        hits = stats["memory_hits"] + stats["db_hits"]
+        stats["hit_ratio"] = round(hits / (hits + stats["misses"]), 4) if hits + stats["misses"] else 0.0
+        stats["avg_hit_ms"] = round(stats.pop("hit_seconds") / hits * 1000, 2) if hits else 0.0
+        misses = stats["misses"] - stats["fetch_errors"]
+        stats["avg_miss_ms"] = round(stats.pop("miss_seconds") / misses * 1000, 2) if misses > 0 else 0.0
+        raw = stats["raw_bytes_written"]
+        stats["compression_ratio"] = round(stats["stored_bytes_written"] / raw, 3) if raw else 0.0
+        return stats
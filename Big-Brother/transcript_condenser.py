@@ -0,0 +1,161 @@
+"""
+Transcript Condenser - A bounded, timestamped digest of a long video for the agent
+Responsibilities:
+1. Group transcript snippets into fixed time windows, streaming from the start
+2. Score each window cheaply against the monitoring prompt (its terms and keyword rules)
+3. Build a digest within a token budget that covers the whole video and favours the
+   most policy-relevant windows, each marked with its timestamp
+4. Stop reading as soon as a window trips a block keyword rule: that window alone
+   is evidence enough
+
+Joining a multi-hour transcript into one string put tens of thousands of tokens in
+front of the agent for a single tool call.
+"""
+
+import math
+import re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from content_reducer import estimate_tokens
+from rule_prescreen import ALLOW_VERBS, BLOCK_VERBS, FILLER_WORDS, CompiledRules
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_PROMPT_STOPWORDS = FILLER_WORDS | BLOCK_VERBS | ALLOW_VERBS | set(
+    "a an and are as at be but by content for from has have i in is it its my not of on or "
+    "our should that the their them they this to videos video with you your".split()
+)
+
+
+class TranscriptChunk:
+    """Snippets from one time window"""
+
+    def __init__(self, index: int, start: float, end: float, text: str):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.text = text
+        self.score = 0.0
+        self.rule = None  # Block rule this chunk tripped, if any
+
+
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def iter_chunks(snippets: Iterable[list], window_seconds: float = 60) -> Iterator[TranscriptChunk]:
+    """Consecutive window_seconds-long chunks of [start, duration, text] snippets"""
+    index = 0
+    texts = []
+    window_start = window_end = None
+    for start, duration, text in snippets:
+        if window_start is None:
+            window_start = start
+        elif start >= window_start + window_seconds:
+            yield TranscriptChunk(index, window_start, window_end, " ".join(texts))
+            index += 1
+            texts = []
+            window_start = start
+        texts.append(text.replace("\n", " "))
+        window_end = start + duration
+    if texts:
+        yield TranscriptChunk(index, window_start, window_end, " ".join(texts))
+
+
+def prompt_terms(monitoring_prompt: str) -> set:
+    """Content words of the monitoring prompt, the vocabulary chunks are scored on"""
+    return {word for word in _WORD_RE.findall((monitoring_prompt or "").lower())
+            if len(word) > 2 and word not in _PROMPT_STOPWORDS}
+
+
+def score_chunk(chunk: TranscriptChunk, terms: set, rules: Optional[CompiledRules]):
+    """Set chunk.score (prompt term density) and chunk.rule (a tripped block keyword)"""
+    text = chunk.text.lower()
+    words = _WORD_RE.findall(text)
+    if not words:
+        return
+    hits = sum(1 for word in words if word in terms)
+    chunk.score = hits / math.sqrt(len(words))
+    if rules is not None:
+        rule = rules.match("", text)
+        if rule is not None and rule.kind == "keyword":
+            chunk.score += 5.0
+            if rule.action == "block":
+                chunk.rule = rule
+
+
+def _trim(text: str, token_budget: float) -> str:
+    max_chars = int(token_budget * 4)
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + " …"
+
+
+def condense_transcript(snippets: List[list], monitoring_prompt: str = "", rules: Optional[CompiledRules] = None,
+                        token_budget: int = 1500, window_seconds: float = 60, segments: int = 6) -> Dict:
+    """
+    Digest of a transcript for the agent.
+
+    Returns:
+        dict: 'digest' (timestamped excerpts, in order), 'duration' (seconds),
+              'chunks_read', 'chunks_total', 'stopped_early' (bool) and 'flagged' (the
+              block rule and timestamp that stopped reading, or None)
+    """
+    terms = prompt_terms(monitoring_prompt)
+    duration = snippets[-1][0] + snippets[-1][1] if snippets else 0
+
+    chunks = []
+    flagged = None
+    for chunk in iter_chunks(snippets, window_seconds):
+        score_chunk(chunk, terms, rules)
+        chunks.append(chunk)
+        if chunk.rule is not None:
+            flagged = chunk
+            break
+
+    if flagged is not None:
+        # One clear violation settles the video; show it with the window before it for context
+        chosen = chunks[-2:]
+    elif estimate_tokens(" ".join(chunk.text for chunk in chunks)) <= token_budget:
+        chosen = chunks
+    else:
+        chosen = _select(chunks, token_budget, segments)
+
+    per_chunk = token_budget / max(1, len(chosen))
+    lines = []
+    previous = None
+    for chunk in sorted(chosen, key=lambda chunk: chunk.index):
+        if previous is not None and chunk.index != previous + 1:
+            lines.append("…")
+        lines.append(f"[{format_timestamp(chunk.start)}] {_trim(chunk.text, per_chunk)}")
+        previous = chunk.index
+
+    return {
+        "digest": "\n".join(lines),
+        "duration": round(duration),
+        "chunks_read": len(chunks),
+        # Unread windows are estimated from the remaining duration
+        "chunks_total": len(chunks) + (math.ceil((duration - flagged.end) / window_seconds) if flagged else 0),
+        "stopped_early": flagged is not None,
+        "flagged": {"rule": flagged.rule.source, "at": format_timestamp(flagged.start)} if flagged else None,
+    }
+
+
+def _select(chunks: List[TranscriptChunk], token_budget: int, segments: int) -> List[TranscriptChunk]:
+    """Best chunk of every segment of the video, then the best of the rest, within budget"""
+    segment_size = math.ceil(len(chunks) / segments)
+    chosen = {}
+    spent = 0
+    for start in range(0, len(chunks), segment_size):
+        best = max(chunks[start:start + segment_size], key=lambda chunk: chunk.score)
+        chosen[best.index] = best
+        spent += estimate_tokens(best.text)
+
+    for chunk in sorted(chunks, key=lambda chunk: -chunk.score):
+        if spent >= token_budget:
+            break
+        if chunk.index in chosen or chunk.score == 0:
+            continue
+        chosen[chunk.index] = chunk
+        spent += estimate_tokens(chunk.text)
+    return list(chosen.values())
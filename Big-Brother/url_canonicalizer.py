@@ -0,0 +1,256 @@
+"""
+URL Canonicalizer - One canonical key per page, so verdicts are reused across URL variants
+Responsibilities:
+1. Reduce URLs to a scheme-less canonical key (lowercase host, no 'www.', no fragment,
+   no trailing slash, no tracking parameters, sorted query)
+2. Apply per-site rules, e.g. YouTube links reduce to the video ID
+3. Track how much canonicalization raises the verdict hit ratio
+4. Migrate existing list, appeal and approval documents to canonical keys
+
+Per-site rules can be extended with a JSON file pointed to by URL_CANONICAL_RULES:
+{
+    "example.com": {"keep_params": ["id"]},        # Drop every other query parameter
+    "shop.example.org": {"drop_params": ["sort"]}  # Drop these on top of the tracking list
+}
+Rules apply to the host and all of its subdomains, the most specific host winning, except
+keep_params: it only applies to the host itself (and its 'm.' mobile host), so other
+subdomains (drive.google.com, music.youtube.com) keep their parameters less the tracking list.
+"""
+
+import fnmatch
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse, parse_qs, parse_qsl, urlencode
+
+from url_matcher import AI_REASONS
+
+# Query parameters that never change page content (glob patterns)
+TRACKING_PARAMS = [
+    "utm_*", "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid",
+    "mc_cid", "mc_eid", "igshid", "_ga", "_gl", "ref", "ref_src", "ref_url", "spm", "si",
+]
+
+DEFAULT_SITE_RULES = {
+    "youtube.com": {"handler": "youtube", "keep_params": ["search_query", "list"]},
+    "youtu.be": {"handler": "youtube"},
+    "google.com": {"keep_params": ["q", "tbm"]},
+    "bing.com": {"keep_params": ["q"]},
+    "duckduckgo.com": {"keep_params": ["q"]},
+}
+
+
+def extract_video_id(link: str) -> str:
+    if "youtu.be/" in link:
+        return link.split("youtu.be/")[-1].split("?")[0].split("&")[0]
+
+    # Pattern for youtube.com links
+    parsed_url = urlparse(link)
+    if parsed_url.hostname in ["www.youtube.com", "youtube.com", "m.youtube.com", "music.youtube.com"]:
+        if parsed_url.path == "/watch":
+            query_params = parse_qs(parsed_url.query)
+            return query_params.get("v", [None])[0]
+        elif parsed_url.path.startswith("/embed/"):
+            return parsed_url.path.split("/embed/")[-1].split("?")[0]
+        elif parsed_url.path.startswith("/v/"):
+            return parsed_url.path.split("/v/")[-1].split("?")[0]
+        elif parsed_url.path.startswith("/shorts/"):
+            return parsed_url.path.split("/shorts/")[-1].split("/")[0]
+
+    return None
+
+
+def _youtube_key(host, path, query):
+    """Watch pages, embeds, shorts and youtu.be links all reduce to youtube.com/watch?v=<id>"""
+    video_id = extract_video_id(f"https://{host}{path}" + (f"?{query}" if query else ""))
+    if video_id:
+        return f"youtube.com/watch?v={video_id}"
+    return None
+
+
+SITE_HANDLERS = {
+    "youtube": _youtube_key,
+}
+
+
+def load_site_rules() -> Dict[str, dict]:
+    """Default rules, overridden by the JSON file in URL_CANONICAL_RULES if set"""
+    rules = {host: dict(rule) for host, rule in DEFAULT_SITE_RULES.items()}
+    path = os.getenv("URL_CANONICAL_RULES")
+    if path:
+        try:
+            with open(path, "r") as f:
+                for host, rule in json.load(f).items():
+                    rules[host.lower()] = rule
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not load canonical URL rules from {path}: {e}")
+    return rules
+
+
+SITE_RULES = load_site_rules()
+
+
+def _site_rule(host: str) -> Optional[dict]:
+    """Most specific rule whose host is a suffix of this host (keep_params only on an exact or 'm.' match)"""
+    labels = host.split(".")
+    for i in range(len(labels) - 1):
+        rule = SITE_RULES.get(".".join(labels[i:]))
+        if rule is not None:
+            if i == 0 or (i == 1 and labels[0] == "m"):
+                return rule
+            return {name: value for name, value in rule.items() if name != "keep_params"}
+    return None
+
+
+def _is_dropped(name: str, rule: Optional[dict]) -> bool:
+    name = name.lower()
+    if rule and "keep_params" in rule:
+        return name not in rule["keep_params"]
+    patterns = TRACKING_PARAMS + ((rule or {}).get("drop_params") or [])
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def canonicalize_url(link: str) -> str:
+    """
+    Canonical list key for a URL or an existing list key
+
+    Idempotent: canonicalize_url(canonicalize_url(x)) == canonicalize_url(x).
+    Non-web URLs (chrome://, file://, ...) are returned unchanged.
+    """
+    link = (link or "").strip()
+    if not link:
+        return link
+    if "://" in link:
+        if not link.lower().startswith(("http://", "https://")):
+            return link
+    else:
+        link = "//" + link
+
+    parsed = urlparse(link)
+    host = (parsed.hostname or "").rstrip(".")
+    if not host:
+        return link.lstrip("/")
+    if host.startswith("www."):
+        host = host[4:]
+    try:
+        port = parsed.port
+    except ValueError:
+        port = None
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+
+    path = "/".join(segment for segment in parsed.path.split("/") if segment)
+    path = f"/{path}" if path else ""
+
+    rule = _site_rule(host.split(":")[0])
+    if rule and rule.get("handler") in SITE_HANDLERS:
+        key = SITE_HANDLERS[rule["handler"]](host, path, parsed.query)
+        if key:
+            return key
+
+    params = [(name, value) for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+              if not _is_dropped(name, rule)]
+    query = urlencode(sorted(params))
+    return host + path + (f"?{query}" if query else "")
+
+
+def canonical_domain(link: str) -> str:
+    """Canonical host of a URL (no 'www.', lowercase)"""
+    return canonicalize_url(link).split("/")[0].split("?")[0]
+
+
+# ==================== HIT RATIO METRICS ====================
+
+class CanonicalizationStats:
+    """Compares verdict hits for the raw URL against hits for its canonical key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "rewritten": 0, "raw_hits": 0, "canonical_hits": 0}
+
+    def record(self, raw_url: str, canonical: str, raw_hit: bool, canonical_hit: bool):
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._stats["rewritten"] += int(raw_url != canonical)
+            self._stats["raw_hits"] += int(raw_hit)
+            self._stats["canonical_hits"] += int(canonical_hit)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["lookups"] or 1
+        stats["raw_hit_ratio"] = round(stats["raw_hits"] / lookups, 4)
+        stats["canonical_hit_ratio"] = round(stats["canonical_hits"] / lookups, 4)
+        stats["hits_gained"] = stats["canonical_hits"] - stats["raw_hits"]
+        return stats
+
+
+# ==================== MIGRATION ====================
+
+def _keep_score(doc):
+    """Which of two colliding documents survives: parent-authored first, then the newest"""
+    return (doc.get("reason") not in AI_REASONS, doc.get("added_at") or datetime.min)
+
+
+def migrate_canonical_links(db, dry_run: bool = False) -> Dict[str, Dict[str, int]]:
+    """
+    Re-key existing documents to canonical links
+
+    Lists have a unique 'link' index, so when several documents collapse onto one
+    canonical key only the highest-ranked one is kept (see _keep_score).
+    """
+    report = {}
+    for name in ("whitelist", "blacklist"):
+        col = db[name]
+        groups = {}
+        for doc in col.find({}):
+            groups.setdefault(canonicalize_url(doc["link"]), []).append(doc)
+
+        rekeyed = merged = 0
+        for canonical, docs in groups.items():
+            docs.sort(key=_keep_score, reverse=True)
+            keeper, losers = docs[0], docs[1:]
+            if losers:
+                merged += len(losers)
+                if not dry_run:
+                    col.delete_many({"_id": {"$in": [doc["_id"] for doc in losers]}})
+            if keeper["link"] != canonical:
+                rekeyed += 1
+                if not dry_run:
+                    col.update_one({"_id": keeper["_id"]}, {"$set": {"link": canonical, "original_link": keeper["link"]}})
+        report[name] = {"documents": sum(len(docs) for docs in groups.values()), "rekeyed": rekeyed, "merged": merged}
+
+    # Appeals and approvals are not unique by link, so they are simply re-keyed
+    for name in ("appeals", "pending_approvals"):
+        col = db[name]
+        rekeyed = 0
+        for doc in col.find({"link": {"$exists": True}}, {"link": 1}):
+            canonical = canonicalize_url(doc["link"])
+            if canonical != doc["link"]:
+                rekeyed += 1
+                if not dry_run:
+                    col.update_one({"_id": doc["_id"]}, {"$set": {"link": canonical}})
+        report[name] = {"rekeyed": rekeyed}
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Canonicalize stored links")
+    parser.add_argument("--migrate", action="store_true", help="Re-key existing documents to canonical links")
+    parser.add_argument("--dry-run", action="store_true", help="Report what --migrate would change")
+    parser.add_argument("urls", nargs="*", help="URLs to canonicalize and print")
+    args = parser.parse_args()
+
+    for url in args.urls:
+        print(f"{url} -> {canonicalize_url(url)}")
+
+    if args.migrate:
+        from smart_db_manager import db
+
+        result = migrate_canonical_links(db, dry_run=args.dry_run)
+        for collection, counts in result.items():
+            print(f"{collection}: {counts}")
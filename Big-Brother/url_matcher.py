@@ -0,0 +1,262 @@
+"""
+URL Matcher - Hierarchical host-suffix / path-prefix index over the URL lists
+Responsibilities:
+1. Index whitelist and blacklist rules in a reversed-label host trie with path-prefix nodes
+2. Resolve the single winning rule for a URL in one walk, independent of list size
+3. Apply explicit precedence between overlapping whitelist and blacklist rules
+
+Rule semantics:
+- 'example.com' matches example.com and every subdomain (m.example.com, a.b.example.com)
+- 'reddit.com/r/foo' matches that path and everything below it (/r/foo/comments/...),
+  but not /r/foobar
+- A rule with a query string ('youtube.com/watch?v=abc') only matches that exact path and query
+- Automatic verdicts (AI_REASONS) only match the exact host, path and query they were made
+  for: an allow of a site's home page says nothing about the rest of the site
+
+Precedence (first difference decides):
+1. Authority - rules set by the parent outrank AI-generated rules, so the AI can never
+   override a parent decision
+2. Specificity - more host labels, then more path segments, then an exact query match
+3. Action - on a full tie the blacklist wins (fail closed)
+"""
+
+import threading
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# 'reason' values written automatically (agent, prompt rules, classifier) rather than by the parent
+AI_REASONS = ("AI Analysis", "Appeal auto-approved", "Rule pre-screen", "Local classifier")
+
+# Within the same authority and specificity a block beats an allow
+ACTION_RANK = {"whitelist": 0, "blacklist": 1}
+
+
+def split_url(link: str) -> Tuple[List[str], List[str], str]:
+    """
+    Split a URL or list key into (reversed host labels, path segments, query)
+
+    Accepts both full URLs and the scheme-less keys stored in the lists.
+    """
+    link = (link or "").strip()
+    if "://" not in link:
+        link = "//" + link
+    parsed = urlparse(link)
+    host = (parsed.hostname or "").rstrip(".")
+    labels = [label for label in reversed(host.split(".")) if label]
+    segments = [segment for segment in parsed.path.split("/") if segment]
+    return labels, segments, parsed.query
+
+
+class Match:
+    """The rule that decided a lookup"""
+
+    __slots__ = ("list_name", "key", "entry", "specificity", "authority")
+
+    def __init__(self, list_name, key, entry, specificity, authority):
+        self.list_name = list_name
+        self.key = key
+        self.entry = entry
+        self.specificity = specificity
+        self.authority = authority
+
+    @property
+    def rank(self):
+        return (self.authority, self.specificity, ACTION_RANK[self.list_name])
+
+    def __repr__(self):
+        return f"Match({self.list_name}, {self.key!r}, specificity={self.specificity})"
+
+
+class _PathNode:
+    __slots__ = ("children", "rule", "query_rules")
+
+    def __init__(self):
+        self.children: Dict[str, "_PathNode"] = {}
+        self.rule = None            # (key, entry) for a path-prefix rule ending here
+        self.query_rules = {}       # query string -> (key, entry)
+
+
+class _HostNode:
+    __slots__ = ("children", "paths")
+
+    def __init__(self):
+        self.children: Dict[str, "_HostNode"] = {}
+        self.paths: Optional[_PathNode] = None  # Root of the path trie for rules on this exact host
+
+
+class UrlMatcher:
+    """Index over the whitelist and blacklist rules for hierarchical lookups"""
+
+    def __init__(self):
+        self._roots = {name: _HostNode() for name in ACTION_RANK}
+        self._sizes = {name: 0 for name in ACTION_RANK}
+        self._lock = threading.Lock()
+
+    # ==================== MAINTENANCE ====================
+
+    def add(self, list_name: str, key: str, entry: dict):
+        with self._lock:
+            if _insert(self._roots[list_name], key, entry):
+                self._sizes[list_name] += 1
+
+    def remove(self, list_name: str, key: str):
+        with self._lock:
+            if _delete(self._roots[list_name], key):
+                self._sizes[list_name] -= 1
+
+    def reset(self, list_name: str, entries: Dict[str, dict]):
+        """Rebuild one list's trie from a full snapshot and swap it in"""
+        root = _HostNode()
+        size = sum(1 for key, entry in entries.items() if _insert(root, key, entry))
+        with self._lock:
+            self._roots[list_name] = root
+            self._sizes[list_name] = size
+
+    def attach(self, list_name: str, replica):
+        """Keep this list's trie in step with a ListReplica"""
+        replica.add_listener(
+            on_put=lambda key, entry: self.add(list_name, key, entry),
+            on_discard=lambda key: self.remove(list_name, key),
+            on_reset=lambda entries: self.reset(list_name, entries),
+        )
+
+    # ==================== LOOKUP ====================
+
+    def match(self, link: str) -> Optional[Match]:
+        """Return the winning rule for a URL, or None if no rule applies"""
+        labels, segments, query = split_url(link)
+        best = None
+        for list_name, root in self._roots.items():
+            for candidate in _candidates(root, labels, segments, query):
+                key, entry, specificity = candidate
+                match = Match(list_name, key, entry, specificity, _authority(entry))
+                if best is None or match.rank > best.rank:
+                    best = match
+        return best
+
+    def sizes(self) -> Dict[str, int]:
+        return dict(self._sizes)
+
+
+def _authority(entry: dict) -> int:
+    return 0 if entry.get("reason") in AI_REASONS else 1
+
+
+def _insert(root: _HostNode, key: str, entry: dict) -> bool:
+    """Add a rule. Returns True if it was new."""
+    labels, segments, query = split_url(key)
+    if not labels:
+        return False
+    node = root
+    for label in labels:
+        node = node.children.setdefault(label, _HostNode())
+    if node.paths is None:
+        node.paths = _PathNode()
+    path_node = node.paths
+    for segment in segments:
+        path_node = path_node.children.setdefault(segment, _PathNode())
+    if query:
+        is_new = query not in path_node.query_rules
+        path_node.query_rules[query] = (key, entry)
+    else:
+        is_new = path_node.rule is None
+        path_node.rule = (key, entry)
+    return is_new
+
+
+def _delete(root: _HostNode, key: str) -> bool:
+    """Remove a rule. Returns True if it existed. Empty nodes are left in place."""
+    labels, segments, query = split_url(key)
+    node = root
+    for label in labels:
+        node = node.children.get(label)
+        if node is None:
+            return False
+    path_node = node.paths
+    if path_node is None:
+        return False
+    for segment in segments:
+        path_node = path_node.children.get(segment)
+        if path_node is None:
+            return False
+    if query:
+        return path_node.query_rules.pop(query, None) is not None
+    if path_node.rule is None:
+        return False
+    path_node.rule = None
+    return True
+
+
+def _applies(rule, exact: bool) -> bool:
+    """Parent rules cover subdomains and subpaths; automatic verdicts only their own page"""
+    return exact or _authority(rule[1]) == 1
+
+
+def _candidates(root: _HostNode, labels, segments, query):
+    """Yield (key, entry, specificity) for every rule that covers the URL"""
+    node = root
+    for host_depth, label in enumerate(labels, start=1):
+        node = node.children.get(label)
+        if node is None:
+            return
+        path_node = node.paths
+        if path_node is None:
+            continue
+        exact_host = host_depth == len(labels)
+        if path_node.rule is not None and _applies(path_node.rule, exact_host and not segments and not query):
+            yield path_node.rule + ((host_depth, 0, 0),)
+        for path_depth, segment in enumerate(segments, start=1):
+            path_node = path_node.children.get(segment)
+            if path_node is None:
+                break
+            exact = exact_host and path_depth == len(segments) and not query
+            if path_node.rule is not None and _applies(path_node.rule, exact):
+                yield path_node.rule + ((host_depth, path_depth, 0),)
+        else:
+            # The whole path matched, so exact path+query rules can apply
+            if query and query in path_node.query_rules and _applies(path_node.query_rules[query], exact_host):
+                yield path_node.query_rules[query] + ((host_depth, len(segments), 1),)
+
+
+def _benchmark():
+    """Show that lookup cost stays flat as the lists grow"""
+    import random
+    import string
+    import time
+
+    rng = random.Random(42)
+    tlds = ["com", "org", "net", "io", "co.uk", "edu"]
+
+    def word(n=8):
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, n)))
+
+    def rule():
+        host = f"{word()}.{rng.choice(tlds)}"
+        if rng.random() < 0.3:
+            host = f"{word(4)}.{host}"
+        if rng.random() < 0.4:
+            host += "/" + "/".join(word() for _ in range(rng.randint(1, 3)))
+        return host
+
+    print(f"{'rules':>10} {'build s':>9} {'hit us':>9} {'miss us':>9}")
+    for size in (1_000, 10_000, 100_000, 300_000):
+        keys = [rule() for _ in range(size)]
+        matcher = UrlMatcher()
+        start = time.perf_counter()
+        matcher.reset("blacklist", {key: {"link": key, "reason": "AI Analysis"} for key in keys[::2]})
+        matcher.reset("whitelist", {key: {"link": key, "reason": "Parent added"} for key in keys[1::2]})
+        build = time.perf_counter() - start
+
+        hits = [f"https://m.{rng.choice(keys)}/{word()}/{word()}?q=1" for _ in range(20_000)]
+        misses = [f"https://www.{word()}.{rng.choice(tlds)}/{word()}/{word()}" for _ in range(20_000)]
+        timings = []
+        for urls in (hits, misses):
+            start = time.perf_counter()
+            for url in urls:
+                matcher.match(url)
+            timings.append((time.perf_counter() - start) / len(urls) * 1e6)
+        print(f"{size:>10,} {build:>9.2f} {timings[0]:>9.2f} {timings[1]:>9.2f}")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,156 @@
+"""
+Verdict Cache - Exact-content verdict cache, independent of the URL
+Responsibilities:
+1. Key verdicts on a hash of the normalized title and content plus the monitoring prompt
+2. Answer repeats from an in-process LRU, falling back to a dedicated Mongo collection
+3. Bound the collection by age (TTL index) and by size (least recently used evicted first)
+4. Drop entries written under an old monitoring prompt
+
+Session IDs, A/B paths and short links put the same page body behind endless URLs;
+each variant after the first is answered without an agent run.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from pymongo import ASCENDING
+
+from content_fingerprint import prompt_fingerprint
+
+
+# Bodies shorter than this ("Loading…", a bare video player) say nothing about the page
+MIN_CACHEABLE_CHARS = 200
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def content_cache_key(title: str, content: str, monitoring_prompt: str) -> Optional[str]:
+    """
+    '<prompt hash>:<content hash>' for a page under the given monitoring prompt, or None
+    when the body is too short to identify the page
+    """
+    body = _normalize(content)
+    if len(body) < MIN_CACHEABLE_CHARS:
+        return None
+    digest = hashlib.sha256(f"{_normalize(title)}\n{body}".encode("utf-8")).hexdigest()
+    return f"{prompt_fingerprint(monitoring_prompt)}:{digest}"
+
+
+class VerdictCache:
+    """Two-level (LRU over Mongo) cache of verdicts by content key"""
+
+    def __init__(self, collection, max_entries: int = 50_000, ttl_seconds: int = 7 * 24 * 3600,
+                 lru_size: int = 2048, evict_every: int = 500):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lru_size = lru_size
+        self.evict_every = evict_every
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self._stats = {"lru_hits": 0, "db_hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+
+    def ensure_indexes(self):
+        self.collection.create_index([("key", ASCENDING)], unique=True)
+        self.collection.create_index([("created_at", ASCENDING)], expireAfterSeconds=self.ttl_seconds)
+        self.collection.create_index([("last_used", ASCENDING)])
+        self.collection.create_index([("prompt_hash", ASCENDING)])
+
+    # ==================== LOOKUP ====================
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Cached verdict for a content key, or None"""
+        now = datetime.now()
+        with self._lock:
+            cached = self._lru.get(key)
+            if cached is not None:
+                verdict, expires_at = cached
+                if expires_at > now:
+                    self._lru.move_to_end(key)
+                    self._stats["lru_hits"] += 1
+                    return verdict
+                del self._lru[key]
+
+        doc = self.collection.find_one_and_update(
+            {"key": key, "created_at": {"$gt": now - timedelta(seconds=self.ttl_seconds)}},
+            {"$set": {"last_used": now}, "$inc": {"hits": 1}},
+            projection={"_id": 0, "verdict": 1, "created_at": 1},
+        )
+        with self._lock:
+            if doc is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["db_hits"] += 1
+            self._remember(key, doc["verdict"], doc["created_at"] + timedelta(seconds=self.ttl_seconds))
+        return doc["verdict"]
+
+    def put(self, key: str, verdict: Dict):
+        """Store a verdict (action, reasoning, parental_reasoning, fingerprint) for a content key"""
+        now = datetime.now()
+        with self._lock:
+            self._remember(key, verdict, now + timedelta(seconds=self.ttl_seconds))
+            self._stats["writes"] += 1
+            self._writes_since_evict += 1
+            evict = self._writes_since_evict >= self.evict_every
+            if evict:
+                self._writes_since_evict = 0
+
+        self.collection.update_one(
+            {"key": key},
+            {"$set": {
+                "key": key,
+                "prompt_hash": key.split(":", 1)[0],
+                "verdict": verdict,
+                "created_at": now,
+                "last_used": now,
+            }, "$setOnInsert": {"hits": 0}},
+            upsert=True,
+        )
+        if evict:
+            self.evict_overflow()
+
+    def _remember(self, key, verdict, expires_at):
+        """Caller must hold the lock"""
+        self._lru[key] = (verdict, expires_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    # ==================== EVICTION ====================
+
+    def evict_overflow(self) -> int:
+        """Delete the least recently used documents beyond max_entries"""
+        overflow = self.collection.estimated_document_count() - self.max_entries
+        if overflow <= 0:
+            return 0
+        stale = [doc["_id"] for doc in
+                 self.collection.find({}, {"_id": 1}).sort("last_used", ASCENDING).limit(overflow)]
+        deleted = self.collection.delete_many({"_id": {"$in": stale}}).deleted_count
+        with self._lock:
+            self._stats["evicted"] += deleted
+        return deleted
+
+    def retain_prompt(self, monitoring_prompt: str) -> int:
+        """Drop verdicts made under any other monitoring prompt"""
+        prompt_hash = prompt_fingerprint(monitoring_prompt)
+        with self._lock:
+            for key in [key for key in self._lru if not key.startswith(prompt_hash + ":")]:
+                del self._lru[key]
+        deleted = self.collection.delete_many({"prompt_hash": {"$ne": prompt_hash}}).deleted_count
+        with self._lock:
+            self._stats["evicted"] += deleted
+        return deleted
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["lru_entries"] = len(self._lru)
+        lookups = stats["lru_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["lru_hits"] + stats["db_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
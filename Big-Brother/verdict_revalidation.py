@@ -0,0 +1,102 @@
+"""
+Verdict Revalidation - Background re-scoring of verdicts made under an older monitoring prompt
+Responsibilities:
+1. Collect stale list verdicts as the child visits them, with the page as last seen
+2. Re-score them on the LLM runtime loop, most visited first, a few at a time
+3. Report how many stale verdicts were served, re-scored and overturned
+
+A prompt change used to delete every automatic verdict, so each page visited right
+after it became a cold agent call. Stale verdicts now stay in the lists, stamped with
+the prompt hash they were made under, and are replaced here as they come up.
+"""
+
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Optional
+
+import llm_runtime
+
+
+class Revalidator:
+    """Pending stale verdicts by link, drained by a small pool of workers, most visited first"""
+
+    def __init__(self, workers: int = 1, max_pending: int = 256):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending: Dict[str, list] = {}  # link -> [visits, page]
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._started = False
+        self._stats = {"served_stale": 0, "rescored": 0, "overturned": 0, "dropped": 0, "errors": 0}
+
+    def start(self, rescore: Callable[..., Awaitable[Optional[str]]]):
+        """
+        Spawn the workers on the LLM runtime loop. rescore(link, *page) re-decides one
+        link and returns the new action.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        loop = llm_runtime.get_loop()
+
+        def spawn():
+            self._wakeup = asyncio.Event()
+            for _ in range(self.workers):
+                loop.create_task(self._worker(rescore))
+            if self._pending:
+                self._wakeup.set()
+
+        ready = threading.Event()
+        loop.call_soon_threadsafe(lambda: (spawn(), ready.set()))
+        ready.wait()
+
+    def submit(self, link: str, stale_action: str, *page):
+        """Record a visit to a link whose stale verdict was just served (thread-safe)"""
+        with self._lock:
+            self._stats["served_stale"] += 1
+            pending = self._pending.get(link)
+            if pending is not None:
+                pending[0] += 1
+                pending[1] = (stale_action, page)
+            else:
+                if len(self._pending) >= self.max_pending:
+                    # Make room by forgetting the least visited link; it is queued again on its next visit
+                    coldest = min(self._pending, key=lambda key: self._pending[key][0])
+                    del self._pending[coldest]
+                    self._stats["dropped"] += 1
+                self._pending[link] = [1, (stale_action, page)]
+        if self._wakeup is not None:
+            llm_runtime.get_loop().call_soon_threadsafe(self._wakeup.set)
+
+    def _pop(self):
+        with self._lock:
+            if not self._pending:
+                return None
+            link = max(self._pending, key=lambda key: self._pending[key][0])
+            return link, self._pending.pop(link)[1]
+
+    async def _worker(self, rescore):
+        while True:
+            await self._wakeup.wait()
+            item = self._pop()
+            if item is None:
+                self._wakeup.clear()
+                continue
+            link, (stale_action, page) = item
+            try:
+                action = await rescore(link, *page)
+            except Exception as e:
+                print(f"Revalidation of {link} failed: {e}", flush=True)
+                with self._lock:
+                    self._stats["errors"] += 1
+                continue
+            with self._lock:
+                self._stats["rescored"] += 1
+                self._stats["overturned"] += action is not None and action != stale_action
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        return stats
@@ -2,6 +2,9 @@
 
 import { Readability } from "@mozilla/readability";
 
+// The server only reads this much of a page, so don't upload more
+const MAX_CONTENT_CHARS = 300000;
+
 showLoadingScreen();
 
 if (document.readyState === "loading") {
@@ -84,34 +87,23 @@ function extractAndSend() {
   const pageData = {
     url: window.location.href,
     title: document.title,
-    content: article ? article.textContent : document.body.innerText,
+    content: (article ? article.textContent : document.body.innerText).slice(0, MAX_CONTENT_CHARS),
     timestamp: Date.now(),
   };
 
+  // async: true asks the server for a ticket instead of holding the request open
   fetch("http://localhost:5000/analyze", {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify(pageData),
+    body: JSON.stringify({ ...pageData, async: true }),
   })
-    .then((response) => response.json())
-    .then((data) => {
-      console.log("Analysis result:", data);
-
-      if (data.action === 'block') {
-        // Check if appeals haven't been used yet (max 1 appeal)
-        const canAppeal = (data.appeals_used || 0) < 1;
-
-        // Use "reasoning" (child-safe) instead of "reason" or "parental_reasoning"
-        const displayReason = data.reasoning || data.reason || "This content has been blocked.";
-
-        if (canAppeal) {
-          showBlockPageWithAppeal(displayReason, data.appeals_used || 0);
-        } else {
-          blockPage(displayReason);
-        }
+    .then((response) => response.json().then((data) => ({ status: response.status, data })))
+    .then(({ status, data }) => {
+      if (status === 202 && data.ticket) {
+        // Verdict not cached yet - wait for it on the ticket's event stream
+        waitForAnalysisResult(data.events_url);
       } else {
-        // Allowed - remove loading screen
-        removeLoadingScreen();
+        handleAnalysisResult(data);
       }
     })
     .catch((error) => {
@@ -120,6 +112,82 @@ function extractAndSend() {
     });
 }
 
+function waitForAnalysisResult(eventsUrl) {
+  const events = new EventSource("http://localhost:5000" + eventsUrl);
+
+  events.addEventListener("result", (event) => {
+    events.close();
+    handleAnalysisResult(JSON.parse(event.data).result);
+  });
+
+  events.addEventListener("error", (event) => {
+    events.close();
+    // A server-side failure carries data; a dropped connection does not
+    console.error("Analysis stream failed:", event.data || "connection lost");
+    blockPage("Error analyzing content. Please try again later.");
+  });
+}
+
+function handleAnalysisResult(data) {
+  console.log("Analysis result:", data);
+
+  if (data.action === 'block') {
+    // Check if appeals haven't been used yet (max 1 appeal)
+    const canAppeal = (data.appeals_used || 0) < 1;
+
+    // Use "reasoning" (child-safe) instead of "reason" or "parental_reasoning"
+    const displayReason = data.reasoning || data.reason || "This content has been blocked.";
+
+    if (canAppeal) {
+      showBlockPageWithAppeal(displayReason, data.appeals_used || 0);
+    } else {
+      blockPage(displayReason);
+    }
+  } else {
+    // Allowed - remove loading screen
+    removeLoadingScreen();
+    prefetchOutboundLinks();
+  }
+}
+
+// Warm verdicts for the links on an allowed page, so the next click is answered from the lists.
+// The server caps how many of them it actually analyzes and runs them behind interactive traffic.
+const MAX_PREFETCH_LINKS = 20;
+
+function prefetchOutboundLinks() {
+  const current = window.location.href.split("#")[0];
+  const seen = new Set();
+  const items = [];
+
+  for (const anchor of document.querySelectorAll("a[href]")) {
+    const url = anchor.href.split("#")[0];
+    if (!url.startsWith("http") || url === current || seen.has(url)) {
+      continue;
+    }
+    seen.add(url);
+    items.push({ url, title: (anchor.textContent || "").trim().slice(0, 200) });
+    if (items.length >= MAX_PREFETCH_LINKS) {
+      break;
+    }
+  }
+
+  if (items.length === 0) {
+    return;
+  }
+
+  fetch("http://localhost:5000/analyze/batch", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ items }),
+  })
+    .then((response) => response.text())
+    .then((body) => {
+      const lines = body.trim().split("\n");
+      console.log("Prefetch summary:", lines[lines.length - 1]);
+    })
+    .catch((error) => console.warn("Prefetch failed:", error));
+}
+
 function showBlockPageWithAppeal(reason, appealsUsed = 0) {
   console.log('showBlockPageWithAppeal called with reason:', reason, 'appealsUsed:', appealsUsed);
 
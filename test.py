@@ -1,6 +1,6 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient
 import openai
 import os
 from datetime import datetime
@@ -26,10 +26,6 @@ logs_col = db['logs']
 config_col = db['config']  # NEW: Store parent's monitoring preferences
 desktop_events_col = db['desktop_events']  # NEW: Desktop monitoring logs
 
-# Create indexes
-appeals_col.create_index([('url', ASCENDING)])
-pending_approvals_col.create_index([('approval_id', ASCENDING)], unique=True)
-
 # Gmail agent
 gmail_agent = GmailAgent()
 